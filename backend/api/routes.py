@@ -1,21 +1,82 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 from datetime import datetime
 import asyncio
+import json
+import re
 from typing import Dict, Any
 
 from models.schemas import (
     CFGGenerationRequest, CFGGenerationResponse, ErrorResponse,
+    CFGBatchRequest, CFGBatchItemResult, CFGBatchResponse, JobStatusResponse,
     ModelConfigRequest, ModelConfigResponse, HealthResponse,
     SupportedLanguagesResponse, SupportedModelsResponse,
-    LanguageEnum, ModelEnum, ClientEnum
+    LanguageEnum, ModelEnum, ClientEnum, GenerationModeEnum
 )
 from services.cfg_service import cfg_service
+from services.job_queue import job_queue
+from services.artifact_store import artifact_store
+from services.graph_store import graph_store, GRAPH_FORMATS
+from services.renderer import RenderError
+from core.http_cache import conditional_json, not_modified, IMMUTABLE_CACHE_CONTROL
 from core.config import settings
+from util.prompt_registry import prompt_registry
+from util.rate_limit import provider_guards
+from util.LLM_util import current_cassette
 
 # CFG生成相关路由
 cfg_router = APIRouter()
 
+# 流式接口的心跳间隔（秒），防止单个阶段耗时较长时被代理断开
+SSE_HEARTBEAT_INTERVAL = 15.0
+
+def validate_generation_request(request: CFGGenerationRequest):
+    """
+    验证生成请求
+    """
+    if not request.code.strip():
+        raise HTTPException(status_code=400, detail="代码内容不能为空")
+    
+    if request.language not in [lang.value for lang in LanguageEnum]:
+        raise HTTPException(status_code=400, detail=f"不支持的编程语言: {request.language}")
+    
+    if request.model_name not in [model.value for model in ModelEnum]:
+        raise HTTPException(status_code=400, detail=f"不支持的模型: {request.model_name}")
+    
+    if request.mode == GenerationModeEnum.LOCAL and request.language != LanguageEnum.PYTHON:
+        raise HTTPException(status_code=400, detail="本地分析模式只支持Python代码")
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    格式化为一条Server-Sent Events消息
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def sse_stream(queue: asyncio.Queue, producer):
+    """
+    在后台执行producer，把它放入queue的 (事件名称, 数据) 逐条转成SSE消息，遇到 done 或 error 时结束；
+    等待期间定时发送心跳，客户端断开时取消producer
+    """
+    task = asyncio.create_task(producer)
+    try:
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if task.done() and queue.empty():
+                    # producer异常退出，没有放入结束事件
+                    error = task.exception()
+                    yield format_sse("error", {"success": False, "message": f"服务器内部错误: {error}"})
+                    break
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event, data)
+            if event in ("done", "error"):
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+
 @cfg_router.post("/generate", response_model=CFGGenerationResponse)
 async def generate_cfg(request: CFGGenerationRequest):
     """
@@ -23,20 +84,15 @@ async def generate_cfg(request: CFGGenerationRequest):
     """
     try:
         # 验证输入
-        if not request.code.strip():
-            raise HTTPException(status_code=400, detail="代码内容不能为空")
-        
-        if request.language not in [lang.value for lang in LanguageEnum]:
-            raise HTTPException(status_code=400, detail=f"不支持的编程语言: {request.language}")
-        
-        if request.model_name not in [model.value for model in ModelEnum]:
-            raise HTTPException(status_code=400, detail=f"不支持的模型: {request.model_name}")
+        validate_generation_request(request)
         
         # 调用CFG生成服务
         result = await cfg_service.generate_cfg(request)
         
         if result["success"]:
             return CFGGenerationResponse(**result)
+        elif result.get("invalid_input"):
+            raise HTTPException(status_code=400, detail=result["message"])
         else:
             raise HTTPException(status_code=500, detail=result["message"])
             
@@ -45,6 +101,145 @@ async def generate_cfg(request: CFGGenerationRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
+@cfg_router.post("/generate/stream")
+async def generate_cfg_stream(request: CFGGenerationRequest):
+    """
+    流式生成控制流图（Server-Sent Events）
+    每个阶段完成后立即推送：stage（各阶段输出，subgraph阶段附带局部图形数据）、graph（融合后的图形数据）、
+    image（图片URL和图的ID），最后以 done（完整结果，与 /generate 的响应相同）或 error 结束；客户端断开时取消生成
+    """
+    validate_generation_request(request)
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def on_event(event: str, data: Dict[str, Any]):
+        await queue.put((event, data))
+    
+    async def run():
+        try:
+            result = await cfg_service.generate_cfg(request, on_event=on_event)
+        except Exception as e:
+            result = {"success": False, "message": f"服务器内部错误: {str(e)}"}
+        if result["success"]:
+            await queue.put(("done", CFGGenerationResponse(**result).model_dump()))
+        else:
+            await queue.put(("error", result))
+    
+    return StreamingResponse(
+        sse_stream(queue, run()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def validate_batch_request(request: CFGBatchRequest):
+    """
+    验证批量生成请求
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"批量生成最多支持 {settings.BATCH_MAX_ITEMS} 个条目")
+    for index, item in enumerate(request.items):
+        try:
+            validate_generation_request(item)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"第 {index} 个条目: {e.detail}")
+
+@cfg_router.post("/generate/batch", response_model=CFGBatchResponse)
+async def generate_cfg_batch(request: CFGBatchRequest):
+    """
+    批量生成控制流图
+    相同的条目只生成一次，其余条目在并发上限内同时执行，返回按请求顺序排列的各条目结果
+    """
+    validate_batch_request(request)
+    result = await cfg_service.generate_batch(request.items, request.concurrency)
+    return CFGBatchResponse(**result)
+
+@cfg_router.post("/generate/batch/stream")
+async def generate_cfg_batch_stream(request: CFGBatchRequest):
+    """
+    流式批量生成控制流图（Server-Sent Events）
+    每个条目完成时推送一条 item 事件（按完成顺序，index 为条目位置），最后以 done（汇总信息）结束
+    """
+    validate_batch_request(request)
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def on_result(result: Dict[str, Any]):
+        await queue.put(("item", CFGBatchItemResult(**result).model_dump()))
+    
+    async def run():
+        result = await cfg_service.generate_batch(request.items, request.concurrency, on_result=on_result)
+        await queue.put(("done", {key: value for key, value in result.items() if key != "results"}))
+    
+    return StreamingResponse(
+        sse_stream(queue, run()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def job_response(job: Dict[str, Any]) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job["id"],
+        status=job["status"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+        result=job["result"],
+        error=job["error"]
+    )
+
+@cfg_router.post("/jobs", response_model=JobStatusResponse, status_code=202)
+async def submit_cfg_job(request: CFGGenerationRequest):
+    """
+    提交异步生成任务，立即返回任务ID，之后通过 GET /jobs/{job_id} 查询状态和结果
+    """
+    validate_generation_request(request)
+    return job_response(job_queue.submit(request))
+
+@cfg_router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_cfg_job(job_id: str, request: Request):
+    """
+    查询任务状态，任务结束后包含生成结果
+    响应带有ETag，轮询时状态没有变化（If-None-Match 匹配）返回304，不再重复传输结果
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return conditional_json(request, job_response(job))
+
+@cfg_router.post("/jobs/{job_id}/cancel", response_model=JobStatusResponse)
+async def cancel_cfg_job(job_id: str):
+    """
+    取消排队中或执行中的任务
+    """
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job_response(job)
+
+# 图的ID是内容哈希，同一个ID各格式的内容不会变化，可以长期缓存
+GRAPH_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+@cfg_router.get("/graphs/{graph_id}.{fmt}")
+async def get_graph(graph_id: str, fmt: str, request: Request):
+    """
+    获取生成结果的图（png/svg/dot/json）
+    png/svg在第一次请求时才调用dot渲染，之后直接返回保存的图片；dot/json由图的IR直接生成，不需要布局
+    """
+    if fmt not in GRAPH_FORMATS or not GRAPH_ID_PATTERN.match(graph_id):
+        raise HTTPException(status_code=404, detail="图不存在")
+    etag = f'"{graph_id}.{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    cached = not_modified(request, etag, headers) if graph_store.contains(graph_id) else None
+    if cached is not None:
+        return cached
+    try:
+        item = await graph_store.get(graph_id, fmt)
+    except RenderError as e:
+        raise HTTPException(status_code=500, detail=f"图片生成失败: {str(e)}")
+    if item is None:
+        raise HTTPException(status_code=404, detail="图不存在")
+    if "path" in item:
+        return FileResponse(item["path"], media_type=GRAPH_FORMATS[fmt], headers=headers)
+    return Response(item["content"], media_type=GRAPH_FORMATS[fmt], headers=headers)
+
 @cfg_router.get("/languages", response_model=SupportedLanguagesResponse)
 async def get_supported_languages():
     """
@@ -63,6 +258,14 @@ async def get_cfg_status():
         "service": "CFG Generation",
         "status": "running",
         "supported_languages": [lang.value for lang in LanguageEnum],
+        "cache": cfg_service.cache_stats(),
+        "artifacts": artifact_store.stats(),
+        "graphs": graph_store.stats(),
+        "prompts": prompt_registry.stats(),
+        "jobs": job_queue.stats(),
+        "singleflight": cfg_service.flight_stats(),
+        "llm": provider_guards.stats(),
+        "cassette": current_cassette().stats() if current_cassette() is not None else None,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -143,7 +346,7 @@ async def test_model(model_name: str, client_name: str = "openai", api_key: str
         
         # 发送一个简单的测试请求
         test_prompt = "Hello, this is a test message. Please respond with 'OK'."
-        response = llm_client.call_LLM(test_prompt)
+        response = await llm_client.call_LLM(test_prompt)
         
         if response and "OK" in response:
             return {
@@ -0,0 +1,114 @@
+"""
+响应压缩：客户端支持时，超过大小阈值的JSON/文本响应用brotli（安装了brotli包时）或gzip压缩
+流式响应（SSE事件流、分块发送的文件）不压缩，避免事件被压缩缓冲区延迟
+"""
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli是可选依赖，没有时只使用gzip
+    brotli = None
+
+# 值得压缩的内容类型（PNG等图片本身已压缩）
+COMPRESSIBLE_TYPES = ("application/json", "text/", "image/svg+xml")
+UNCOMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    按 Accept-Encoding 选择压缩方式，优先brotli
+    :return: "br"、"gzip" 或 None（不压缩）
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(UNCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """压缩一次性发送的响应体的ASGI中间件"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        """
+        :param minimum_size: 小于该字节数的响应不压缩（压缩收益抵不上开销）
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # 等到第一段响应体再决定是否压缩
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            passthrough = True
+            headers = MutableHeaders(raw=list(start_message.get("headers", [])))
+            start_message["headers"] = headers.raw
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if compressible(content_type):
+                headers.add_vary_header("Accept-Encoding")
+            if (message.get("more_body", False) or "content-encoding" in headers
+                    or not compressible(content_type) or len(body) < self.minimum_size):
+                await send(start_message)
+                await send(message)
+                return
+
+            body = self.compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # 压缩后的字节与原响应不同，只能作为弱ETag
+                headers["ETag"] = "W/" + etag
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
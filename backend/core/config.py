@@ -1,7 +1,11 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 
+# backend目录：配置中的相对路径按它解析，与启动时的工作目录无关
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
 class Settings(BaseSettings):
     # 服务器配置
     HOST: str = "0.0.0.0"
@@ -26,10 +30,60 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     UPLOAD_DIR: str = "uploads"
     STATIC_DIR: str = "static"
+    ARTIFACT_MAX_BYTES: int = 512 * 1024 * 1024  # 静态目录中生成图片的总大小上限，超过时删除最久未访问的图片
+    ARTIFACT_TTL: int = 7 * 24 * 3600  # 图片多久未被访问后删除（秒）
     
     # CFG生成配置
     SUPPORTED_LANGUAGES: List[str] = ["Python", "Java", "C"]
     DEFAULT_TEMPERATURE: float = 0.0
+    MAX_CONCURRENT_GENERATIONS: int = 16  # 同时进行的CFG生成数量上限
+    CFG_WORKER_THREADS: int = 4  # 执行写文件等阻塞操作的线程数
+    PROVIDER_MAX_CONCURRENCY: Dict[str, int] = {"openai": 8, "deepseek": 4}  # 每个模型服务商同时进行的生成数量上限
+    BATCH_MAX_ITEMS: int = 100  # 批量生成单次请求的条目数上限
+    BATCH_CONCURRENCY: int = 8  # 批量生成中同时执行的条目数（请求中可以调低）
+    CHUNK_FUNCTIONS: bool = True  # 包含多个函数的代码按函数切分后并发生成，合并为每个函数一个子图簇的图
+    CHUNK_CONCURRENCY: int = 4  # 单次生成中同时处理的函数数
+    PARALLEL_SUBGRAPH: bool = True  # 子图阶段每个代码块单独调用一次大模型（并发执行）
+    SUBGRAPH_CONCURRENCY: int = 4  # 子图阶段同时进行的调用数
+    FEW_SHOT_EXAMPLES: Optional[int] = 3  # 提示词中只保留和输入代码最相似的几个示例，None时保留全部示例
+    
+    # 异步任务配置
+    JOB_DB_PATH: str = "cache/jobs.sqlite3"
+    JOB_WORKERS: int = 4  # 执行任务的worker数量，与HTTP请求处理相互独立
+    JOB_RETENTION: int = 7 * 24 * 3600  # 已结束任务的保留时间（秒）
+    
+    # Graphviz渲染配置
+    GRAPHVIZ_DOT: str = "dot"  # dot可执行文件
+    RENDER_MAX_CONCURRENCY: int = 4  # 同时运行的dot进程数上限
+    RENDER_TIMEOUT: float = 30.0  # 单次渲染超时（秒）
+    
+    # 结果缓存配置
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_DB_PATH: str = "cache/cfg_cache.sqlite3"
+    RESULT_CACHE_MEMORY_ENTRIES: int = 256  # 内存LRU层的条目数
+    RESULT_CACHE_MAX_ENTRIES: int = 10000  # 磁盘层的条目数上限
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 磁盘层的总大小上限
+    RESULT_CACHE_TTL: int = 7 * 24 * 3600  # 缓存有效期（秒）
+    STAGE_CACHE_ENABLED: bool = True  # 是否缓存unit_chain各阶段的输出
+    STAGE_CACHE_MEMORY_ENTRIES: int = 1024
+    STAGE_CACHE_MAX_ENTRIES: int = 50000
+    
+    # HTTP响应压缩
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    
+    # 日志和trace配置
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # text 便于本地阅读；json 每行一条，便于日志系统采集
+    TRACE_EXPORTER: Optional[str] = None  # None不导出；jsonl 写本地文件；otlp 发送到OpenTelemetry采集器；可用逗号组合
+    TRACE_JSONL_PATH: str = "logs/traces.jsonl"
+    TRACE_OTLP_ENDPOINT: str = "http://localhost:4318"  # OTLP/HTTP 地址（不含 /v1/traces）
+    TRACE_SERVICE_NAME: str = "cfg-assistant"
+    
+    # 大模型调用的录制/回放（用于离线压测和分析非大模型部分的开销）
+    LLM_CASSETTE_PATH: Optional[str] = None  # 磁带文件（gzip压缩的JSON Lines），None时直接调用大模型
+    LLM_CASSETTE_MODE: str = "auto"  # record 调用并录制；replay 只回放；auto 有录制时回放，否则调用并录制
+    LLM_CASSETTE_LATENCY: Optional[str] = None  # 回放时模拟的耗时：不设置不等待，秒数，或 recorded 按录制时的耗时
     
     # 模型配置
     SUPPORTED_MODELS: List[str] = [
@@ -40,13 +94,15 @@ class Settings(BaseSettings):
         "deepseek-chat"
     ]
     
+    @field_validator("UPLOAD_DIR", "STATIC_DIR", "JOB_DB_PATH", "RESULT_CACHE_DB_PATH", "TRACE_JSONL_PATH")
+    @classmethod
+    def resolve_path(cls, value: str) -> str:
+        """相对路径转换为backend目录下的绝对路径（目录由使用它的模块在需要时创建）"""
+        return os.path.abspath(os.path.join(BACKEND_DIR, value))
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
 
 # 创建全局设置实例
 settings = Settings()
-
-# 确保必要的目录存在
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-os.makedirs(settings.STATIC_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+HTTP缓存：ETag条件请求（If-None-Match 匹配时返回304）和按内容哈希命名的静态图片的长期缓存
+"""
+import hashlib
+import os
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+
+# 内容不会变化的资源（按内容哈希寻址）
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 内容可能变化的结果：可以缓存，但每次使用前都要用ETag重新验证
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# 图片存储中的文件：按内容哈希命名（之前的旧图片按uuid命名），写入后内容不会变化
+_CONTENT_ADDRESSED_PATTERN = re.compile(r'^cfg_[0-9a-f]{32}\.\w+$')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含该ETag（弱比较，压缩后的响应使用弱ETag）"""
+    if not if_none_match:
+        return False
+    candidates = [item.strip() for item in if_none_match.split(',')]
+    return '*' in candidates or any(item.removeprefix('W/') == etag.removeprefix('W/') for item in candidates)
+
+
+def not_modified(request: Request, etag: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """
+    :return: 请求的ETag与当前一致时返回304响应，否则为None
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+    return None
+
+
+def conditional_json(request: Request, content: Any, cache_control: str = REVALIDATE_CACHE_CONTROL) -> Response:
+    """
+    返回带ETag（响应体的哈希）的JSON响应，客户端已有相同内容时返回304，不再重复传输
+    """
+    response = JSONResponse(jsonable_encoder(content))
+    etag = '"' + hashlib.sha256(response.body).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    cached = not_modified(request, etag, headers)
+    if cached is not None:
+        return cached
+    response.headers.update(headers)
+    return response
+
+
+class CachedStaticFiles(StaticFiles):
+    """按内容哈希命名的图片永久缓存；其他静态文件每次用ETag/Last-Modified重新验证"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if _CONTENT_ADDRESSED_PATTERN.match(os.path.basename(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        return response
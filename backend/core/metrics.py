@@ -0,0 +1,128 @@
+"""
+服务的运行指标（Prometheus文本格式，由 GET /metrics 输出）
+请求、生成、阶段耗时在发生时记录；缓存、单飞合并、任务队列和大模型调用保护的统计在抓取时读取，平时没有额外开销
+"""
+import time
+
+from util.metrics import metrics
+from util.rate_limit import provider_guards
+
+http_requests = metrics.counter(
+    "cfg_http_requests_total", "HTTP请求数", ("method", "route", "status"))
+http_request_duration = metrics.histogram(
+    "cfg_http_request_duration_seconds", "HTTP请求耗时（流式响应到最后一个字节）", ("method", "route"))
+http_in_flight = metrics.gauge(
+    "cfg_http_requests_in_flight", "正在处理的HTTP请求数")
+generation_duration = metrics.histogram(
+    "cfg_generation_duration_seconds", "单次生成的耗时，outcome为success/cached/coalesced/error", ("language", "mode", "outcome"))
+generations_in_flight = metrics.gauge(
+    "cfg_generations_in_flight", "正在进行的生成请求数（含合并到同一次生成的请求）")
+stage_duration = metrics.histogram(
+    "cfg_stage_duration_seconds", "生成各阶段的耗时（unwrap/structure/nested/subgraph/fusion/fast/local/render）",
+    ("stage", "language"))
+
+
+class MetricsMiddleware:
+    """
+    记录HTTP请求数、耗时和并发数的ASGI中间件
+    路由标签使用路由模板（如 /api/cfg/jobs/{job_id}），未匹配的路径统一记为 unmatched，避免标签基数膨胀
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None:
+            routes = {}
+            for route in scope["app"].routes:
+                target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if target is not None:
+                    routes[target] = route.path if hasattr(route, "endpoint") else route.path + "/{path}"
+            self._routes = routes
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = self._route(scope)
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            http_request_duration.observe(time.perf_counter() - start, method=scope["method"], route=route)
+
+
+def register_collectors(cfg_service, job_queue, artifact_store):
+    """注册抓取时读取的统计：结果缓存、阶段缓存、单飞合并、图片存储、任务队列、大模型调用保护"""
+
+    def collect_service():
+        cache = cfg_service.cache_stats()
+        families = []
+        if cache.get("enabled"):
+            families.append(("cfg_result_cache_lookups_total", "counter", "结果缓存查询次数",
+                             {("hit",): cache["hits"], ("miss",): cache["misses"]}, ("result",)))
+            families.append(("cfg_result_cache_hit_ratio", "gauge", "结果缓存命中率",
+                             {(): cache["hit_ratio"]}, ()))
+            families.append(("cfg_result_cache_entries", "gauge", "结果缓存条目数",
+                             {("memory",): cache["memory_entries"], ("disk",): cache["disk_entries"]}, ("tier",)))
+        stage_samples = {}
+        for stage, counter in cache.get("stages", {}).items():
+            stage_samples[(stage, "hit")] = counter["hits"]
+            stage_samples[(stage, "miss")] = counter["misses"]
+        families.append(("cfg_stage_cache_lookups_total", "counter", "阶段缓存查询次数",
+                         stage_samples, ("stage", "result")))
+
+        flights = cfg_service.flight_stats()
+        families.append(("cfg_singleflight_total", "counter", "独立生成次数(leader)和被合并的请求数(coalesced)",
+                         {("leader",): flights["leaders"], ("coalesced",): flights["coalesced"]}, ("role",)))
+        families.append(("cfg_singleflight_in_flight", "gauge", "正在进行的独立生成数",
+                         {(): flights["in_flight"]}, ()))
+        families.append(("cfg_llm_calls_saved_total", "counter", "单飞合并节省的大模型调用次数",
+                         {(): flights["llm_calls_saved"]}, ()))
+
+        artifacts = artifact_store.stats()
+        families.append(("cfg_artifact_bytes", "gauge", "静态目录中生成图片的总大小", {(): artifacts["bytes"]}, ()))
+        families.append(("cfg_artifact_files", "gauge", "静态目录中生成图片的文件数", {(): artifacts["files"]}, ()))
+        families.append(("cfg_artifact_operations_total", "counter", "图片写入、按内容去重和淘汰的次数",
+                         {("write",): artifacts["writes"], ("deduplicated",): artifacts["deduplicated"],
+                          ("eviction",): artifacts["evictions"]}, ("operation",)))
+
+        jobs = job_queue.stats()
+        families.append(("cfg_jobs", "gauge", "各状态的异步任务数",
+                         {(status,): count for status, count in jobs["jobs"].items()}, ("status",)))
+        families.append(("cfg_job_queue_depth", "gauge", "排队等待worker的任务数", {(): jobs["queued"]}, ()))
+        return families
+
+    def collect_llm():
+        stats = provider_guards.stats()
+        counters = {}
+        for provider, guard in stats.items():
+            for name in ("calls", "successes", "failures", "retries", "rate_limited", "rejected"):
+                counters[(provider, name)] = guard[name]
+        return [
+            ("cfg_llm_calls_total", "counter", "大模型调用计数（calls/successes/failures/retries/rate_limited/rejected）",
+             counters, ("provider", "event")),
+            ("cfg_llm_throttle_wait_seconds_total", "counter", "限流等待的累计时间",
+             {(p, ): g["throttle_wait_seconds"] for p, g in stats.items()}, ("provider",)),
+            ("cfg_llm_circuit_open", "gauge", "熔断器是否打开（half_open也计为1）",
+             {(p, ): int(g["circuit"] != "closed") for p, g in stats.items()}, ("provider",)),
+        ]
+
+    metrics.add_collector(collect_service)
+    metrics.add_collector(collect_llm)
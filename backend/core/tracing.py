@@ -0,0 +1,44 @@
+"""
+请求级的trace：每个HTTP请求一个根span，生成流程各阶段、大模型调用都是它的子span
+请求ID取自请求头 X-Request-ID（没有或不合法时生成一个），在响应头中原样返回，日志中也带有它
+"""
+import re
+import uuid
+
+from util.tracing import tracer
+
+REQUEST_ID_HEADER = b"x-request-id"
+# 只接受常见的ID字符，避免把任意内容写进日志和响应头
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+class TracingMiddleware:
+    """为每个HTTP请求创建根span（流式响应到最后一个字节结束）的ASGI中间件"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+
+        with tracer.span("http", request_id=request_id, method=scope["method"], path=scope["path"]) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    span.set_attribute("status", status)
+                    if status >= 500:
+                        span.status = "error"
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
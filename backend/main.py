@@ -1,9 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from api.routes import cfg_router, model_router
 from core.config import settings
+from util.LLM_util import load_config, client_registry, use_cassette
+from util.prompt_registry import prompt_registry
+from services.job_queue import job_queue
+from services.cfg_service import cfg_service
+from services.artifact_store import artifact_store
+from core.metrics import MetricsMiddleware, register_collectors
+from core.tracing import TracingMiddleware
+from core.compression import CompressionMiddleware
+from core.http_cache import CachedStaticFiles
+from util.metrics import metrics
+from util.tracing import tracer, configure_logging
 
 app = FastAPI(
     title="CFG Generation API",
@@ -19,9 +30,40 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 较大的JSON/文本响应按客户端支持压缩（brotli或gzip）
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+# 请求数、耗时和并发数
+app.add_middleware(MetricsMiddleware)
+register_collectors(cfg_service, job_queue, artifact_store)
+# 每个请求一个根span，响应头返回X-Request-ID
+app.add_middleware(TracingMiddleware)
 
-# 静态文件服务
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.on_event("startup")
+async def startup():
+    configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+    tracer.configure(settings.TRACE_EXPORTER, jsonl_path=settings.TRACE_JSONL_PATH,
+                     otlp_endpoint=settings.TRACE_OTLP_ENDPOINT, service_name=settings.TRACE_SERVICE_NAME)
+    # 启动时读取一次模型配置和提示词模板，之后所有请求复用
+    load_config()
+    if settings.LLM_CASSETTE_PATH:
+        use_cassette(settings.LLM_CASSETTE_PATH, settings.LLM_CASSETTE_MODE, settings.LLM_CASSETTE_LATENCY)
+    prompt_registry.load()
+    # 清理过期和超出大小上限的图片（导入模块时不会删除任何文件）
+    artifact_store.sweep()
+    # 启动异步任务的worker，上次未完成的任务重新排队
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    # 关闭共享的LLM连接池
+    await client_registry.aclose()
+    # 导出剩余的span
+    tracer.shutdown()
+
+# 静态文件服务，按内容哈希命名的图片可以永久缓存（目录在启动时由 artifact_store.sweep() 创建）
+app.mount("/static", CachedStaticFiles(directory=artifact_store.directory, check_dir=False), name="static")
 
 # 注册路由
 app.include_router(cfg_router, prefix="/api/cfg", tags=["CFG Generation"])
@@ -35,6 +77,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus格式的运行指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -18,6 +18,12 @@ class ClientEnum(str, Enum):
     OPENAI = "openai"
     DEEPSEEK = "deepseek"
 
+class GenerationModeEnum(str, Enum):
+    LLM = "llm"  # 大模型生成
+    LOCAL = "local"  # 本地静态分析（仅Python），不调用大模型
+    AUTO = "auto"  # 优先本地分析，无法分析时回退到大模型
+    FAST = "fast"  # 大模型一次调用直接生成流程图（融合提示词），不经过分阶段流程
+
 class CFGGenerationRequest(BaseModel):
     code: str = Field(..., description="源代码内容")
     language: LanguageEnum = Field(..., description="编程语言")
@@ -25,14 +31,47 @@ class CFGGenerationRequest(BaseModel):
     client_name: ClientEnum = Field(default=ClientEnum.OPENAI, description="客户端类型")
     temperature: float = Field(default=0.0, ge=0.0, le=2.0, description="模型温度参数")
     api_key: Optional[str] = Field(None, description="API密钥（可选，覆盖默认配置）")
+    mode: GenerationModeEnum = Field(default=GenerationModeEnum.LLM, description="生成方式: llm / fast / local / auto")
 
 class CFGGenerationResponse(BaseModel):
     success: bool = Field(..., description="生成是否成功")
     message: str = Field(..., description="响应消息")
     graph_data: Optional[Dict[str, Any]] = Field(None, description="图形数据")
     graph_code: Optional[str] = Field(None, description="生成的Graphviz代码")
-    image_url: Optional[str] = Field(None, description="生成的图片URL")
+    image_url: Optional[str] = Field(None, description="PNG图片的URL（第一次访问时渲染）")
+    graph_id: Optional[str] = Field(None, description="图的ID，通过 /api/cfg/graphs/{graph_id}.{png,svg,dot,json} 获取各种格式")
     processing_time: Optional[float] = Field(None, description="处理时间（秒）")
+    cached: bool = Field(default=False, description="结果是否来自缓存")
+    coalesced: bool = Field(default=False, description="是否合并到了进行中的相同请求")
+    mode: Optional[str] = Field(None, description="实际使用的生成方式: llm / fast / local")
+    partial: bool = Field(default=False, description="按函数切分生成时部分函数失败，图中这些函数只有错误节点（结果不缓存）")
+    failed_units: List[str] = Field(default_factory=list, description="生成失败的函数名")
+
+class CFGBatchRequest(BaseModel):
+    items: List[CFGGenerationRequest] = Field(..., min_length=1, description="生成请求列表")
+    concurrency: Optional[int] = Field(None, ge=1, description="同时执行的条目数（不超过服务端上限）")
+
+class CFGBatchItemResult(CFGGenerationResponse):
+    index: int = Field(..., description="条目在请求列表中的位置")
+    duplicate_of: Optional[int] = Field(None, description="与之前某个条目相同时，该条目的位置（结果直接复用）")
+
+class CFGBatchResponse(BaseModel):
+    success: bool = Field(..., description="是否全部生成成功")
+    total: int = Field(..., description="条目总数")
+    succeeded: int = Field(..., description="成功的条目数")
+    failed: int = Field(..., description="失败的条目数")
+    deduplicated: int = Field(..., description="因重复而复用结果的条目数")
+    results: List[CFGBatchItemResult] = Field(..., description="按请求顺序排列的各条目结果")
+    processing_time: float = Field(..., description="总处理时间（秒）")
+
+class JobStatusResponse(BaseModel):
+    job_id: str = Field(..., description="任务ID")
+    status: str = Field(..., description="任务状态: queued / running / succeeded / failed / cancelled")
+    created_at: float = Field(..., description="提交时间（Unix时间戳）")
+    started_at: Optional[float] = Field(None, description="开始执行时间")
+    finished_at: Optional[float] = Field(None, description="结束时间")
+    result: Optional[CFGGenerationResponse] = Field(None, description="生成结果（任务结束后）")
+    error: Optional[str] = Field(None, description="失败或取消的原因")
 
 class ModelConfigRequest(BaseModel):
     model_name: ModelEnum = Field(..., description="模型名称")
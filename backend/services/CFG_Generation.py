@@ -1,19 +1,137 @@
-import subprocess
+import asyncio
+import hashlib
+import json
+import re
 import sys
 import os
+import time
+from collections import defaultdict
 
 # 添加项目根目录到Python路径
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
 sys.path.insert(0, project_root)
 
 from util.LLM_util import LLM_util
+from util.prompt_registry import prompt_registry
+from services.code_structure import extract_structure, StructureError
+from services.code_chunks import split_functions
+from services.graph_ir import GraphIR, parse_graph
+from core.metrics import stage_duration
+from util.tracing import tracer, get_logger
 # from soupsieve.util import lower    #将字符串变为小写 - 注释掉未使用的导入
 
+logger = get_logger("cfg_generation")
+
+
+def _sha256(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """
+    unit_chain各阶段的结果缓存
+    键为 (阶段, 提示词哈希, 模型, 温度, 输入哈希)，底层存储只需提供get/put（如ResultCache）
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def key(self, stage, prompt_version, model_name, temperature, inputs):
+        return _sha256(stage, prompt_version, model_name, temperature, _sha256(*inputs))
+
+    def get(self, stage, key):
+        value = self.store.get(key)
+        self.counters[stage]["hits" if value is not None else "misses"] += 1
+        return value["output"] if value is not None else None
+
+    def put(self, key, output):
+        self.store.put(key, {"output": output})
+
+    def stats(self):
+        stats = {}
+        for stage, counter in self.counters.items():
+            lookups = counter["hits"] + counter["misses"]
+            stats[stage] = {**counter, "hit_ratio": round(counter["hits"] / lookups, 4) if lookups else 0.0}
+        return stats
+
+
+# 分块阶段输出中每个代码块的开头，例如 *if_block_1*
+_BLOCK_HEADER = re.compile(r'^[ \t]*\*(\w+)\*[ \t]*$', re.MULTILINE)
+
+
+def split_nested_blocks(nested_blocks):
+    """
+    把分块阶段的输出拆成各个代码块
+    :return: [(块名, 含块名标记的代码块文本)]，格式不符合预期时返回空列表
+    """
+    headers = list(_BLOCK_HEADER.finditer(nested_blocks))
+    if not headers or nested_blocks[:headers[0].start()].strip():
+        return []
+    blocks = []
+    for header, following in zip(headers, headers[1:] + [None]):
+        end = following.start() if following is not None else len(nested_blocks)
+        blocks.append((header.group(1), nested_blocks[header.start():end].strip('\n')))
+    return blocks
+
+
+# 结构阶段可以由本地扫描器完成的语言
+LOCAL_STRUCTURE_LANGUAGES = ('Java', 'C')
+
+
 class CFG:
-    def __init__(self, language, client_name, model_name):
+    def __init__(self, language, client_name, model_name, api_key=None, prompts=None, work_dir=None,
+                 stage_cache=None, local_structure=True, chunk_functions=True, chunk_concurrency=4,
+                 parallel_subgraph=True, subgraph_concurrency=4, pipeline='chain',
+                 few_shot=None):
+        """
+        :param prompts: 提示词注册表(PromptRegistry)，默认使用项目根目录下prompt的全局注册表
+        :param work_dir: 输出目录，不为None时把生成的graph_code.py写到这里
+        :param stage_cache: 阶段缓存(StageCache)，为None时每个阶段都调用大模型
+        :param local_structure: Java、C代码的结构阶段是否用本地扫描器代替大模型
+        :param chunk_functions: 是否把包含多个函数的代码按函数切分、并发生成后再合并
+        :param chunk_concurrency: 切分后同时生成的函数数
+        :param parallel_subgraph: 子图阶段是否每个代码块单独调用一次大模型（并发执行）
+        :param subgraph_concurrency: 子图阶段同时进行的调用数
+        :param pipeline: 'chain' 分阶段生成（解套、结构、分块、子图、融合）；'fast' 用融合提示词一次调用直接生成
+        :param few_shot: 每个提示词只保留和输入最相似的几个示例，None时保留全部示例
+        """
         self.language = language
-        self.llm = LLM_util(model_name, client_name)
-        pass
+        self.llm = LLM_util(model_name, client_name, api_key)
+        # 所有路径都显式传入，不依赖进程级的当前工作目录，多个请求可以安全并发
+        self.prompts = prompts or prompt_registry
+        self.work_dir = work_dir
+        self.stage_cache = stage_cache
+        self.local_structure = local_structure
+        self.chunk_functions = chunk_functions
+        self.chunk_concurrency = chunk_concurrency
+        self.parallel_subgraph = parallel_subgraph
+        self.subgraph_concurrency = subgraph_concurrency
+        self.pipeline = pipeline
+        self.few_shot = few_shot
+        # 按函数切分生成时失败的函数名，不为空时结果不完整
+        self.failed_units = []
+
+    async def call_stage(self, stage, template, prompt, *inputs):
+        """
+        调用大模型执行一个阶段，输入和提示词都没变时直接复用之前的输出
+        :param stage: 阶段名称
+        :param template: 提示词模板(PromptTemplate)
+        :param prompt: 替换占位符后的完整提示词
+        :param inputs: 本阶段的输入
+        """
+        if self.stage_cache is None:
+            return await self.llm.call_LLM(prompt)
+        key = self.stage_cache.key(stage, template.version, self.llm.model_name, self.llm.temperature,
+                                   inputs + (self.few_shot,))
+        output = self.stage_cache.get(stage, key)
+        span = tracer.current_span()
+        if span is not None:
+            span.set_attribute("stage_cache", "miss" if output is None else "hit")
+        if output is None:
+            output = await self.llm.call_LLM(prompt)
+            self.stage_cache.put(key, output)
+        return output
 
     # 读文件
     def read_file(self,path):
@@ -26,99 +144,196 @@ class CFG:
             f.write(content)
 
     # 解套 目前只针对Python代码执行这一步骤
-    def unwrap_code(self,code):
+    async def unwrap_code(self,code):
         """
         :param code_path: 代码文件地址
         :param language:代码语言
         :return: -
         """
-        prompt = self.read_file('prompt/'+'Python/unwrap_prompt.txt')    #提示词
-        prompt = prompt.replace('{input_code}', code)
+        template = self.prompts.get('Python', 'unwrap')    #提示词
+        prompt = template.render(example_count=self.few_shot, input_code=code)
         # message = [{"role": "user", "content": prompt.replace('{input_code}', code)}]    #消息内容  将提示词中的占位符换成代码
-        unwrap_python_code = self.llm.call_LLM(prompt).strip('\n')
+        unwrap_python_code = (await self.call_stage('unwrap', template, prompt, code)).strip('\n')
         return unwrap_python_code
 
     # 获得代码结构并写入文件
-    def get_structure(self, code):
+    async def get_structure(self, code):
         """
         :param code_path: 代码文件地址
         :param language:代码语言
         :return: -
         """
-        prompt = self.read_file('./prompt/' + self.language + '/structure_prompt.txt')  # 提示词
-        prompt = prompt.replace('{input_code}', code)
+        if self.local_structure and self.language in LOCAL_STRUCTURE_LANGUAGES:
+            try:
+                structure = extract_structure(code)
+                span = tracer.current_span()
+                if span is not None:
+                    span.set_attribute("source", "local")
+                return structure
+            except StructureError as e:
+                logger.info("本地结构提取失败，改用大模型: %s", e)
+        template = self.prompts.get(self.language, 'structure')  # 提示词
+        prompt = template.render(example_count=self.few_shot, input_code=code)
         # message = [{"role": "user", "content": prompt.replace('{input_code}', code)}]  # 消息内容  将提示词中的占位符换成代码
-        structure_content = self.llm.call_LLM(prompt).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
+        structure_content = (await self.call_stage('structure', template, prompt, code)).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
             '\n')  # 调用大模型 去除返回内容的包裹符号和头尾的空行
         return structure_content
 
-    def get_nested(self,code, code_structure):
+    async def get_nested(self,code, code_structure):
         """
         :param code_path: 代码文件地址
         :param structure_path: 代码结构文件地址
         :param language:代码语言
         :return:
         """
-        prompt = self.read_file('./prompt/' + self.language + '/nested_prompt.txt')  # 提示词
+        template = self.prompts.get(self.language, 'nested')  # 提示词
         # message = [{"role": "user", "content": prompt.replace('{input_code}', code).replace('{input_structure}',
         #                                                                                     code_structure)}]  # 消息内容  将提示词中的代码占位符换成代码 代码结构占位符换成代码结构
-        prompt = prompt.replace('{input_code}', code).replace('{input_structure}',code_structure)
+        prompt = template.render(example_count=self.few_shot, input_code=code, input_structure=code_structure)
 
-        nested_content = self.llm.call_LLM(prompt).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
+        nested_content = (await self.call_stage('nested', template, prompt, code, code_structure)).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
             '\n')  # 调用大模型 去除返回内容的包裹符号和头尾的空行
         return nested_content
 
-    def get_subgraph(self, code, nested_blocks):
+    async def get_subgraph(self, code, nested_blocks):
         """
-        :param code_path: 代码文件地址
-        :param nested_path: 代码块文件地址
-        :param language:代码语言
-        :return: -
+        为每个代码块生成子图：代码块拆开后每块单独调用一次大模型（并发数为subgraph_concurrency），
+        输出按原顺序拼接，和一次生成全部子图的格式相同
+        :param code: 源代码
+        :param nested_blocks: 分块阶段的输出
+        :return: 各代码块的子图代码
         """
-        prompt = self.read_file('prompt/' + self.language + '/subgraph_prompt.txt')  # 提示词
+        template = self.prompts.get(self.language, 'subgraph')  # 提示词
+        blocks = split_nested_blocks(nested_blocks) if self.parallel_subgraph else []
+        if len(blocks) <= 1:
+            return await self.block_subgraph(template, code, nested_blocks)
+
+        semaphore = asyncio.Semaphore(self.subgraph_concurrency)
+
+        async def run(name, block):
+            with tracer.span("subgraph.block", block=name):
+                async with semaphore:
+                    output = await self.block_subgraph(template, code, block)
+            # 输出缺少块名标记时补上，融合阶段靠它区分各块的子图
+            if not output.lstrip().startswith(f'*{name}*'):
+                output = f'*{name}*\n' + output
+            return output
+
+        outputs = await asyncio.gather(*(run(name, block) for name, block in blocks))
+        return '\n'.join(outputs)
+
+    async def block_subgraph(self, template, code, nested):
         # message = [{"role": "user", "content": prompt.replace('{input_code}', code).replace('{input_nested}',
         #                                                                                     nested)}]
-        prompt = prompt.replace('{input_code}', code).replace('{input_nested}',nested_blocks)
+        prompt = template.render(example_count=self.few_shot, input_code=code, input_nested=nested)
 
-        subgraph_content = self.llm.call_LLM(prompt).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
+        subgraph_content = (await self.call_stage('subgraph', template, prompt, code, nested)).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
             '\n')  # 调用大模型 去除返回内容的包裹符号和头尾的空行
         return subgraph_content
 
-    def fusion_subgraph(self, code, subgraph):
+    async def fusion_subgraph(self, code, subgraph):
         """
         :param code_path: 代码文件地址
         :param subgraph_path: 子图文件地址
         :param language:代码语言
         :return: -
         """
-        prompt = self.read_file('prompt/' + self.language + '/fusion_prompt.txt')  # 提示词
+        template = self.prompts.get(self.language, 'fusion')  # 提示词
   # 消息内容  将提示词中的代码占位符换成代码 子图占位符换成子图
-        prompt = prompt.replace('{input_code}',code).replace('{input_subgraph}', subgraph)
-        fusion_content = self.llm.call_LLM(prompt).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
+        prompt = template.render(example_count=self.few_shot, input_code=code, input_subgraph=subgraph)
+        fusion_content = (await self.call_stage('fusion', template, prompt, code, subgraph)).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
             '\n')  # 调用大模型 去除返回内容的包裹符号和头尾的空行
         fusion_code = "from graphviz import Digraph\ndot = Digraph()\ndot.attr('node', fontname='SimSun')\n" + fusion_content + "\ndot.render('graph', format='png', view=False)"
+        return fusion_code
+
+    async def fast_graph(self, code):
+        """
+        快速模式：用融合提示词一次调用从代码直接生成流程图，输出格式和融合阶段相同
+        :param code: 源代码
+        :return: graphviz代码
+        """
+        template = self.prompts.get(self.language, 'fast')  # 提示词
+        prompt = template.render(example_count=self.few_shot, input_code=code)
+        graph_content = (await self.call_stage('fast', template, prompt, code)).strip('@Output{').strip('}').strip('\n').strip('[').strip(']').strip(
+            '\n')  # 调用大模型 去除返回内容的包裹符号和头尾的空行
+        return "from graphviz import Digraph\ndot = Digraph()\ndot.attr('node', fontname='SimSun')\n" + graph_content + "\ndot.render('graph', format='png', view=False)"
 
-        self.write_file("./graph_code.py", fusion_code)  # 写入文件到指定地址
+    async def unit_chain(self, code, on_stage=None):
+        """
+        :param code: 源代码，可以是包含多个函数的完整文件
+        :param on_stage: 可选的异步回调 on_stage(阶段名称, 阶段输出, 函数名)，每个阶段完成后立即调用，用于流式返回进度；
+                         不切分时函数名为None
+        :return: 融合阶段生成的graphviz代码
+        """
+        chunks = split_functions(code, self.language) if self.chunk_functions else []
+        if len(chunks) <= 1:
+            fusion_code = await self.function_chain(code, on_stage)
+        else:
+            fusion_code = await self.chunked_chain(chunks, on_stage)
+        if self.work_dir is not None:
+            self.write_file(os.path.join(self.work_dir, "graph_code.py"), fusion_code)  # 写入文件到输出目录
         return fusion_code
 
-    # 生成graphviz流程图
-    def generation(self,create_graph_code):
+    async def function_chain(self, code, on_stage=None, unit=None):
         """
-        :param create_graph_code: 完整的graphviz生成流程图的代码文件地址
-        :param language:代码语言
-        :return: -
+        对一段代码（一个函数或不切分的整段代码）依次执行各阶段
         """
-        subprocess.run(['python', "./graph_code.py"])  # 执行生成流程图的代码文件
-        # print('graph:成功生成流程图!')
+        async def run(stage, step, event=None):
+            # 记录阶段耗时和span，完成后立即通知调用方
+            with tracer.span(f"stage.{stage}", language=self.language, unit=unit) as span:
+                start = time.perf_counter()
+                output = await step
+                stage_duration.observe(time.perf_counter() - start, stage=stage, language=self.language)
+                span.set_attribute("output_chars", len(output))
+            if on_stage is not None:
+                await on_stage(event or stage, output, unit)
+            return output
 
-    def unit_chain(self, code):
+        if self.pipeline == 'fast':
+            return await run('fast', self.fast_graph(code), 'fusion')
         if self.language == 'Python':
-             code = self.unwrap_code(code)
-        code_structure = self.get_structure(code)
-        nested_blocks = self.get_nested(code,code_structure)
-        subgraphs = self.get_subgraph(code, nested_blocks)
-        fusion_code = self.fusion_subgraph(code, subgraphs)
-        self.generation(fusion_code)
+             code = await run('unwrap', self.unwrap_code(code))
+        code_structure = await run('structure', self.get_structure(code))
+        nested_blocks = await run('nested', self.get_nested(code,code_structure))
+        subgraphs = await run('subgraph', self.get_subgraph(code, nested_blocks))
+        # 渲染由调用方（services.renderer）根据解析出的节点和边完成
+        return await run('fusion', self.fusion_subgraph(code, subgraphs))
+
+    async def chunked_chain(self, chunks, on_stage=None):
+        """
+        各函数并发执行生成流程（并发数为chunk_concurrency），结果合并为每个函数一个子图簇的图
+        单个函数失败时在它的子图簇中放一个错误节点并记入failed_units，全部失败时抛出第一个错误
+        """
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def run(chunk):
+            with tracer.span("function", unit=chunk.name, code_chars=len(chunk.code)):
+                async with semaphore:
+                    return parse_graph(await self.function_chain(chunk.code, on_stage, chunk.name))
+
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks), return_exceptions=True)
+        for result in results:
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+        if all(isinstance(result, Exception) for result in results):
+            raise results[0]
+
+        parts = []
+        self.failed_units = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.warning("函数 %s 生成失败: %s", chunk.name, result)
+                self.failed_units.append(chunk.name)
+                # 异常信息只写日志，不放进图中
+                graph = GraphIR()
+                graph.add_node('error', f'{chunk.name} 生成失败', {"color": "red"})
+            else:
+                graph = result
+            parts.append((chunk.name, graph))
+        fusion_code = GraphIR.combine(parts).to_python()
+        if on_stage is not None:
+            await on_stage('fusion', fusion_code, None)
+        return fusion_code
 
 if __name__ == '__main__':
     code = '''\
@@ -135,5 +350,6 @@ public static void heapsort(int[] a) {
     }
 }
 '''
-    cfg = CFG('Java', 'openai', 'gpt-4-0613')
-    cfg.unit_chain(code)
+    # 生成的graph_code.py写到当前目录，可直接运行它得到流程图
+    cfg = CFG('Java', 'openai', 'gpt-4-0613', work_dir='.')
+    asyncio.run(cfg.unit_chain(code))
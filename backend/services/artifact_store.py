@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from core.config import settings, BACKEND_DIR
+
+# 由本存储管理的文件名前缀（包括之前按uuid命名的旧图片）
+ARTIFACT_PREFIX = "cfg_"
+
+
+class ArtifactStore:
+    """
+    静态文件目录中生成图片的存储
+    - 文件按内容哈希命名，相同的图只保存一份
+    - 总大小超过上限或超过有效期时删除最久未访问的文件；最后访问时间记在文件的mtime上，重启后仍然有效
+    - 创建时不读取目录也不删除文件：索引在第一次使用时建立，启动时的清理由 sweep() 显式执行
+    """
+
+    def __init__(self, directory: str, url_prefix: str = "/static", max_bytes: int = 512 * 1024 * 1024,
+                 ttl: int = 7 * 24 * 3600):
+        self.directory = os.path.abspath(os.path.join(BACKEND_DIR, directory))
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # 文件名 -> [大小, 最后访问时间]，按访问时间从旧到新排列
+        self._index: "OrderedDict[str, list]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"writes": 0, "deduplicated": 0, "evictions": 0}
+        self._loaded = False
+
+    def _load(self):
+        """第一次使用时扫描目录建立索引（调用方持有锁），只读取不删除"""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.startswith(ARTIFACT_PREFIX):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for mtime, name, size in sorted(files):
+            self._index[name] = [size, mtime]
+            self._bytes += size
+
+    def _url(self, name: str) -> str:
+        return f"{self.url_prefix}/{name}"
+
+    def _name(self, url: str) -> str:
+        return os.path.basename(url or '')
+
+    def put(self, data: bytes, ext: str = "png") -> str:
+        """
+        保存内容并返回访问URL，相同内容的文件已存在时只更新访问时间
+        """
+        name = f"{ARTIFACT_PREFIX}{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
+        path = os.path.join(self.directory, name)
+        now = time.time()
+        with self._lock:
+            self._load()
+            if name in self._index and self._touch(name, now):
+                self._counters["deduplicated"] += 1
+                return self._url(name)
+            # 先写临时文件再改名，读取方不会看到写了一半的图片
+            temp_path = os.path.join(self.directory, f".{name}.{uuid.uuid4().hex}.tmp")
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._index[name] = [len(data), now]
+            self._bytes += len(data)
+            self._counters["writes"] += 1
+            self._evict(now, keep=name)
+        return self._url(name)
+
+    def touch(self, url: str) -> bool:
+        """
+        标记一次访问（如结果缓存命中）
+        :return: 文件是否仍然存在
+        """
+        name = self._name(url)
+        with self._lock:
+            self._load()
+            if name not in self._index:
+                # 可能是其他进程写入的文件
+                path = os.path.join(self.directory, name)
+                if not name.startswith(ARTIFACT_PREFIX) or not os.path.isfile(path):
+                    return False
+                size = os.path.getsize(path)
+                self._index[name] = [size, 0.0]
+                self._bytes += size
+            return self._touch(name, time.time())
+
+    def path(self, url: str) -> Optional[str]:
+        """标记一次访问并返回文件路径，文件已被淘汰时为None"""
+        return os.path.join(self.directory, self._name(url)) if self.touch(url) else None
+
+    def _touch(self, name: str, now: float) -> bool:
+        try:
+            os.utime(os.path.join(self.directory, name), (now, now))
+        except FileNotFoundError:
+            self._forget(name)
+            return False
+        self._index[name][1] = now
+        self._index.move_to_end(name)
+        return True
+
+    def _forget(self, name: str):
+        item = self._index.pop(name, None)
+        if item is not None:
+            self._bytes -= item[0]
+
+    def _evict(self, now: float, keep: Optional[str] = None):
+        """删除过期文件，再按最久未访问的顺序删除到总大小不超过上限"""
+        while self._index:
+            name, (size, accessed_at) = next(iter(self._index.items()))
+            if name == keep or (now - accessed_at <= self.ttl and self._bytes <= self.max_bytes):
+                break
+            self._forget(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            self._counters["evictions"] += 1
+
+    def sweep(self):
+        """删除过期文件和超出大小上限的文件（服务启动时执行一次，之后写入时顺带执行）"""
+        with self._lock:
+            self._load()
+            self._evict(time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load()
+            return {
+                "files": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                **self._counters,
+            }
+
+
+# 全局图片存储
+artifact_store = ArtifactStore(
+    settings.STATIC_DIR,
+    max_bytes=settings.ARTIFACT_MAX_BYTES,
+    ttl=settings.ARTIFACT_TTL
+)
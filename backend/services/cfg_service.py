@@ -1,335 +1,401 @@
+import asyncio
+import hashlib
 import os
 import sys
 import time
-import uuid
-import subprocess
-from typing import Dict, Any, Optional
-import tempfile
-import shutil
+from typing import Awaitable, Callable, Dict, Any, List, Optional
 
 # 添加项目根目录到Python路径以导入现有的CFG模块
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
 sys.path.insert(0, project_root)
 
 try:
-    from services.CFG_Generation import CFG
+    from services.CFG_Generation import CFG, StageCache
 except ImportError:
     try:
         # 尝试从backend目录导入
         backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
         sys.path.insert(0, backend_dir)
-        from services.CFG_Generation import CFG
+        from services.CFG_Generation import CFG, StageCache
     except ImportError:
+        StageCache = None
+
         # 如果导入失败，创建一个简单的模拟类
         class CFG:
-            def __init__(self, language, client_name, model_name):
+            def __init__(self, language, client_name, model_name, api_key=None, **kwargs):
                 self.language = language
                 self.client_name = client_name
                 self.model_name = model_name
                 self.llm = type('LLM', (), {'temperature': 0.0})()
             
-            def unit_chain(self, code):
+            async def unit_chain(self, code, on_stage=None):
                 # 简单的模拟实现
                 return 'digraph G { A -> B; B -> C; }'
-from models.schemas import CFGGenerationRequest, LanguageEnum, ModelEnum, ClientEnum
+from models.schemas import CFGGenerationRequest, LanguageEnum, GenerationModeEnum
+from core.config import settings
+from core.metrics import generation_duration, generations_in_flight, stage_duration
+from util.rate_limit import LLMError
+from util.tracing import tracer, get_logger
+from services.result_cache import ResultCache, make_cache_key
+from services.graph_store import graph_store
+from services.graph_ir import parse_graph
+from services.local_cfg import build_python_cfg, LocalCFGError, LOCAL_CFG_VERSION
+from util.prompt_registry import prompt_registry
+
+logger = get_logger("cfg_service")
 
 class CFGService:
     def __init__(self):
-        self.temp_dir = tempfile.mkdtemp()
-        
-    def __del__(self):
-        # 清理临时目录
-        if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        # 限制同时进行的生成数量
+        self._semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_GENERATIONS)
+        # 每个模型服务商同时进行的生成数量上限，避免批量请求触发服务商的限流
+        self._provider_semaphores = {
+            provider: asyncio.Semaphore(limit) for provider, limit in settings.PROVIDER_MAX_CONCURRENCY.items()
+        }
+        # 进行中的生成（单飞合并）：键 -> {"task", "listeners", "waiters", "coalesced", "llm_calls"}
+        self._flights: Dict[str, Dict[str, Any]] = {}
+        self._flight_counters = {"leaders": 0, "coalesced": 0, "llm_calls_saved": 0}
+        # 内容寻址的结果缓存（内存LRU + SQLite）
+        self.cache = ResultCache(
+            settings.RESULT_CACHE_DB_PATH,
+            memory_entries=settings.RESULT_CACHE_MEMORY_ENTRIES,
+            max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            ttl=settings.RESULT_CACHE_TTL
+        ) if settings.RESULT_CACHE_ENABLED else None
+        # unit_chain各阶段的缓存，重试或部分输入变化时只重新执行受影响的阶段
+        self.stage_cache = StageCache(ResultCache(
+            settings.RESULT_CACHE_DB_PATH,
+            table="stages",
+            memory_entries=settings.STAGE_CACHE_MEMORY_ENTRIES,
+            max_entries=settings.STAGE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            ttl=settings.RESULT_CACHE_TTL
+        )) if settings.STAGE_CACHE_ENABLED and StageCache is not None else None
     
-    async def generate_cfg(self, request: CFGGenerationRequest) -> Dict[str, Any]:
+    async def generate_cfg(self, request: CFGGenerationRequest,
+                           on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
         """
         生成控制流图
+        :param on_event: 可选的异步回调 on_event(事件名称, 数据)，用于流式返回进度：
+                         stage（unwrap/structure/nested/subgraph各阶段的输出，subgraph附带局部图形数据）、
+                         graph（融合后的图形数据）、image（图片URL和图的ID）
         """
+        with tracer.span("generate_cfg", language=request.language.value, model=request.model_name.value,
+                         mode=request.mode.value, code_chars=len(request.code)) as span:
+            generations_in_flight.inc()
+            try:
+                result = await self._generate_cfg(request, on_event)
+            finally:
+                generations_in_flight.dec()
+            if not result.get("success"):
+                outcome = "error"
+                span.status, span.status_message = "error", result.get("message")
+            elif result.get("cached"):
+                outcome = "cached"
+            elif result.get("coalesced"):
+                outcome = "coalesced"
+            else:
+                outcome = "success"
+            span.set_attributes(outcome=outcome, result_mode=result.get("mode"))
+        generation_duration.observe(result["processing_time"], language=request.language.value,
+                                    mode=request.mode.value, outcome=outcome)
+        logger.info("生成结束", extra={"outcome": outcome, "language": request.language.value,
+                                       "mode": request.mode.value,
+                                       "duration_ms": round(result["processing_time"] * 1000, 1)})
+        return result
+    
+    async def _generate_cfg(self, request: CFGGenerationRequest,
+                            on_event: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
         start_time = time.time()
         
-        # 添加特殊标识确认这个方法被调用
-        print(f"[CRITICAL] CFGService.generate_cfg 方法被调用！")
-        
         try:
-            print(f"[DEBUG] 开始CFG生成，语言: {request.language.value}, 模型: {request.model_name.value}")
-            
-            # 创建CFG实例
-            cfg = CFG(
-                language=request.language.value,
-                client_name=request.client_name.value,
-                model_name=request.model_name.value
-            )
-            print(f"[DEBUG] CFG实例创建成功")
-            print(f"[DEBUG] CFG类型: {type(cfg)}")
-            print(f"[DEBUG] CFG模块: {cfg.__class__.__module__}")
-            print(f"[DEBUG] CFG是否有read_file方法: {hasattr(cfg, 'read_file')}")
-            
-            # 如果提供了自定义API密钥，更新配置
-            if request.api_key:
-                self._update_api_key(cfg, request.client_name, request.api_key)
+            logger.debug("开始CFG生成", extra={"language": request.language.value, "model": request.model_name.value})
             
-            # 设置温度参数
-            if hasattr(cfg.llm, 'temperature'):
-                cfg.llm.temperature = request.temperature
-            
-            # 生成唯一的工作目录
-            work_dir = os.path.join(self.temp_dir, str(uuid.uuid4()))
-            os.makedirs(work_dir, exist_ok=True)
-            print(f"[DEBUG] 工作目录创建: {work_dir}")
-            
-            # 保存原始工作目录
-            original_cwd = os.getcwd()
-            
-            try:
-                # 切换到工作目录
-                os.chdir(work_dir)
-                print(f"[DEBUG] 切换到工作目录: {work_dir}")
-                
-                # 复制必要的文件
-                self._copy_required_files(work_dir)
-                print(f"[DEBUG] 必要文件复制完成")
-                
-                # 执行CFG生成 - 使用unit_chain方法
-                print(f"[DEBUG] 开始执行CFG生成...")
-                cfg.unit_chain(request.code)
-                print(f"[DEBUG] CFG生成执行完成")
-                
-                # 检查是否生成了图片文件和代码文件
-                graph_path = os.path.join(work_dir, "graph.png")
-                graph_code_path = os.path.join(work_dir, "graph_code.py")
-                
-                print(f"[DEBUG] 检查生成的文件:")
-                print(f"[DEBUG] - graph.png 存在: {os.path.exists(graph_path)}")
-                print(f"[DEBUG] - graph_code.py 存在: {os.path.exists(graph_code_path)}")
-                
-                # 列出工作目录中的所有文件
-                files_in_workdir = os.listdir(work_dir)
-                print(f"[DEBUG] 工作目录中的文件: {files_in_workdir}")
-                
-                result = {
+            # 相同代码、语言、模型、温度和提示词版本的结果直接从缓存返回
+            cache_key = self._cache_key(request)
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                logger.debug("命中结果缓存", extra={"cache_key": cache_key})
+                if on_event is not None:
+                    await on_event("graph", {"graph_data": cached.get("graph_data"), "graph_code": cached["graph_code"]})
+                    await on_event("image", {"image_url": cached["image_url"], "graph_id": cached["graph_id"]})
+                return {
+                    **cached,
                     "success": True,
                     "message": "CFG生成成功",
-                    "processing_time": time.time() - start_time
+                    "processing_time": time.time() - start_time,
+                    "cached": True
                 }
-                
-                # 读取生成的图形代码
-                fusion_code = ""
-                if os.path.exists(graph_code_path):
-                    with open(graph_code_path, 'r', encoding='utf-8') as f:
-                        fusion_code = f.read()
-                    result["graph_code"] = fusion_code
-                    
-                    # 解析图形数据
-                    result["graph_data"] = self._parse_graph_data(fusion_code)
-                
-                # 如果生成了图片，复制到静态文件目录
-                if os.path.exists(graph_path):
-                    static_dir = os.path.join(original_cwd, "static")
-                    os.makedirs(static_dir, exist_ok=True)
-                    
-                    image_filename = f"cfg_{uuid.uuid4().hex}.png"
-                    static_path = os.path.join(static_dir, image_filename)
-                    shutil.copy2(graph_path, static_path)
-                    
-                    result["image_url"] = f"/static/{image_filename}"
-                else:
-                    # 检查工作目录中是否有其他png文件
-                    import glob
-                    png_files = glob.glob(os.path.join(work_dir, "*.png"))
-                    print(f"[DEBUG] 工作目录中的PNG文件: {png_files}")
-                    if png_files:
-                        # 使用找到的第一个png文件
-                        graph_path = png_files[0]
-                        static_dir = os.path.join(original_cwd, "static")
-                        os.makedirs(static_dir, exist_ok=True)
-                        
-                        image_filename = f"cfg_{uuid.uuid4().hex}.png"
-                        static_path = os.path.join(static_dir, image_filename)
-                        shutil.copy2(graph_path, static_path)
-                        
-                        result["image_url"] = f"/static/{image_filename}"
-                        print(f"[DEBUG] 使用备用PNG文件，已复制到静态目录: {static_path}")
-                    # 如果没有生成图片，但有图形代码，尝试手动生成
-                    if fusion_code and "dot.render" in fusion_code:
-                        try:
-                            print(f"[DEBUG] 尝试手动生成图片...")
-                            # 执行图形代码生成图片
-                            exec(fusion_code, {'__file__': os.path.join(work_dir, 'graph_code.py')})
-                            
-                            # 重新检查图片是否生成
-                            if os.path.exists(graph_path):
-                                print(f"[DEBUG] 手动生成图片成功: {graph_path}")
-                                static_dir = os.path.join(original_cwd, "static")
-                                os.makedirs(static_dir, exist_ok=True)
-                                
-                                image_filename = f"cfg_{uuid.uuid4().hex}.png"
-                                static_path = os.path.join(static_dir, image_filename)
-                                shutil.copy2(graph_path, static_path)
-                                
-                                result["image_url"] = f"/static/{image_filename}"
-                                print(f"[DEBUG] 图片已复制到静态目录: {static_path}")
-                            else:
-                                print(f"[DEBUG] 手动生成图片失败，文件不存在: {graph_path}")
-                                # 检查工作目录中的所有文件
-                                all_files = []
-                                for root, dirs, files in os.walk(work_dir):
-                                    for file in files:
-                                        if file.endswith('.png'):
-                                            full_path = os.path.join(root, file)
-                                            all_files.append(full_path)
-                                print(f"[DEBUG] 找到的图片文件: {all_files}")
-                        except Exception as e:
-                            print(f"[DEBUG] 手动生成图片异常: {str(e)}")
-                            result["warning"] = f"图片生成失败: {str(e)}"
-                
-                return result
-                
+            
+            # 单飞合并：相同请求正在生成时不再重复调用大模型，等待同一次生成的结果
+            # 自定义API密钥的请求只和使用同一密钥的请求合并，不会拿到别人付费调用的结果
+            flight_key = f"{cache_key}:{request.client_name.value}:{api_key_hash(request.api_key)}"
+            flight = self._flights.get(flight_key)
+            coalesced = flight is not None
+            if flight is None:
+                flight = {"listeners": [], "waiters": 0, "coalesced": 0, "llm_calls": 0}
+                flight["task"] = asyncio.create_task(self._run_generation(request, cache_key, flight))
+                flight["task"].add_done_callback(lambda _, key=flight_key, f=flight: self._end_flight(key, f))
+                self._flights[flight_key] = flight
+                self._flight_counters["leaders"] += 1
+            else:
+                logger.debug("合并到进行中的相同请求", extra={"cache_key": cache_key})
+                self._flight_counters["coalesced"] += 1
+                # 节省的调用数在生成结束后按实际调用次数计算
+                flight["coalesced"] += 1
+            
+            if on_event is not None:
+                flight["listeners"].append(on_event)
+            flight["waiters"] += 1
+            try:
+                result = await asyncio.shield(flight["task"])
             finally:
-                # 恢复原始工作目录
-                os.chdir(original_cwd)
+                flight["waiters"] -= 1
+                if on_event is not None:
+                    flight["listeners"].remove(on_event)
+                # 所有等待者都已离开（客户端断开、任务取消）时才取消生成
+                if flight["waiters"] == 0 and not flight["task"].done():
+                    flight["task"].cancel()
+            
+            return {**result, "processing_time": time.time() - start_time, "coalesced": coalesced}
                 
         except Exception as e:
+            logger.warning("CFG生成失败: %s", e, exc_info=not isinstance(e, (LocalCFGError, LLMError)))
             return {
                 "success": False,
                 "message": f"CFG生成失败: {str(e)}",
-                "processing_time": time.time() - start_time
+                "processing_time": time.time() - start_time,
+                # 本地分析模式下代码有语法错误等，属于请求本身的问题
+                "invalid_input": isinstance(e, LocalCFGError)
             }
     
-    def _update_api_key(self, cfg: CFG, client_name: ClientEnum, api_key: str):
-        """更新API密钥"""
-        if client_name == ClientEnum.OPENAI:
-            cfg.llm.client.api_key = api_key
-        elif client_name == ClientEnum.DEEPSEEK:
-            if hasattr(cfg.llm, 'client_deepseek'):
-                cfg.llm.client_deepseek.api_key = api_key
+    async def _run_generation(self, request: CFGGenerationRequest, cache_key: str,
+                              flight: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        执行一次完整的生成（本地分析或大模型各阶段、解析、保存图、写缓存），进度事件发送给当前所有等待者
+        :param flight: 单飞记录，listeners为当前的等待者，llm_calls记录本次生成实际调用大模型的次数
+        """
+        with tracer.span("generation", cache_key=cache_key):
+            return await self._generate(request, cache_key, flight)
     
-    def _copy_required_files(self, work_dir: str):
-        """复制必要的文件到工作目录"""
-        # 获取项目根目录
-        project_root = os.path.join(os.path.dirname(__file__), '../../')
+    async def _generate(self, request: CFGGenerationRequest, cache_key: str,
+                        flight: Dict[str, Any]) -> Dict[str, Any]:
+        async def emit(event, data):
+            for listener in list(flight["listeners"]):
+                await listener(event, data)
+        
+        # Python代码可以不经过大模型，直接用ast构建控制流图
+        graph = None
+        if request.mode in (GenerationModeEnum.LOCAL, GenerationModeEnum.AUTO) and request.language == LanguageEnum.PYTHON:
+            try:
+                with tracer.span("stage.local") as span:
+                    local_start = time.perf_counter()
+                    graph = build_python_cfg(request.code)
+                    graph_code = graph.to_python()
+                    mode = GenerationModeEnum.LOCAL.value
+                    stage_duration.observe(time.perf_counter() - local_start, stage="local", language=request.language.value)
+                    span.set_attributes(nodes=len(graph.nodes), edges=len(graph.edges))
+            except LocalCFGError as e:
+                if request.mode == GenerationModeEnum.LOCAL:
+                    raise
+                logger.info("本地分析失败，回退到大模型: %s", e)
+        
+        failed_units = []
+        if graph is None:
+            graph_code = await self._run_llm_chain(request, emit, flight)
+            failed_units = flight["failed_units"]
+            # 融合阶段的代码只解析一次得到图的IR，图形数据和DOT源码都由它生成
+            with tracer.span("parse_graph", chars=len(graph_code)) as span:
+                graph = parse_graph(graph_code)
+                span.set_attributes(nodes=len(graph.nodes), edges=len(graph.edges))
+            mode = GenerationModeEnum.FAST.value if request.mode == GenerationModeEnum.FAST else GenerationModeEnum.LLM.value
         
-        # 复制prompt目录
-        prompt_src = os.path.join(project_root, 'prompt')
-        prompt_dst = os.path.join(work_dir, 'prompt')
-        if os.path.exists(prompt_src):
-            shutil.copytree(prompt_src, prompt_dst)
+        result = {
+            "success": True,
+            "message": "CFG生成成功",
+            "graph_code": graph_code,
+            "graph_data": graph.to_graph_data(),
+            "mode": mode
+        }
+        if failed_units:
+            # 部分函数生成失败：返回其余函数的图，但不写入结果缓存，下次请求重新生成
+            result.update(message=f"CFG部分生成成功，{len(failed_units)}个函数生成失败",
+                          partial=True, failed_units=failed_units)
+        await emit("graph", {"graph_data": result["graph_data"], "graph_code": graph_code})
         
-        # 复制config.yaml
-        config_src = os.path.join(project_root, 'config.yaml')
-        config_dst = os.path.join(work_dir, 'config.yaml')
-        if os.path.exists(config_src):
-            shutil.copy2(config_src, config_dst)
+        # 只保存图的IR，图片等格式在第一次请求 /api/cfg/graphs/{graph_id}.{格式} 时才渲染
+        result["graph_id"] = graph_store.save(graph, request.language.value)
+        result["image_url"] = graph_store.url(result["graph_id"], "png")
+        await emit("image", {"image_url": result["image_url"], "graph_id": result["graph_id"]})
         
-        # 复制util目录
-        util_src = os.path.join(project_root, 'util')
-        util_dst = os.path.join(work_dir, 'util')
-        if os.path.exists(util_src):
-            shutil.copytree(util_src, util_dst)
+        if self.cache is not None and not failed_units:
+            self.cache.put(cache_key, {
+                "graph_code": result["graph_code"],
+                "graph_data": result["graph_data"],
+                "graph_id": result["graph_id"],
+                "image_url": result["image_url"],
+                "mode": mode
+            })
+        
+        return result
     
-    def _parse_graph_data(self, graph_code: str) -> Dict[str, Any]:
-        """解析图形代码，提取节点和边的信息"""
-        try:
-            nodes = []
-            edges = []
-            node_ids = set()
-            
-            lines = graph_code.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('dot.node('):
-                    # 解析节点
-                    node_info = self._parse_node_line(line)
-                    if node_info:
-                        nodes.append(node_info)
-                        node_ids.add(node_info["id"])
-                elif line.startswith('dot.edge('):
-                    # 解析边
-                    edge_info = self._parse_edge_line(line)
-                    if edge_info:
-                        edges.append(edge_info)
-            
-            # 如果没有显式的节点定义，从边中推断节点
-            if not nodes:
-                for edge in edges:
-                    for node_id in [edge.get("source"), edge.get("target")]:
-                        if node_id and node_id not in node_ids:
-                            nodes.append({
-                                "id": node_id,
-                                "label": node_id
-                            })
-                            node_ids.add(node_id)
-            
-            # 确保边的格式正确（同时支持source/target和from/to）
-            formatted_edges = []
-            for edge in edges:
-                formatted_edge = {
-                    "source": edge.get("source", edge.get("from")),
-                    "target": edge.get("target", edge.get("to")),
-                    "from": edge.get("source", edge.get("from")),
-                    "to": edge.get("target", edge.get("to"))
-                }
-                formatted_edges.append(formatted_edge)
-            
-            return {
-                "nodes": nodes,
-                "edges": formatted_edges,
-                "type": "directed_graph"
-            }
-        except Exception as e:
-            return {
-                "error": f"解析图形数据失败: {str(e)}",
-                "nodes": [],
-                "edges": []
-            }
+    async def _run_llm_chain(self, request: CFGGenerationRequest, emit, flight: Dict[str, Any]) -> str:
+        """
+        调用大模型执行unit_chain的各个阶段，返回融合阶段生成的graphviz代码
+        实际调用大模型的次数（包括按函数切分、子图阶段按代码块拆分的调用，不包括阶段缓存命中）记入 flight["llm_calls"]，
+        按函数切分时生成失败的函数名记入 flight["failed_units"]
+        """
+        async def on_stage(stage, output, unit=None):
+            if stage == 'fusion':
+                return
+            data = {"stage": stage, "output": output}
+            if unit is not None:
+                # 按函数切分生成时，各函数的阶段分别推送
+                data["unit"] = unit
+            if stage == 'subgraph':
+                # 各代码块的子图已经是完整的dot.node/dot.edge语句，可以先画出未融合的局部图
+                data["graph_data"] = parse_graph(output).to_graph_data()
+            await emit("stage", data)
+        
+        # 创建CFG实例（LLM客户端由进程级注册表复用，自定义API密钥只作用于本次请求）
+        cfg = CFG(
+            language=request.language.value,
+            client_name=request.client_name.value,
+            model_name=request.model_name.value,
+            api_key=request.api_key,
+            stage_cache=self.stage_cache,
+            pipeline=cfg_pipeline(request),
+            few_shot=settings.FEW_SHOT_EXAMPLES,
+            chunk_functions=settings.CHUNK_FUNCTIONS,
+            chunk_concurrency=settings.CHUNK_CONCURRENCY,
+            parallel_subgraph=settings.PARALLEL_SUBGRAPH,
+            subgraph_concurrency=settings.SUBGRAPH_CONCURRENCY
+        )
+        
+        # 设置温度参数
+        if hasattr(cfg.llm, 'temperature'):
+            cfg.llm.temperature = request.temperature
+        
+        # 执行CFG生成 - 使用unit_chain方法
+        with tracer.span("llm_chain", pipeline=cfg_pipeline(request), provider=request.client_name.value) as span:
+            queued = time.perf_counter()
+            async with self._semaphore, self._provider_semaphore(request.client_name.value):
+                # 排队等待并发名额的时间
+                span.set_attribute("queue_ms", round((time.perf_counter() - queued) * 1000, 1))
+                try:
+                    fusion_code = await cfg.unit_chain(request.code, on_stage=on_stage)
+                finally:
+                    flight["llm_calls"] = getattr(cfg.llm, "usage", {}).get("calls", 0)
+        flight["failed_units"] = list(getattr(cfg, "failed_units", []))
+        return fusion_code
     
-    def _parse_node_line(self, line: str) -> Optional[Dict[str, str]]:
-        """解析节点行"""
-        try:
-            import re
-            # 支持多种节点定义格式
-            patterns = [
-                r"dot\.node\('([^']+)',\s*'([^']+)'",  # dot.node('id', 'label')
-                r"dot\.node\('([^']+)'\)",              # dot.node('id')
-                r"dot\.node\(\"([^\"]+)\",\s*\"([^\"]+)\"",  # 双引号版本
-                r"dot\.node\(\"([^\"]+)\"\)"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, line)
-                if match:
-                    node_id = match.group(1)
-                    label = match.group(2) if match.lastindex >= 2 else node_id
-                    return {
-                        "id": node_id,
-                        "label": label
-                    }
-        except Exception:
-            pass
-        return None
+    def _end_flight(self, flight_key: str, flight: Dict[str, Any]):
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+        # 每个被合并的请求都省下了和这次生成相同次数的大模型调用
+        self._flight_counters["llm_calls_saved"] += flight["llm_calls"] * flight["coalesced"]
+        # 没有等待者的任务被取消或出错时，取出异常避免"never retrieved"警告
+        if not flight["task"].cancelled():
+            flight["task"].exception()
     
-    def _parse_edge_line(self, line: str) -> Optional[Dict[str, str]]:
-        """解析边行"""
-        try:
-            import re
-            # 支持多种边定义格式
-            patterns = [
-                r"dot\.edge\('([^']+)',\s*'([^']+)'",  # dot.edge('from', 'to')
-                r"dot\.edge\(\"([^\"]+)\",\s*\"([^\"]+)\"",  # 双引号版本
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, line)
-                if match:
-                    return {
-                        "source": match.group(1),
-                        "target": match.group(2),
-                        "from": match.group(1),
-                        "to": match.group(2)
-                    }
-        except Exception:
-            pass
-        return None
+    def flight_stats(self) -> Dict[str, Any]:
+        """单飞合并的统计：独立生成次数、被合并的请求数、节省的大模型调用次数"""
+        return {**self._flight_counters, "in_flight": len(self._flights)}
+    
+    async def generate_batch(self, items: List[CFGGenerationRequest], concurrency: Optional[int] = None,
+                             on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        批量生成控制流图：相同的条目只生成一次，其余条目并发执行
+        :param items: 生成请求列表
+        :param concurrency: 同时执行的条目数，不超过 settings.BATCH_CONCURRENCY
+        :param on_result: 可选的异步回调，每个条目完成时以该条目的结果调用（按完成顺序）
+        """
+        start_time = time.time()
+        limit = min(concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY)
+        semaphore = asyncio.Semaphore(limit)
+        
+        # 按缓存键（和客户端类型）分组，组内只有第一个条目真正执行
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self._cache_key(item) + item.client_name.value, []).append(index)
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        
+        async def run(indices: List[int]):
+            async with semaphore:
+                result = await self.generate_cfg(items[indices[0]])
+            for index in indices:
+                results[index] = {**result, "index": index, "duplicate_of": indices[0] if index != indices[0] else None}
+                if on_result is not None:
+                    await on_result(results[index])
+        
+        await asyncio.gather(*(run(indices) for indices in groups.values()))
+        
+        succeeded = sum(1 for result in results if result["success"])
+        return {
+            "success": succeeded == len(items),
+            "total": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "deduplicated": len(items) - len(groups),
+            "results": results,
+            "processing_time": time.time() - start_time
+        }
+    
+    def _provider_semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._provider_semaphores:
+            self._provider_semaphores[provider] = asyncio.Semaphore(settings.MAX_CONCURRENT_GENERATIONS)
+        return self._provider_semaphores[provider]
+    
+    def _cache_key(self, request: CFGGenerationRequest) -> str:
+        """根据代码、语言、模型、温度、提示词版本和影响生成流程的配置计算缓存键"""
+        # 统一换行符并去掉行尾空白，避免无意义的差异导致缓存未命中
+        code = '\n'.join(line.rstrip() for line in request.code.replace('\r\n', '\n').strip('\n').split('\n'))
+        return make_cache_key(
+            code,
+            request.language.value,
+            request.model_name.value,
+            request.temperature,
+            prompt_registry.version(request.language.value),
+            *([request.mode.value, LOCAL_CFG_VERSION] if request.mode != GenerationModeEnum.LLM else []),
+            # 按函数切分生成的结果（每个函数一个子图簇）和整段生成的不同
+            *(['chunked'] if settings.CHUNK_FUNCTIONS and request.mode != GenerationModeEnum.LOCAL else []),
+            # 示例数不同，提示词也不同
+            *([f'few_shot={settings.FEW_SHOT_EXAMPLES}'] if settings.FEW_SHOT_EXAMPLES is not None and request.mode != GenerationModeEnum.LOCAL else []),
+            # 子图阶段整段调用一次和按代码块分别调用的输出不同（快速流程没有子图阶段）
+            *(['serial_subgraph'] if not settings.PARALLEL_SUBGRAPH and request.mode not in (GenerationModeEnum.LOCAL, GenerationModeEnum.FAST) else [])
+        )
+    
+    def _get_cached(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        # 图已被淘汰（或是按需渲染之前的旧格式结果）时视为未命中
+        if not graph_store.contains(cached.get("graph_id", "")):
+            self.cache.delete(cache_key)
+            return None
+        return cached
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = {"enabled": self.cache is not None}
+        if self.cache is not None:
+            stats.update(self.cache.stats())
+        stats["stages"] = self.stage_cache.stats() if self.stage_cache is not None else {}
+        return stats
+
+
+def api_key_hash(api_key: Optional[str]) -> str:
+    """自定义API密钥的哈希（与客户端注册表一样，不在内存中的键里保留密钥原文）"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+def cfg_pipeline(request: CFGGenerationRequest) -> str:
+    """请求对应的CFG生成流程"""
+    return 'fast' if request.mode == GenerationModeEnum.FAST else 'chain'
+
 
 # 创建全局服务实例
 cfg_service = CFGService()
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+按函数切分源代码
+大文件整段送进每个阶段会超出上下文、耗时随文件变长；切成顶层函数（方法）后各自走一遍生成流程，最后合并成一张图
+"""
+import ast
+import textwrap
+from dataclasses import dataclass
+from typing import List
+
+from services.code_structure import method_spans, StructureError
+
+
+@dataclass
+class CodeChunk:
+    name: str
+    code: str
+
+
+def _python_chunks(code: str) -> List[CodeChunk]:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+
+    def segment(node):
+        # 带上装饰器，类中的方法去掉缩进
+        start = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+        lines = code.splitlines()[start - 1:node.end_lineno]
+        return textwrap.dedent('\n'.join(lines))
+
+    chunks = []
+    main_parts = []
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            chunks.append(CodeChunk(stmt.name, segment(stmt)))
+        elif isinstance(stmt, ast.ClassDef):
+            chunks.extend(CodeChunk(f"{stmt.name}.{item.name}", segment(item)) for item in stmt.body
+                          if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)))
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            continue
+        elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+            # 模块文档字符串
+            continue
+        else:
+            main_parts.append(segment(stmt))
+    if main_parts:
+        chunks.append(CodeChunk("main", '\n'.join(main_parts)))
+    return chunks
+
+
+def _brace_chunks(code: str) -> List[CodeChunk]:
+    try:
+        spans = method_spans(code)
+    except StructureError:
+        return []
+    return [CodeChunk(name or f"method_{index}", code[start:end]) for index, (name, start, end) in enumerate(spans, 1)]
+
+
+def split_functions(code: str, language: str) -> List[CodeChunk]:
+    """
+    把源代码切分成顶层函数（类中的方法各算一个），Python的模块级语句合并为main
+    :return: 切分结果；代码无法解析或不含函数定义时返回空列表，调用方应整段处理
+    """
+    if language == 'Python':
+        chunks = _python_chunks(code)
+    else:
+        chunks = _brace_chunks(code)
+    # 同名函数（重载）加序号区分
+    seen = {}
+    for chunk in chunks:
+        seen[chunk.name] = seen.get(chunk.name, 0) + 1
+        if seen[chunk.name] > 1:
+            chunk.name = f"{chunk.name}_{seen[chunk.name]}"
+    return chunks
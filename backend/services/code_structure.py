@@ -0,0 +1,334 @@
+"""
+Java / C 代码结构的本地提取
+代替 get_structure 阶段的大模型调用：用识别注释、字符串和括号的扫描器找出方法中的 if / for / while / switch 块，
+输出和 structure_prompt.txt 示例相同的缩进文本，例如:
+
+    method_block
+        for_block_1
+            if_block_1
+        while_block_1
+
+规则与提示词一致：if / else if / else 整条链是一个if块；只有while、if、for、switch成块（do-while记为while块），
+try / catch / finally、synchronized和普通代码块不单独成块，其中的控制结构归入外层
+"""
+import re
+from typing import List, Optional, Tuple
+
+INDENT = "    "
+
+# 词法规则：注释、字符串（含Java文本块）、字符字面量、预处理指令会被跳过，其余切成标识符、数字和单个符号
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<skip>//[^\n]*|/\*.*?\*/|^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>"""(?:\\.|[^\\])*?"""|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<word>[A-Za-z_$][\w$]*)
+  | (?P<number>\d[\w.]*)
+  | (?P<arrow>->|::)
+  | (?P<symbol>\S)
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+# 成块的控制结构
+_BLOCK_KINDS = {"if": "if", "for": "for", "while": "while", "do": "while", "switch": "switch"}
+_TYPE_KEYWORDS = {"class", "interface", "enum", "record", "struct", "union"}
+_CLOSING = {"(": ")", "[": "]", "{": "}"}
+_CONTROL_KEYWORDS = {"if", "for", "while", "do", "switch", "try", "else", "synchronized"}
+
+
+class StructureError(ValueError):
+    """代码括号不匹配等原因无法提取结构"""
+
+
+class _Fragment(Exception):
+    pass
+
+
+class _Block:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.name = ""
+        self.children: List["_Block"] = []
+        # 方法块在token序列中的范围（声明开头到右花括号），用于按方法切分代码
+        self.first = 0
+        self.last = 0
+
+
+def _lex(code: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    tokens, spans = [], []
+    for match in _TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        if kind == "skip":
+            continue
+        tokens.append('""' if kind == "string" else match.group())
+        spans.append(match.span())
+    return tokens, spans
+
+
+def tokenize(code: str) -> List[str]:
+    """去掉注释和预处理指令，字符串字面量统一替换为 "" """
+    return _lex(code)[0]
+
+
+class _Scanner:
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Optional[str]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise StructureError("代码不完整")
+        self.pos += 1
+        return token
+
+    def skip_group(self):
+        """跳过以当前位置的 ( [ { 开始、到匹配的右括号结束的一组token"""
+        stack = [_CLOSING[self.next()]]
+        while stack:
+            token = self.next()
+            if token in _CLOSING:
+                stack.append(_CLOSING[token])
+            elif token in (")", "]", "}"):
+                if token != stack.pop():
+                    raise StructureError("括号不匹配")
+
+    # ---- 类型/文件层：寻找方法体 ----
+
+    def declarations(self, until: Optional[str], methods: List[_Block]):
+        """
+        扫描类体或文件顶层，方法（函数）体是紧跟在 ) 之后（可带 throws 子句、C的const等）的 { ... }
+        """
+        last_significant = None
+        # 当前声明的第一个token和最近一个参数列表前的名称
+        first, owner = self.pos, ""
+        while True:
+            token = self.peek()
+            if token is None:
+                if until is not None:
+                    raise StructureError("缺少右花括号")
+                return
+            if token == until:
+                self.pos += 1
+                return
+            if token == "{":
+                if last_significant == ")":
+                    method = _Block("method")
+                    method.name, method.first = owner, first
+                    self.pos += 1
+                    self.statements("}", method)
+                    method.last = self.pos - 1
+                    methods.append(method)
+                else:
+                    # 类、接口、枚举、命名空间、结构体或初始化块
+                    self.pos += 1
+                    self.declarations("}", methods)
+                last_significant = None
+                first = self.pos
+                continue
+            if token in ("(", "["):
+                if token == "(" and self.pos > first:
+                    owner = self.tokens[self.pos - 1]
+                self.skip_group()
+                last_significant = ")" if token == "(" else "]"
+                continue
+            if token in _CONTROL_KEYWORDS:
+                # 方法体之外出现控制语句，说明输入是没有方法定义的代码片段
+                raise _Fragment()
+            self.pos += 1
+            if token in (";", "}"):
+                first = self.pos
+            if token in (";", "=", ",", "}"):
+                last_significant = None
+            elif token == "throws" or (last_significant == ")" and token in ("const", "noexcept", "override")):
+                # throws A, B 之后仍然是方法体
+                while self.peek() not in (None, "{", ";"):
+                    self.pos += 1
+                last_significant = ")"
+            elif last_significant != ")" or token != ",":
+                last_significant = token
+
+    # ---- 方法体：语句层 ----
+
+    def statements(self, until: str, parent: _Block):
+        while True:
+            token = self.peek()
+            if token is None:
+                raise StructureError("缺少右花括号")
+            if token == until:
+                self.pos += 1
+                return
+            self.statement(parent)
+
+    def statement(self, parent: _Block):
+        token = self.peek()
+        if token == "{":
+            self.pos += 1
+            self.statements("}", parent)
+        elif token == ";":
+            self.pos += 1
+        elif token == "if":
+            block = _Block("if")
+            parent.children.append(block)
+            self.pos += 1
+            self.skip_group()
+            self.statement(block)
+            # else if / else 属于同一个if块
+            while self.peek() == "else":
+                self.pos += 1
+                if self.peek() == "if":
+                    self.pos += 1
+                    self.skip_group()
+                self.statement(block)
+        elif token in ("for", "while", "switch"):
+            block = _Block(_BLOCK_KINDS[token])
+            parent.children.append(block)
+            self.pos += 1
+            self.skip_group()
+            if token == "switch":
+                self.switch_body(block)
+            else:
+                self.statement(block)
+        elif token == "do":
+            block = _Block("while")
+            parent.children.append(block)
+            self.pos += 1
+            self.statement(block)
+            if self.peek() == "while":
+                self.pos += 1
+                self.skip_group()
+            if self.peek() == ";":
+                self.pos += 1
+        elif token == "try":
+            self.pos += 1
+            if self.peek() == "(":
+                # try-with-resources
+                self.skip_group()
+            self.statement(parent)
+            while self.peek() in ("catch", "finally"):
+                if self.next() == "catch":
+                    self.skip_group()
+                self.statement(parent)
+        elif token == "synchronized" and self.peek(1) == "(":
+            self.pos += 1
+            self.skip_group()
+            self.statement(parent)
+        elif token in _TYPE_KEYWORDS and self.peek(1) not in (None, "(", ".", "=", ";"):
+            # 局部类或结构体定义
+            self.simple_statement(parent, type_declaration=True)
+        elif token in ("case", "default") and self.peek(1) != ".":
+            self.case_label()
+        elif self.peek(1) == ":" and re.match(r"[A-Za-z_$]", token) and token not in ("else",):
+            # 语句标签 outer: for (...)
+            self.pos += 2
+        else:
+            self.simple_statement(parent)
+
+    def switch_body(self, block: _Block):
+        if self.peek() != "{":
+            raise StructureError("switch 缺少花括号")
+        self.pos += 1
+        self.statements("}", block)
+
+    def case_label(self):
+        """case X: / default: / case X -> ..."""
+        self.pos += 1
+        while True:
+            token = self.peek()
+            if token is None:
+                raise StructureError("case 标签不完整")
+            if token in ("(", "[", "{"):
+                self.skip_group()
+                continue
+            self.pos += 1
+            if token in (":", "->"):
+                return
+
+    def simple_statement(self, parent: _Block, type_declaration: bool = False):
+        """
+        普通语句：到顶层的 ; 为止；中间出现的 { } 是lambda、匿名类或数组初始化，其中的控制结构也归入当前块
+        """
+        while True:
+            token = self.peek()
+            if token is None or token == "}":
+                return
+            if token == "{":
+                if type_declaration:
+                    methods: List[_Block] = []
+                    self.pos += 1
+                    self.declarations("}", methods)
+                    for method in methods:
+                        parent.children.extend(method.children)
+                    if self.peek() == ";":
+                        self.pos += 1
+                    return
+                if self.tokens[self.pos - 1] in ("->", ")"):
+                    # lambda 或匿名类的方法体
+                    self.pos += 1
+                    self.statements("}", parent)
+                else:
+                    self.skip_group()
+                continue
+            if token in ("(", "["):
+                self.skip_group()
+                continue
+            self.pos += 1
+            if token == ";":
+                return
+
+
+def _number(block: _Block, counters: dict):
+    for child in block.children:
+        counters[child.kind] = counters.get(child.kind, 0) + 1
+        child.name = f"{child.kind}_block_{counters[child.kind]}"
+        _number(child, counters)
+
+
+def _render(block: _Block, depth: int, lines: List[str]):
+    for child in block.children:
+        lines.append(INDENT * depth + child.name)
+        _render(child, depth + 1, lines)
+
+
+def method_spans(code: str) -> List[Tuple[str, int, int]]:
+    """
+    找出Java / C代码中的方法（函数）定义
+    :return: [(方法名, 起始偏移, 结束偏移)]，范围从声明开头（含修饰符和注解）到右花括号；代码片段中没有方法时返回空列表
+    :raise StructureError: 括号不匹配等无法可靠分析的情况
+    """
+    tokens, spans = _lex(code)
+    methods: List[_Block] = []
+    try:
+        _Scanner(tokens).declarations(None, methods)
+    except _Fragment:
+        return []
+    return [(method.name, spans[method.first][0], spans[method.last][1]) for method in methods]
+
+
+def extract_structure(code: str) -> str:
+    """
+    提取Java / C代码的块结构，返回structure阶段格式的文本
+    代码中没有方法定义时（只有方法体的片段），整段代码按方法体处理
+    :raise StructureError: 括号不匹配等无法可靠分析的情况
+    """
+    tokens = tokenize(code)
+    methods: List[_Block] = []
+    try:
+        _Scanner(tokens).declarations(None, methods)
+    except _Fragment:
+        methods = []
+    if not methods:
+        root = _Block("method")
+        scanner = _Scanner(tokens + ["}"])
+        scanner.statements("}", root)
+        methods = [root]
+
+    # 多个方法时所有块都归入同一个method_block，编号按出现顺序递增
+    root = _Block("method")
+    for method in methods:
+        root.children.extend(method.children)
+    _number(root, {})
+    lines = ["method_block"]
+    _render(root, 1, lines)
+    return '\n'.join(lines)
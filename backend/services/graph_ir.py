@@ -0,0 +1,621 @@
+"""
+流程图的中间表示(IR)
+
+融合阶段的输出是一段调用graphviz库的Python代码（dot.node / dot.edge / dot.subgraph ...）。
+这里用单遍扫描（预编译的正则逐条匹配语句和参数）把这些调用解析成节点、边、子图簇，不执行任何代码，可以安全处理大模型的输出；
+之后DOT源码、前端使用的graph_data和渲染都只以这份IR为准。
+"""
+import ast
+import itertools
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# 词法规则：字符串字面量（含三引号和前缀），单行字符串用展开的循环匹配，不逐个字符尝试分支
+_STRING = r"""(?:[rRuUbBfF]{1,2})?(?:'''(?:[^\\]|\\.)*?'''|\"\"\"(?:[^\\]|\\.)*?\"\"\"|'[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*")"""
+# 空白和注释
+_SKIP = r"(?:\s|\#[^\n]*)*"
+
+# 不带前缀的单行字符串
+_PLAIN_STRING = r"""'[^'\\\n]*(?:\\.[^'\\\n]*)*'|"[^"\\\n]*(?:\\.[^"\\\n]*)*\""""
+# 语句开头。第一种是融合阶段输出中最常见的、参数都是简单字符串的 x.node('A', 'label') / x.edge('A', 'B', label='...')，
+# 整条语句一次匹配完（参数之间可以换行）；其余形式（with x.subgraph( / x.node( / x = Digraph(）只匹配到左括号，参数再逐个解析
+_STATEMENT_PATTERN = re.compile(
+    r"^[ \t]*(?:"
+    r"(?P<simple_target>[A-Za-z_]\w*)\.(?P<simple_method>node|edge)\(\s*(?P<a1>" + _PLAIN_STRING + r")\s*"
+    r"(?:,\s*(?P<a2>" + _PLAIN_STRING + r")\s*)?(?:,\s*(?P<a3>" + _PLAIN_STRING + r")\s*)?"
+    r"(?P<kwargs>(?:,\s*[A-Za-z_]\w*\s*=\s*(?:" + _PLAIN_STRING + r")\s*)*),?\s*\)"
+    r"|(?:(?P<with>with)[ \t]+)?(?P<target>[A-Za-z_]\w*)[ \t]*"
+    r"(?:\.[ \t]*(?P<method>node|edges|edge|attr|subgraph)|=[ \t]*(?:[A-Za-z_]\w*\.)*(?P<cls>Digraph|Graph))[ \t]*\("
+    r")",
+    re.MULTILINE
+)
+_PLAIN_KWARG_PATTERN = re.compile(r"([A-Za-z_]\w*)\s*=\s*(" + _PLAIN_STRING + r")")
+# 一个参数：可选的关键字，加上字符串（相邻的自动拼接）、数字、名称或容器的开始符号
+_ARG_PATTERN = re.compile(
+    _SKIP + r"(?:(?P<key>[A-Za-z_]\w*)\s*=(?!=)" + _SKIP + r")?"
+    r"(?:(?P<str>(?P<first>" + _STRING + r")(?:" + _SKIP + _STRING + r")*)|(?P<num>-?\d+(?:\.\d*)?)"
+    r"|(?P<name>[A-Za-z_]\w*)|(?P<open>[\[\({]))"
+)
+_SEPARATOR_PATTERN = re.compile(_SKIP + r"(?P<sep>[,:\)\]\}])")
+_CLOSE_PATTERN = re.compile(_SKIP + r"(?P<close>[\)\]\}])")
+_AS_PATTERN = re.compile(r"[ \t]*as[ \t]+(?P<alias>[A-Za-z_]\w*)[ \t]*:")
+_STRING_PATTERN = re.compile(_STRING)
+# 快速路径处理的语句开头和参数之间的分隔（其他写法交给通用解析）
+_PLAIN_CALLS = ("dot.edge('", 'dot.edge("', "dot.node('", 'dot.node("')
+_PLAIN_SEPARATORS = {", ", ","}
+_PLAIN_LABEL_SEPARATORS = {", label=", ",label=", ", label = "}
+_CLOSING = {"[": "]", "(": ")", "{": "}"}
+
+_UNESCAPED_QUOTE = re.compile(r'(?<!\\)"')
+
+
+def quote(text: Any) -> str:
+    """转成DOT的双引号字符串，和graphviz库一样保留 \\n 等转义序列"""
+    text = _UNESCAPED_QUOTE.sub(r'\\"', str(text))
+    if (len(text) - len(text.rstrip('\\'))) % 2 == 1:
+        text += '\\'
+    return f'"{text}"'
+
+
+def _attr_list(attrs: Dict[str, str]) -> str:
+    if not attrs:
+        return ''
+    return ' [' + ' '.join(f'{key}={quote(value)}' for key, value in attrs.items()) + ']'
+
+
+@dataclass(slots=True)
+class Node:
+    id: str
+    label: str
+    attrs: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Edge:
+    source: str
+    target: str
+    label: Optional[str] = None
+    attrs: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Cluster:
+    name: str
+    label: Optional[str] = None
+    node_ids: List[str] = field(default_factory=list)
+    attrs: Dict[str, str] = field(default_factory=dict)
+    # 外层子图簇的名称，None表示直接在主图中
+    parent: Optional[str] = None
+
+
+@dataclass
+class GraphIR:
+    nodes: Dict[str, Node] = field(default_factory=dict)
+    edges: List[Edge] = field(default_factory=list)
+    clusters: List[Cluster] = field(default_factory=list)
+    graph_attrs: Dict[str, str] = field(default_factory=dict)
+    node_attrs: Dict[str, str] = field(default_factory=lambda: {"fontname": "SimSun"})
+    edge_attrs: Dict[str, str] = field(default_factory=dict)
+
+    def add_node(self, node_id: str, label: Optional[str] = None, attrs: Optional[Dict[str, str]] = None) -> Node:
+        """重复定义的节点和DOT语义一致：保留原位置，合并属性"""
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = Node(node_id, label if label is not None else node_id)
+        elif label is not None:
+            node.label = label
+        if attrs:
+            node.attrs.update(attrs)
+        return node
+
+    def add_edge(self, source: str, target: str, label: Optional[str] = None,
+                 attrs: Optional[Dict[str, str]] = None) -> Edge:
+        edge = Edge(source, target, label, dict(attrs or {}))
+        self.edges.append(edge)
+        return edge
+
+    def complete(self) -> "GraphIR":
+        """补全只出现在边里、没有显式定义的节点"""
+        nodes = self.nodes
+        for edge in self.edges:
+            if edge.source not in nodes:
+                nodes[edge.source] = Node(edge.source, edge.source)
+            if edge.target not in nodes:
+                nodes[edge.target] = Node(edge.target, edge.target)
+        return self
+
+    @classmethod
+    def combine(cls, parts: List[Tuple[str, "GraphIR"]]) -> "GraphIR":
+        """
+        把各函数单独生成的图合并成一张图，每个函数一个子图簇
+        节点ID加上函数序号前缀避免冲突；各部分自己的子图簇嵌套在函数子图簇中，
+        函数子图簇只直接包含不属于这些子图簇的节点
+        :param parts: [(函数名, 图)]
+        """
+        graph = cls()
+        for index, (name, part) in enumerate(parts, 1):
+            prefix = f"F{index}_"
+            graph.graph_attrs = {**part.graph_attrs, **graph.graph_attrs}
+            cluster = Cluster(f"cluster_{name}", label=name)
+            graph.clusters.append(cluster)
+            part_clustered = {node_id for c in part.clusters for node_id in c.node_ids}
+            part_names = {c.name for c in part.clusters}
+            for node in part.nodes.values():
+                graph.nodes[prefix + node.id] = Node(prefix + node.id, node.label, dict(node.attrs))
+                if node.id not in part_clustered:
+                    cluster.node_ids.append(prefix + node.id)
+            graph.edges.extend(Edge(prefix + e.source, prefix + e.target, e.label, dict(e.attrs)) for e in part.edges)
+            graph.clusters.extend(
+                Cluster(f"{c.name}_{index}", c.label, [prefix + i for i in c.node_ids], dict(c.attrs),
+                        parent=f"{c.parent}_{index}" if c.parent in part_names else cluster.name)
+                for c in part.clusters)
+        return graph
+
+    def cluster_tree(self) -> Dict[Optional[str], List[Cluster]]:
+        """外层子图簇名称 -> 直接嵌套在其中的子图簇（None为主图）；外层不存在的子图簇放在主图中"""
+        names = {cluster.name for cluster in self.clusters}
+        tree: Dict[Optional[str], List[Cluster]] = {}
+        for cluster in self.clusters:
+            parent = cluster.parent if cluster.parent in names and cluster.parent != cluster.name else None
+            tree.setdefault(parent, []).append(cluster)
+        return tree
+
+    def to_dot(self) -> str:
+        lines = ['digraph {']
+        for key, value in self.graph_attrs.items():
+            lines.append(f'\t{key}={quote(value)}')
+        if self.node_attrs:
+            lines.append(f'\tnode{_attr_list(self.node_attrs)}')
+        if self.edge_attrs:
+            lines.append(f'\tedge{_attr_list(self.edge_attrs)}')
+        clustered = set()
+        tree = self.cluster_tree()
+        visited = set()
+
+        def add_cluster(cluster, depth):
+            if cluster.name in visited:
+                return
+            visited.add(cluster.name)
+            indent = '\t' * depth
+            lines.append(f'{indent}subgraph {quote(cluster.name)} {{')
+            if cluster.label is not None:
+                lines.append(f'{indent}\tlabel={quote(cluster.label)}')
+            for key, value in cluster.attrs.items():
+                lines.append(f'{indent}\t{key}={quote(value)}')
+            for node_id in cluster.node_ids:
+                node = self.nodes.get(node_id)
+                if node is not None and node_id not in clustered:
+                    clustered.add(node_id)
+                    lines.append(f'{indent}\t{quote(node.id)}{_attr_list({"label": node.label, **node.attrs})}')
+            for child in tree.get(cluster.name, []):
+                add_cluster(child, depth + 1)
+            lines.append(f'{indent}}}')
+
+        # 外层成环的子图簇无法从主图到达，放在主图中
+        for cluster in tree.get(None, []) + self.clusters:
+            add_cluster(cluster, 1)
+        for node in self.nodes.values():
+            if node.id not in clustered:
+                lines.append(f'\t{quote(node.id)}{_attr_list({"label": node.label, **node.attrs})}')
+        for edge in self.edges:
+            attrs = {"label": edge.label, **edge.attrs} if edge.label is not None else edge.attrs
+            lines.append(f'\t{quote(edge.source)} -> {quote(edge.target)}{_attr_list(attrs)}')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def to_python(self) -> str:
+        """生成和融合阶段输出形式相同的graphviz代码（可以再用parse_graph解析回来）"""
+        lines = ["from graphviz import Digraph", "dot = Digraph()"]
+        for key, value in self.graph_attrs.items():
+            lines.append(f"dot.attr({key}={str(value)!r})")
+        if self.node_attrs:
+            lines.append("dot.attr('node', " + ', '.join(f"{k}={str(v)!r}" for k, v in self.node_attrs.items()) + ")")
+        if self.edge_attrs:
+            lines.append("dot.attr('edge', " + ', '.join(f"{k}={str(v)!r}" for k, v in self.edge_attrs.items()) + ")")
+
+        def node_line(target, node):
+            extra = ''.join(f", {k}={str(v)!r}" for k, v in node.attrs.items())
+            return f"{target}.node({node.id!r}, {node.label!r}{extra})"
+
+        clustered = set()
+        tree = self.cluster_tree()
+        visited = set()
+
+        def add_cluster(cluster, parent, depth):
+            # 嵌套的子图簇用 c、c1、c2... 作为变量名
+            if cluster.name in visited:
+                return
+            visited.add(cluster.name)
+            indent, variable = "    " * depth, f"c{depth}" if depth else "c"
+            lines.append(f"{indent}with {parent}.subgraph(name={cluster.name!r}) as {variable}:")
+            if cluster.label is not None:
+                lines.append(f"{indent}    {variable}.attr(label={cluster.label!r})")
+            for node_id in cluster.node_ids:
+                if node_id in self.nodes and node_id not in clustered:
+                    clustered.add(node_id)
+                    lines.append(f"{indent}    " + node_line(variable, self.nodes[node_id]))
+            for child in tree.get(cluster.name, []):
+                add_cluster(child, variable, depth + 1)
+
+        for cluster in tree.get(None, []) + self.clusters:
+            add_cluster(cluster, "dot", 0)
+        for node in self.nodes.values():
+            if node.id not in clustered:
+                lines.append(node_line("dot", node))
+        for edge in self.edges:
+            extra = f", label={edge.label!r}" if edge.label is not None else ''
+            extra += ''.join(f", {k}={str(v)!r}" for k, v in edge.attrs.items())
+            lines.append(f"dot.edge({edge.source!r}, {edge.target!r}{extra})")
+        lines.append("dot.render('graph', format='png', view=False)")
+        return '\n'.join(lines)
+
+    def to_graph_data(self) -> Dict[str, Any]:
+        """前端使用的图形数据（边同时提供source/target和from/to）"""
+        nodes = []
+        for node in self.nodes.values():
+            item = {"id": node.id, "label": node.label}
+            if node.attrs:
+                item["attrs"] = dict(node.attrs)
+            nodes.append(item)
+        edges = []
+        for edge in self.edges:
+            item = {"source": edge.source, "target": edge.target, "from": edge.source, "to": edge.target}
+            if edge.label is not None:
+                item["label"] = edge.label
+            if edge.attrs:
+                item["attrs"] = dict(edge.attrs)
+            edges.append(item)
+        data = {"nodes": nodes, "edges": edges, "type": "directed_graph"}
+        if self.clusters:
+            data["clusters"] = [
+                {"name": c.name, "label": c.label, "nodes": list(c.node_ids),
+                 **({"parent": c.parent} if c.parent is not None else {})} for c in self.clusters
+            ]
+        return data
+
+    def to_dict(self) -> Dict[str, Any]:
+        """紧凑的可序列化形式，用于缓存"""
+        return {
+            "nodes": [[n.id, n.label, n.attrs] for n in self.nodes.values()],
+            "edges": [[e.source, e.target, e.label, e.attrs] for e in self.edges],
+            "clusters": [[c.name, c.label, c.node_ids, c.attrs, c.parent] for c in self.clusters],
+            "graph_attrs": self.graph_attrs,
+            "node_attrs": self.node_attrs,
+            "edge_attrs": self.edge_attrs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GraphIR":
+        graph = cls(
+            graph_attrs=dict(data.get("graph_attrs", {})),
+            node_attrs=dict(data.get("node_attrs", {})),
+            edge_attrs=dict(data.get("edge_attrs", {})),
+        )
+        for node_id, label, attrs in data.get("nodes", []):
+            graph.nodes[node_id] = Node(node_id, label, dict(attrs))
+        graph.edges = [Edge(s, t, label, dict(attrs)) for s, t, label, attrs in data.get("edges", [])]
+        # 之前缓存的IR中子图簇没有外层名称
+        graph.clusters = [Cluster(item[0], item[1], list(item[2]), dict(item[3]), item[4] if len(item) > 4 else None)
+                          for item in data.get("clusters", [])]
+        return graph
+
+
+class GraphSyntaxError(ValueError):
+    """无法解析的语句"""
+
+
+class _Name:
+    """参数中出现的变量名（无法静态求值）"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+_CONSTANTS = {"None": None, "True": "true", "False": "false"}
+_SIMPLE_ESCAPES = {"\\": "\\", "'": "'", '"': '"', "n": "\n", "t": "\t", "r": "\r", "\n": ""}
+_ESCAPE_PATTERN = re.compile(r"\\(.)", re.DOTALL)
+# 八进制、\x、\u、\N{...} 等需要完整求值的转义
+_COMPLEX_ESCAPE = re.compile(r"\\[0-7xuUNabfv]")
+
+
+def _unescape(match) -> str:
+    """未知的转义和Python一样保留反斜杠"""
+    return _SIMPLE_ESCAPES.get(match.group(1), match.group())
+
+
+def _decode_string(token: str) -> str:
+    """字符串字面量求值：没有前缀时直接去掉引号、替换简单转义，否则交给ast.literal_eval（不执行代码）"""
+    first = token[0]
+    if first in "'\"" and not token.startswith(("'''", '"""')):
+        body = token[1:-1]
+        if "\\" not in body:
+            return body
+        if not _COMPLEX_ESCAPE.search(body):
+            # 只有 \n \\ \" 这类单字符转义（融合阶段输出中常见）
+            return _ESCAPE_PATTERN.sub(_unescape, body)
+    try:
+        value = ast.literal_eval(token)
+    except (ValueError, SyntaxError):
+        # f-string等无法静态求值的字符串，去掉前缀和引号后保留原文
+        body = token.lstrip("rRuUbBfF")
+        quote_len = 3 if body[:3] in ("'''", '"""') else 1
+        return body[quote_len:-quote_len]
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else str(value)
+
+
+class _Parser:
+    """
+    从头到尾扫描一遍源码，只识别 <变量>.node/edge/edges/attr/subgraph(...)、
+    with <变量>.subgraph(...) as <变量>:、<变量> = Digraph(...)，其余语句（import、render等）直接跳过；
+    单条语句出错时从下一条语句继续，参数可以跨多行
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.graph = GraphIR()
+        # 变量名 -> 所属子图簇（None表示主图）
+        self.scopes: Dict[str, Optional[Cluster]] = {"dot": None}
+        self.errors = 0
+
+    def parse(self) -> GraphIR:
+        source = self.source
+        lines = source.split('\n')
+        nodes = self.graph.nodes
+        edges = self.graph.edges
+        # 各行的起始位置，第一次需要通用解析时才计算
+        starts = None
+        # dot 是否仍指向主图（被重新赋值成子图后不再走快速路径）
+        main = True
+        match_statement = _STATEMENT_PATTERN.match
+        numbered = enumerate(lines)
+        for index, line in numbered:
+            # 快速路径：融合阶段输出的绝大多数语句是顶格的单行
+            # dot.node('A', 'label') / dot.node('A') / dot.edge('A', 'B') / dot.edge('A', 'B', label='...')，
+            # 参数都是不含转义的字符串，按引号切分直接处理，不经过正则；其他形式交给下面的通用解析
+            if main and line.startswith(_PLAIN_CALLS) and '\\' not in line:
+                # 按引号切分：['dot.edge(', 'A', ', ', 'B', ')'] / [..., ', label=', '...', ')'] / ['dot.node(', 'A', ')']
+                parts = line.split(line[9])
+                count = len(parts)
+                if count == 5:
+                    if parts[4] == ')' and parts[2] in _PLAIN_SEPARATORS:
+                        if line[4] == 'e':
+                            edges.append(Edge(parts[1], parts[3]))
+                        else:
+                            node = nodes.get(parts[1])
+                            if node is None:
+                                nodes[parts[1]] = Node(parts[1], parts[3])
+                            else:
+                                node.label = parts[3]
+                        continue
+                elif count == 7:
+                    if (parts[6] == ')' and line[4] == 'e' and parts[2] in _PLAIN_SEPARATORS
+                            and parts[4] in _PLAIN_LABEL_SEPARATORS):
+                        edges.append(Edge(parts[1], parts[3], parts[5]))
+                        continue
+                elif count == 3:
+                    if parts[2] == ')' and line[4] == 'n':
+                        if parts[1] not in nodes:
+                            nodes[parts[1]] = Node(parts[1], parts[1])
+                        continue
+            if starts is None:
+                starts = list(itertools.accumulate(map(len, lines), initial=0))
+            match = match_statement(source, starts[index] + index)
+            if match is not None:
+                end = self.statement(match)
+                # 跳过跨行语句的其余各行（第 i 行的起始位置为 starts[i] + i）
+                while index + 1 < len(lines) and starts[index + 1] + index + 1 < end:
+                    index, _ = next(numbered)
+                main = self.scopes.get("dot") is None
+        return self.graph.complete()
+
+    def statement(self, match) -> int:
+        """处理 _STATEMENT_PATTERN 匹配到的一条语句，返回语句结束的位置"""
+        pos = match.end()
+        method = match.group("simple_method")
+        if method is not None:
+            self.simple_call(match, method)
+            return pos
+        try:
+            args, kwargs, pos = self.arguments(pos)
+            if match.group("cls"):
+                self.assignment(match.group("target"), args, kwargs)
+            elif match.group("with"):
+                pos = self.with_statement(match.group("target"), match.group("method"), args, kwargs, pos)
+            else:
+                self.call(match.group("target"), match.group("method"), args, kwargs)
+        except GraphSyntaxError:
+            self.errors += 1
+            pos = match.end()
+        return pos
+
+    def simple_call(self, match, method):
+        """只含简单字符串参数的 node/edge 调用，不经过通用的参数解析"""
+        target, a1, a2, a3, extra = match.group("simple_target", "a1", "a2", "a3", "kwargs")
+        kwargs = {key: _decode_string(value) for key, value in _PLAIN_KWARG_PATTERN.findall(extra)} if extra else {}
+        if method == "node":
+            label = _decode_string(a2) if a2 is not None else kwargs.pop("label", None)
+            node_id = _decode_string(a1)
+            self.graph.add_node(node_id, label, kwargs)
+            cluster = self.scopes.get(target)
+            if cluster is not None and node_id not in cluster.node_ids:
+                cluster.node_ids.append(node_id)
+        elif a2 is None:
+            self.errors += 1
+        else:
+            label = _decode_string(a3) if a3 is not None else kwargs.pop("label", None)
+            self.graph.edges.append(Edge(_decode_string(a1), _decode_string(a2), label, kwargs))
+
+    def arguments(self, pos):
+        """解析 ( 之后的参数列表，返回 (位置参数, 关键字参数, 结束位置)"""
+        args, kwargs = [], {}
+        source = self.source
+        close = _CLOSE_PATTERN.match(source, pos)
+        if close is not None:
+            if close.group("close") != ")":
+                raise GraphSyntaxError("参数列表未闭合")
+            return args, kwargs, close.end()
+        while True:
+            match = _ARG_PATTERN.match(source, pos)
+            if match is None:
+                raise GraphSyntaxError(f"无法识别的参数: {source[pos:pos + 20]!r}")
+            value, pos = self.value(match)
+            key = match.group("key")
+            if key is None:
+                args.append(value)
+            else:
+                kwargs[key] = value
+            sep = _SEPARATOR_PATTERN.match(source, pos)
+            if sep is None or sep.group("sep") not in ",)":
+                raise GraphSyntaxError("参数列表未闭合")
+            pos = sep.end()
+            if sep.group("sep") == ")":
+                return args, kwargs, pos
+            close = _CLOSE_PATTERN.match(source, pos)
+            if close is not None:
+                # 末尾多余的逗号
+                if close.group("close") != ")":
+                    raise GraphSyntaxError("参数列表未闭合")
+                return args, kwargs, close.end()
+
+    def value(self, match):
+        """根据 _ARG_PATTERN 的匹配结果求值，返回 (值, 结束位置)"""
+        text = match.group("str")
+        if text is not None:
+            if match.end("first") == match.end("str"):
+                return _decode_string(text), match.end()
+            return ''.join(_decode_string(m.group()) for m in _STRING_PATTERN.finditer(text)), match.end()
+        text = match.group("num")
+        if text is not None:
+            return text, match.end()
+        text = match.group("name")
+        if text is not None:
+            return (_CONSTANTS[text] if text in _CONSTANTS else _Name(text)), match.end()
+        opening = match.group("open")
+        return self.container(opening, match.end())
+
+    def container(self, opening, pos):
+        """列表、元组或字典"""
+        closing = _CLOSING[opening]
+        source = self.source
+        items = {} if opening == "{" else []
+        while True:
+            close = _CLOSE_PATTERN.match(source, pos)
+            if close is not None:
+                if close.group("close") != closing:
+                    raise GraphSyntaxError("括号不匹配")
+                return (items if opening == "{" else tuple(items)), close.end()
+            match = _ARG_PATTERN.match(source, pos)
+            if match is None or match.group("key") is not None:
+                raise GraphSyntaxError("无法识别的元素")
+            value, pos = self.value(match)
+            sep = _SEPARATOR_PATTERN.match(source, pos)
+            if sep is None:
+                raise GraphSyntaxError("括号未闭合")
+            if opening == "{":
+                if sep.group("sep") != ":":
+                    raise GraphSyntaxError("字典缺少冒号")
+                match = _ARG_PATTERN.match(source, sep.end())
+                if match is None or match.group("key") is not None:
+                    raise GraphSyntaxError("无法识别的字典值")
+                items[str(value)], pos = self.value(match)
+                sep = _SEPARATOR_PATTERN.match(source, pos)
+                if sep is None:
+                    raise GraphSyntaxError("括号未闭合")
+            else:
+                items.append(value)
+            pos = sep.end()
+            if sep.group("sep") == closing:
+                return (items if opening == "{" else tuple(items)), pos
+            if sep.group("sep") != ",":
+                raise GraphSyntaxError("括号不匹配")
+
+    def assignment(self, variable, args, kwargs):
+        """c = Digraph(name='cluster_x') / c = graphviz.Digraph(...)"""
+        name = kwargs.get("name", args[0] if args else None)
+        if variable == "dot" or name is None:
+            self.scopes[variable] = None
+        else:
+            self.scopes[variable] = Cluster(str(name))
+
+    def with_statement(self, parent, method, args, kwargs, pos):
+        """with dot.subgraph(name='cluster_x') as c:"""
+        if method != "subgraph":
+            raise GraphSyntaxError("with 语句只支持 subgraph")
+        cluster = Cluster(str(kwargs.get("name", args[0] if args else f"cluster_{len(self.graph.clusters)}")))
+        if isinstance(kwargs.get("graph_attr"), dict):
+            graph_attr = dict(kwargs["graph_attr"])
+            label = graph_attr.pop("label", None)
+            cluster.label = None if label is None else str(label)
+            cluster.attrs.update(self.attrs(graph_attr))
+        if self.scopes.get(parent) is not None:
+            # with c.subgraph(...) as c2: 嵌套的子图簇
+            cluster.parent = self.scopes[parent].name
+        self.graph.clusters.append(cluster)
+        alias = _AS_PATTERN.match(self.source, pos)
+        if alias is not None:
+            self.scopes[alias.group("alias")] = cluster
+            pos = alias.end()
+        if parent not in self.scopes:
+            self.scopes[parent] = None
+        return pos
+
+    def call(self, target, method, args, kwargs):
+        cluster = self.scopes.get(target)
+        if method == "node":
+            if not args and "name" not in kwargs:
+                raise GraphSyntaxError("node 缺少名称")
+            node_id = str(kwargs.pop("name", args[0] if args else None))
+            label = kwargs.pop("label", args[1] if len(args) > 1 else None)
+            self.graph.add_node(node_id, None if label is None else str(label), self.attrs(kwargs))
+            if cluster is not None and node_id not in cluster.node_ids:
+                cluster.node_ids.append(node_id)
+        elif method == "edge":
+            tail = kwargs.pop("tail_name", args[0] if args else None)
+            head = kwargs.pop("head_name", args[1] if len(args) > 1 else None)
+            if tail is None or head is None:
+                raise GraphSyntaxError("edge 缺少端点")
+            label = kwargs.pop("label", args[2] if len(args) > 2 else None)
+            self.graph.add_edge(str(tail), str(head), None if label is None else str(label), self.attrs(kwargs))
+        elif method == "edges":
+            for pair in (args[0] if args else ()):
+                if isinstance(pair, str) and len(pair) == 2:
+                    pair = (pair[0], pair[1])
+                if isinstance(pair, tuple) and len(pair) == 2:
+                    self.graph.add_edge(str(pair[0]), str(pair[1]))
+        elif method == "attr":
+            kind = args[0] if args else None
+            attrs = self.attrs(kwargs)
+            if kind == "node":
+                if cluster is None:
+                    self.graph.node_attrs.update(attrs)
+            elif kind == "edge":
+                if cluster is None:
+                    self.graph.edge_attrs.update(attrs)
+            elif cluster is not None:
+                if "label" in attrs:
+                    cluster.label = attrs.pop("label")
+                cluster.attrs.update(attrs)
+            else:
+                self.graph.graph_attrs.update(attrs)
+        elif method == "subgraph":
+            # dot.subgraph(c)：c 是之前用 Digraph(name=...) 创建的子图
+            if args and isinstance(args[0], _Name):
+                sub = self.scopes.get(args[0].name)
+                if sub is not None and sub not in self.graph.clusters:
+                    if cluster is not None:
+                        sub.parent = cluster.name
+                    self.graph.clusters.append(sub)
+
+    @staticmethod
+    def attrs(kwargs):
+        return {key: str(value) for key, value in kwargs.items()
+                if value is not None and not isinstance(value, (_Name, tuple, dict))}
+
+
+def parse_graph(graph_code: str) -> GraphIR:
+    """把融合阶段生成的graphviz代码解析为GraphIR"""
+    return _Parser(graph_code).parse()
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from core.metrics import stage_duration
+from services.artifact_store import artifact_store
+from services.graph_ir import GraphIR
+from services.renderer import graph_renderer, RENDER_FORMATS
+from services.result_cache import ResultCache
+from util.tracing import tracer
+
+# 可以获取的格式：png/svg需要dot布局，dot/json直接由图的IR生成
+GRAPH_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "dot": "text/vnd.graphviz",
+    "json": "application/json",
+}
+
+
+def graph_id_of(graph: GraphIR) -> str:
+    """图的ID：IR紧凑形式的内容哈希，相同的图ID相同"""
+    payload = json.dumps(graph.to_dict(), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class GraphStore:
+    """
+    生成结果的图按ID保存IR，各种格式在第一次请求时才生成
+    png/svg渲染后存入图片存储（按内容哈希命名），ID到图片的对应关系和IR一起保存；同一张图同一格式的并发请求只渲染一次
+    """
+
+    def __init__(self, store: ResultCache, url_prefix: str = "/api/cfg/graphs", worker_threads: int = 4):
+        self.store = store
+        self.url_prefix = url_prefix
+        # 写图片文件在有界线程池中执行
+        self._executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix="cfg-worker")
+        # 进行中的渲染：(ID, 格式) -> Future
+        self._renders: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._counters = {"renders": 0, "render_hits": 0}
+
+    def url(self, graph_id: str, fmt: str) -> str:
+        return f"{self.url_prefix}/{graph_id}.{fmt}"
+
+    def save(self, graph: GraphIR, language: str) -> str:
+        """
+        :param language: 生成这张图的代码语言（用于渲染耗时的指标）
+        """
+        graph_id = graph_id_of(graph)
+        if self.store.get(graph_id) is None:
+            self.store.put(graph_id, {"ir": graph.to_dict(), "language": language})
+        return graph_id
+
+    def contains(self, graph_id: str) -> bool:
+        return self.store.get(graph_id) is not None
+
+    async def get(self, graph_id: str, fmt: str) -> Optional[Dict[str, Any]]:
+        """
+        :return: {"content": 内容} 或 {"path": 已渲染的图片文件路径}；图不存在时为None
+        :raise RenderError: dot渲染失败
+        """
+        value = self.store.get(graph_id)
+        if value is None:
+            return None
+        graph = GraphIR.from_dict(value["ir"])
+        if fmt == "json":
+            return {"content": json.dumps(graph.to_graph_data(), ensure_ascii=False).encode('utf-8')}
+        if fmt == "dot":
+            return {"content": graph.to_dot().encode('utf-8')}
+
+        key = f"{graph_id}.{fmt}"
+        rendered = self.store.get(key)
+        path = artifact_store.path(rendered["url"]) if rendered is not None else None
+        if path is not None:
+            self._counters["render_hits"] += 1
+            return {"path": path}
+
+        flight = self._renders.get((graph_id, fmt))
+        if flight is None:
+            flight = asyncio.ensure_future(self._render(graph, value.get("language", ""), key, fmt))
+            self._renders[(graph_id, fmt)] = flight
+            flight.add_done_callback(lambda _: self._renders.pop((graph_id, fmt), None))
+        # 某个请求断开时不取消其他请求正在等待的渲染
+        return {"content": await asyncio.shield(flight)}
+
+    async def _render(self, graph: GraphIR, language: str, key: str, fmt: str) -> bytes:
+        with tracer.span("render", format=fmt) as span:
+            start = time.perf_counter()
+            data = await graph_renderer.render(graph.to_dot(), RENDER_FORMATS[fmt])
+            stage_duration.observe(time.perf_counter() - start, stage="render", language=language)
+            span.set_attribute("bytes", len(data))
+        url = await asyncio.get_running_loop().run_in_executor(self._executor, artifact_store.put, data, fmt)
+        self.store.put(key, {"url": url})
+        self._counters["renders"] += 1
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "rendering": len(self._renders)}
+
+
+# 全局图存储，和结果缓存使用同一个数据库文件
+graph_store = GraphStore(ResultCache(
+    settings.RESULT_CACHE_DB_PATH,
+    table="graphs",
+    memory_entries=settings.RESULT_CACHE_MEMORY_ENTRIES,
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    ttl=settings.RESULT_CACHE_TTL
+), worker_threads=settings.CFG_WORKER_THREADS)
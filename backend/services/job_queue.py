@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from models.schemas import CFGGenerationRequest
+from core.config import settings
+from services.cfg_service import cfg_service
+from util.tracing import tracer, get_logger
+
+logger = get_logger("jobs")
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobStore:
+    """
+    任务的SQLite持久化存储
+    请求中的API密钥不落盘，只在进程内存中保留到任务开始执行
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, custom_key INTEGER NOT NULL, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+    def create(self, request: CFGGenerationRequest) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "request": request.model_dump(mode="json", exclude={"api_key"}),
+            "custom_key": request.api_key is not None,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, request, custom_key, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job["id"], QUEUED, json.dumps(job["request"], ensure_ascii=False), int(job["custom_key"]),
+                 job["created_at"])
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, request, custom_key, result, error, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "request": json.loads(row[2]),
+            "custom_key": bool(row[3]),
+            "result": json.loads(row[4]) if row[4] is not None else None,
+            "error": row[5],
+            "created_at": row[6],
+            "started_at": row[7],
+            "finished_at": row[8],
+        }
+
+    def mark_running(self, job_id: str) -> bool:
+        """只有排队中的任务可以开始执行，返回是否成功"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+               only_from: tuple = (QUEUED, RUNNING)) -> bool:
+        """把未结束的任务标记为结束状态，返回是否成功"""
+        placeholders = ', '.join('?' for _ in only_from)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                f"WHERE id = ? AND status IN ({placeholders})",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(),
+                 job_id, *only_from)
+            )
+        return cursor.rowcount == 1
+
+    def requeue_interrupted(self) -> List[str]:
+        """进程重启后把执行到一半的任务放回队列，返回全部待执行任务的ID（按提交顺序）"""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING))
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, older_than: float) -> int:
+        """删除结束时间早于older_than的任务"""
+        placeholders = ', '.join('?' for _ in FINISHED_STATES)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*FINISHED_STATES, older_than)
+            )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class JobQueue:
+    """
+    进程内的异步任务队列
+    提交的任务先写入JobStore再进入队列，由固定数量的worker协程执行；进程重启后未完成的任务重新排队
+    """
+
+    def __init__(self, store: JobStore, workers: int = 4, retention: int = 7 * 24 * 3600):
+        self.store = store
+        self.workers = workers
+        self.retention = retention
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker_tasks: List[asyncio.Task] = []
+        # 正在执行的任务，用于取消
+        self._running: Dict[str, asyncio.Task] = {}
+        # 自定义API密钥只保存在内存中
+        self._api_keys: Dict[str, str] = {}
+
+    async def start(self):
+        if self._worker_tasks:
+            return
+        self.store.purge(time.time() - self.retention)
+        self._queue = asyncio.Queue()
+        for job_id in self.store.requeue_interrupted():
+            self._queue.put_nowait(job_id)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), name=f"cfg-job-worker-{i}") for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """停止worker，执行中的任务保持running状态，下次启动时重新排队"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, request: CFGGenerationRequest) -> Dict[str, Any]:
+        job = self.store.create(request)
+        if request.api_key is not None:
+            self._api_keys[job["id"]] = request.api_key
+        self._queue.put_nowait(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """取消排队中或执行中的任务，已结束的任务保持不变"""
+        if self.store.finish(job_id, CANCELLED, error="任务已取消"):
+            self._api_keys.pop(job_id, None)
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._worker_tasks),
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+            "jobs": self.store.counts(),
+        }
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                # 每个任务一个根span，request_id即任务ID，任务的日志和trace都可以按它查找
+                with tracer.span("job", request_id=job_id, job_id=job_id):
+                    await self._run(job_id)
+            except Exception as e:
+                logger.exception("任务执行异常 %s: %s", job_id, e)
+                self.store.finish(job_id, FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or not self.store.mark_running(job_id):
+            # 已取消或已被执行
+            return
+        api_key = self._api_keys.pop(job_id, None)
+        if job["custom_key"] and api_key is None:
+            # API密钥不落盘，重启前提交的自定义密钥任务无法继续
+            self.store.finish(job_id, FAILED, error="服务重启后自定义API密钥已失效，请重新提交任务")
+            return
+        request = CFGGenerationRequest(**job["request"], api_key=api_key)
+
+        task = asyncio.create_task(cfg_service.generate_cfg(request))
+        self._running[job_id] = task
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                # 任务本身被取消（cancel接口），worker继续处理下一个任务
+                return
+            # worker被停止：一并取消正在执行的任务，状态保持running，下次启动时重新排队
+            task.cancel()
+            raise
+        finally:
+            self._running.pop(job_id, None)
+
+        if result["success"]:
+            self.store.finish(job_id, SUCCEEDED, result=result, only_from=(RUNNING,))
+        else:
+            self.store.finish(job_id, FAILED, result=result, error=result["message"], only_from=(RUNNING,))
+
+
+# 全局任务队列
+job_queue = JobQueue(
+    JobStore(settings.JOB_DB_PATH),
+    workers=settings.JOB_WORKERS,
+    retention=settings.JOB_RETENTION
+)
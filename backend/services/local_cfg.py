@@ -0,0 +1,327 @@
+"""
+Python代码的本地控制流图构建
+直接用标准库ast分析代码结构，不调用大模型；输出GraphIR，和大模型生成的图一样用于graph_data、DOT和渲染。
+节点和边标签的风格与融合阶段提示词中的示例一致（Start of main / if x < 20: / x < 20 (true) ...）
+"""
+import ast
+import itertools
+from typing import Any, List, Optional, Tuple
+
+from services.graph_ir import GraphIR, Cluster
+
+# 本地构建器的版本，构建规则变化时修改，使旧的缓存结果失效
+LOCAL_CFG_VERSION = "2"
+
+# 比较运算取反
+_NEGATED_OPS = {
+    ast.Lt: ast.GtE, ast.GtE: ast.Lt, ast.Gt: ast.LtE, ast.LtE: ast.Gt,
+    ast.Eq: ast.NotEq, ast.NotEq: ast.Eq, ast.In: ast.NotIn, ast.NotIn: ast.In,
+    ast.Is: ast.IsNot, ast.IsNot: ast.Is,
+}
+
+# 从finally继续跳转时的边标签
+_JUMP_LABELS = {"return": "return", "raise": "exception", "break": "break", "continue": "continue"}
+
+# 前驱：(节点ID, 指向下一个节点的边标签)
+Pred = Tuple[str, Optional[str]]
+
+
+class LocalCFGError(ValueError):
+    """代码无法在本地构建控制流图（如语法错误）"""
+
+
+def _negate(test: ast.expr) -> str:
+    if isinstance(test, ast.Compare) and len(test.ops) == 1 and type(test.ops[0]) in _NEGATED_OPS:
+        return ast.unparse(ast.Compare(test.left, [_NEGATED_OPS[type(test.ops[0])]()], test.comparators))
+    if isinstance(test, ast.UnaryOp) and isinstance(test.op, ast.Not):
+        return ast.unparse(test.operand)
+    return ast.unparse(ast.UnaryOp(ast.Not(), test))
+
+
+def _always_true(test: ast.expr) -> bool:
+    return isinstance(test, ast.Constant) and bool(test.value)
+
+
+class _FunctionBuilder:
+    """
+    为一个函数（或主程序）构建控制流图
+    语句逐条处理，每条语句接收前驱列表、返回后继的前驱列表；return/raise连到结束节点，break/continue连到所在循环
+    跳转途经try的finally时先进入finally，finally执行完后再继续跳转
+    """
+
+    def __init__(self, graph: GraphIR, source: str, new_id, cluster: Optional[Cluster] = None):
+        self.graph = graph
+        self.source = source
+        self.new_id = new_id
+        self.cluster = cluster
+        self.edges = set()
+        # 跳到结束节点的前驱（return、未捕获的raise）
+        self.exits: List[Pred] = []
+        # 所在的循环和try，从外到内：
+        # ("loop", (循环头节点, break前驱列表)) / ("except", except节点ID列表) / ("finally", [(跳转类型, 前驱)])
+        self.frames: List[Tuple[str, Any]] = []
+
+    def build(self, body: List[ast.stmt], start_label: str, end_label: str):
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            # 文档字符串
+            body = body[1:]
+        start = self.node(start_label)
+        preds = self.block(body, [(start, None)])
+        end = self.node(end_label)
+        self.connect(preds + self.exits, end)
+
+    def node(self, label: str) -> str:
+        node_id = self.new_id()
+        self.graph.add_node(node_id, label)
+        if self.cluster is not None:
+            self.cluster.node_ids.append(node_id)
+        return node_id
+
+    def connect(self, preds: List[Pred], target: str):
+        # 两个节点之间最多一条边
+        for source, label in preds:
+            if (source, target) not in self.edges:
+                self.edges.add((source, target))
+                self.graph.add_edge(source, target, label)
+
+    def text(self, node: ast.AST) -> str:
+        """节点在源码中的原文（保留用户的写法），取不到时反解析"""
+        return (ast.get_source_segment(self.source, node) or ast.unparse(node)).strip()
+
+    def block(self, stmts: List[ast.stmt], preds: List[Pred]) -> List[Pred]:
+        for stmt in stmts:
+            if not preds:
+                # return/break等之后的代码不可达
+                break
+            preds = self.statement(stmt, preds)
+        return preds
+
+    def statement(self, stmt: ast.stmt, preds: List[Pred]) -> List[Pred]:
+        if isinstance(stmt, ast.If):
+            return self.if_statement(stmt, preds, "if")
+        if isinstance(stmt, ast.While):
+            return self.while_statement(stmt, preds)
+        if isinstance(stmt, (ast.For, ast.AsyncFor)):
+            return self.for_statement(stmt, preds)
+        if isinstance(stmt, (ast.Try, getattr(ast, "TryStar", ast.Try))):
+            return self.try_statement(stmt, preds)
+        if isinstance(stmt, (ast.With, ast.AsyncWith)):
+            prefix = "async with" if isinstance(stmt, ast.AsyncWith) else "with"
+            items = ', '.join(self.text(item.context_expr) + (f" as {self.text(item.optional_vars)}" if item.optional_vars else '')
+                              for item in stmt.items)
+            head = self.node(f"{prefix} {items}:")
+            self.connect(preds, head)
+            return self.block(stmt.body, [(head, None)])
+        if isinstance(stmt, getattr(ast, "Match", ())):
+            return self.match_statement(stmt, preds)
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            # 嵌套定义只作为一条语句，取定义行（源码片段从def/class开始，不含装饰器）
+            head = self.node(self.text(stmt).split('\n')[0].strip())
+            self.connect(preds, head)
+            return [(head, None)]
+
+        current = self.node(self.text(stmt))
+        self.connect(preds, current)
+        if isinstance(stmt, ast.Return):
+            self.jump("return", [(current, None)])
+            return []
+        if isinstance(stmt, ast.Raise):
+            self.jump("raise", [(current, None)])
+            return []
+        if isinstance(stmt, (ast.Break, ast.Continue)) and any(kind == "loop" for kind, _ in self.frames):
+            self.jump("break" if isinstance(stmt, ast.Break) else "continue", [(current, None)])
+            return []
+        return [(current, None)]
+
+    def jump(self, kind: str, preds: List[Pred]):
+        """return/raise/break/continue：从内向外找到跳转目标，途经finally时先记在finally上"""
+        for frame_kind, frame in reversed(self.frames):
+            if frame_kind == "finally":
+                frame.extend((kind, pred) for pred in preds)
+                return
+            if frame_kind == "loop" and kind in ("break", "continue"):
+                head, breaks = frame
+                if kind == "break":
+                    breaks.extend(preds)
+                else:
+                    self.connect(preds, head)
+                return
+            if frame_kind == "except" and kind == "raise":
+                # 交给所在try的各个except
+                for handler in frame:
+                    self.connect(preds, handler)
+                return
+        if kind == "raise":
+            self.exits.extend((source, "exception") for source, _ in preds)
+        else:
+            self.exits.extend(preds)
+
+    def if_statement(self, stmt: ast.If, preds: List[Pred], keyword: str) -> List[Pred]:
+        condition = self.text(stmt.test)
+        head = self.node(f"{keyword} {condition}:")
+        self.connect(preds, head)
+        out = self.block(stmt.body, [(head, f"{condition} (true)")])
+        false_branch = (head, f"{_negate(stmt.test)} (false)")
+        orelse = stmt.orelse
+        if len(orelse) == 1 and isinstance(orelse[0], ast.If) and orelse[0].col_offset == stmt.col_offset:
+            # elif（else中嵌套的if缩进更深）
+            out += self.if_statement(orelse[0], [false_branch], "elif")
+        elif orelse:
+            else_node = self.node("else:")
+            self.connect([false_branch], else_node)
+            out += self.block(orelse, [(else_node, None)])
+        else:
+            out.append(false_branch)
+        return out
+
+    def loop(self, head: str, body: List[ast.stmt], orelse: List[ast.stmt], true_label: str,
+             false_label: Optional[str]) -> List[Pred]:
+        breaks: List[Pred] = []
+        self.frames.append(("loop", (head, breaks)))
+        body_out = self.block(body, [(head, true_label)])
+        self.frames.pop()
+        # 循环体结束后回到循环头
+        self.connect(body_out, head)
+        if false_label is None:
+            # while True: 只能通过break离开
+            return breaks
+        out = self.block(orelse, [(head, false_label)]) if orelse else [(head, false_label)]
+        return out + breaks
+
+    def while_statement(self, stmt: ast.While, preds: List[Pred]) -> List[Pred]:
+        condition = self.text(stmt.test)
+        head = self.node(f"while {condition}:")
+        self.connect(preds, head)
+        false_label = None if _always_true(stmt.test) else f"{_negate(stmt.test)} (false)"
+        return self.loop(head, stmt.body, stmt.orelse, f"{condition} (true)", false_label)
+
+    def for_statement(self, stmt, preds: List[Pred]) -> List[Pred]:
+        target, iterable = self.text(stmt.target), self.text(stmt.iter)
+        prefix = "async for" if isinstance(stmt, ast.AsyncFor) else "for"
+        head = self.node(f"{prefix} {target} in {iterable}:")
+        self.connect(preds, head)
+        it = stmt.iter
+        if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and it.func.id == "range" \
+                and 1 <= len(it.args) <= 2 and isinstance(stmt.target, ast.Name):
+            # for i in range(x): 和示例一样写成 i < x / i >= x
+            stop = self.text(it.args[-1])
+            true_label, false_label = f"{target} < {stop} (true)", f"{target} >= {stop} (false)"
+        else:
+            true_label, false_label = f"{target} in {iterable} (true)", f"{iterable} exhausted (false)"
+        return self.loop(head, stmt.body, stmt.orelse, true_label, false_label)
+
+    def try_statement(self, stmt, preds: List[Pred]) -> List[Pred]:
+        head = self.node("try:")
+        self.connect(preds, head)
+        handler_nodes = []
+        for handler in stmt.handlers:
+            header = "except"
+            if handler.type is not None:
+                header += f" {ast.unparse(handler.type)}"
+            if handler.name:
+                header += f" as {handler.name}"
+            handler_nodes.append(self.node(header + ":"))
+
+        # try体、else和各个except中的跳转都要先经过finally
+        pending: List[Tuple[str, Pred]] = []
+        if stmt.finalbody:
+            self.frames.append(("finally", pending))
+        if handler_nodes:
+            self.frames.append(("except", handler_nodes))
+        out = self.block(stmt.body, [(head, None)])
+        if handler_nodes:
+            self.frames.pop()
+        if stmt.orelse:
+            out = self.block(stmt.orelse, out)
+
+        for handler, handler_node in zip(stmt.handlers, handler_nodes):
+            label = f"{ast.unparse(handler.type)} raised" if handler.type is not None else "exception"
+            self.connect([(head, label)], handler_node)
+            out += self.block(handler.body, [(handler_node, None)])
+
+        if stmt.finalbody:
+            self.frames.pop()
+            if not out and not pending:
+                # try中的代码都不会结束（如死循环），finally不可达
+                return []
+            final_node = self.node("finally:")
+            self.connect(out + [pred for _, pred in pending], final_node)
+            final_out = self.block(stmt.finalbody, [(final_node, None)])
+            # finally执行完后继续原来的跳转（这时已经不在这层finally中）
+            for kind in dict.fromkeys(kind for kind, _ in pending):
+                self.jump(kind, [(source, _JUMP_LABELS[kind]) for source, _ in final_out])
+            out = final_out if out else []
+        return out
+
+    def match_statement(self, stmt, preds: List[Pred]) -> List[Pred]:
+        head = self.node(f"match {ast.unparse(stmt.subject)}:")
+        self.connect(preds, head)
+        out: List[Pred] = []
+        pending: List[Pred] = [(head, None)]
+        for case in stmt.cases:
+            pattern = ast.unparse(case.pattern)
+            if case.guard is not None:
+                pattern += f" if {ast.unparse(case.guard)}"
+            case_node = self.node(f"case {pattern}:")
+            self.connect(pending, case_node)
+            out += self.block(case.body, [(case_node, "match")])
+            irrefutable = isinstance(case.pattern, ast.MatchAs) and case.pattern.pattern is None and case.guard is None
+            pending = [] if irrefutable else [(case_node, "no match")]
+        return out + pending
+
+
+def _is_main_guard(stmt: ast.stmt) -> bool:
+    """if __name__ == "__main__":"""
+    return (isinstance(stmt, ast.If) and isinstance(stmt.test, ast.Compare)
+            and isinstance(stmt.test.left, ast.Name) and stmt.test.left.id == "__name__"
+            and len(stmt.test.comparators) == 1 and isinstance(stmt.test.comparators[0], ast.Constant)
+            and stmt.test.comparators[0].value == "__main__")
+
+
+def build_python_cfg(code: str) -> GraphIR:
+    """
+    为Python代码构建控制流图
+    每个函数（包括类中的方法）单独成图，放在各自的子图簇中；模块级语句和 if __name__ == "__main__": 中的代码作为main
+    :raise LocalCFGError: 代码有语法错误或没有可分析的语句
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise LocalCFGError(f"代码语法错误（第{e.lineno}行）: {e.msg}")
+
+    functions = []
+    main_body = []
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append((stmt.name, stmt))
+        elif isinstance(stmt, ast.ClassDef):
+            functions.extend((f"{stmt.name}.{item.name}", item) for item in stmt.body
+                             if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)))
+        elif _is_main_guard(stmt):
+            main_body.extend(stmt.body)
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            continue
+        elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and isinstance(stmt.value.value, str):
+            # 模块文档字符串
+            continue
+        else:
+            main_body.append(stmt)
+
+    units = [(name, func.body) for name, func in functions]
+    if main_body:
+        units.append(("main", main_body))
+    if not units:
+        raise LocalCFGError("代码中没有可以分析的语句")
+
+    graph = GraphIR()
+    counter = itertools.count()
+    new_id = lambda: f"N{next(counter)}"
+    for name, body in units:
+        cluster = None
+        if len(units) > 1:
+            # 多个函数时每个函数放在一个子图簇中
+            cluster = Cluster(f"cluster_{name}", label=name)
+            graph.clusters.append(cluster)
+        _FunctionBuilder(graph, code, new_id, cluster).build(body, f"Start of {name}", f"End of {name}")
+    return graph
@@ -0,0 +1,59 @@
+import asyncio
+
+from core.config import settings
+
+# 输出格式到dot参数的映射
+RENDER_FORMATS = {"png": "png", "svg": "svg"}
+
+
+class RenderError(RuntimeError):
+    """Graphviz渲染失败或超时"""
+
+
+class GraphRenderer:
+    """
+    Graphviz渲染服务
+    直接把DOT源码通过管道交给dot进程，不再启动Python解释器；并发数和单次渲染时间都有上限
+    """
+
+    def __init__(self, dot_binary: str = "dot", max_concurrency: int = 4, timeout: float = 30.0):
+        self.dot_binary = dot_binary
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def render(self, dot_source: str, fmt: str = "png") -> bytes:
+        if fmt not in RENDER_FORMATS:
+            raise RenderError(f"不支持的图片格式: {fmt}")
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    self.dot_binary, f"-T{RENDER_FORMATS[fmt]}",
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            except FileNotFoundError:
+                raise RenderError(f"未找到Graphviz可执行文件: {self.dot_binary}")
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(dot_source.encode('utf-8')), timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise RenderError(f"渲染超时（{self.timeout}秒）")
+            except asyncio.CancelledError:
+                # 请求被取消（客户端断开或任务取消）时不留下dot进程
+                process.kill()
+                raise
+            if process.returncode != 0:
+                raise RenderError(stderr.decode('utf-8', errors='replace').strip() or f"dot退出码: {process.returncode}")
+            return stdout
+
+
+# 全局渲染服务实例
+graph_renderer = GraphRenderer(
+    dot_binary=settings.GRAPHVIZ_DOT,
+    max_concurrency=settings.RENDER_MAX_CONCURRENCY,
+    timeout=settings.RENDER_TIMEOUT
+)
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# 过期条目的清理间隔（秒）
+EXPIRE_INTERVAL = 60
+# 每次取出的淘汰候选条目数
+EVICT_BATCH = 64
+
+
+def make_cache_key(*parts: Any) -> str:
+    """把任意可JSON序列化的参数组合成内容寻址的缓存键"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    两级结果缓存：内存LRU + SQLite持久化
+    - 内存层按条目数做LRU淘汰
+    - 磁盘层按TTL、条目数和总字节数淘汰（最久未访问的先淘汰），重启后仍然有效
+    """
+
+    def __init__(self, db_path: str, table: str = "results", memory_entries: int = 256,
+                 max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024, ttl: int = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.table = table
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # 内存命中的访问时间先记在这里，淘汰前批量写回磁盘层
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._last_expire = 0.0
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table}(created_at)")
+        # 磁盘层的条目数和总字节数只在启动时统计一次，之后随写入和删除增减
+        self._count, self._bytes = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {table}"
+        ).fetchone()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                value, created_at = item
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    if len(self._touched) >= self.memory_entries:
+                        self._flush_touched()
+                    self._counters["memory_hits"] += 1
+                    return value
+                self._memory.pop(key, None)
+
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._delete(key)
+                self._counters["misses"] += 1
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._touched.pop(key, None)
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self._counters["disk_hits"] += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+        size = len(data.encode('utf-8'))
+        with self._lock:
+            self._remember(key, value, now)
+            self._touched.pop(key, None)
+            old = self._conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now)
+            )
+            if old is None:
+                self._count += 1
+                self._bytes += size
+            else:
+                self._bytes += size - old[0]
+            self._counters["writes"] += 1
+            self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._touched.pop(key, None)
+            self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._count = self._bytes = 0
+
+    def _delete(self, key: str):
+        row = self._conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._count -= 1
+            self._bytes -= row[0]
+
+    def _remember(self, key: str, value: Dict[str, Any], created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """把内存命中的访问时间批量写回磁盘层，淘汰才能按真实的最近访问顺序进行"""
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self, now: float):
+        """淘汰过期条目（最多每分钟一次，读取时也会跳过过期条目），再按最久未访问淘汰超出数量或大小上限的条目"""
+        evicted = 0
+        if now - self._last_expire >= EXPIRE_INTERVAL:
+            self._last_expire = now
+            count, total = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table} WHERE created_at < ?", (now - self.ttl,)
+            ).fetchone()
+            if count:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,))
+                self._count -= count
+                self._bytes -= total
+                evicted += count
+        if self._count > self.max_entries or self._bytes > self.max_bytes:
+            self._flush_touched()
+        while self._count > self.max_entries or self._bytes > self.max_bytes:
+            rows = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY accessed_at LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+                    break
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._count -= 1
+                self._bytes -= size
+                evicted += 1
+        self._counters["evictions"] += evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._count, self._bytes
+            counters = dict(self._counters)
+            memory_size = len(self._memory)
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": memory_size,
+            "disk_entries": count,
+            "disk_bytes": total,
+        }
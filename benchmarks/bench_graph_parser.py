@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+对比融合阶段输出的两种解析方式：
+- legacy：原先 CFGService._parse_graph_data 的逐行正则解析（每行重新编译四个正则）
+- ir：services.graph_ir 的解析（顶格的单行简单调用按引号切分，其余语句单遍词法解析），包括生成 graph_data
+
+用法: python benchmarks/bench_graph_parser.py [--nodes 5000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from services.graph_ir import parse_graph
+
+
+def legacy_parse(graph_code):
+    """原 _parse_graph_data/_parse_node_line/_parse_edge_line 的实现（仅用于对比）"""
+    nodes, edges, node_ids = [], [], set()
+    for line in graph_code.split('\n'):
+        line = line.strip()
+        if line.startswith('dot.node('):
+            for pattern in [r"dot\.node\('([^']+)',\s*'([^']+)'", r"dot\.node\('([^']+)'\)",
+                            r"dot\.node\(\"([^\"]+)\",\s*\"([^\"]+)\"", r"dot\.node\(\"([^\"]+)\"\)"]:
+                match = re.search(pattern, line)
+                if match:
+                    node_id = match.group(1)
+                    nodes.append({"id": node_id, "label": match.group(2) if match.lastindex >= 2 else node_id})
+                    node_ids.add(node_id)
+                    break
+        elif line.startswith('dot.edge('):
+            for pattern in [r"dot\.edge\('([^']+)',\s*'([^']+)'", r"dot\.edge\(\"([^\"]+)\",\s*\"([^\"]+)\""]:
+                match = re.search(pattern, line)
+                if match:
+                    edges.append({"source": match.group(1), "target": match.group(2),
+                                  "from": match.group(1), "to": match.group(2)})
+                    break
+    return {"nodes": nodes, "edges": edges, "type": "directed_graph"}
+
+
+def make_graph_code(node_count, seed=0):
+    """生成和融合阶段输出形式一致的大图：带标签的边、转义引号、跨行调用"""
+    rng = random.Random(seed)
+    lines = ["from graphviz import Digraph", "dot = Digraph()", "dot.attr('node', fontname='SimSun')"]
+    for i in range(node_count):
+        if i % 50 == 0:
+            lines.append(f"dot.node('N{i}',\n         'System.out.println(\"step {i}\\\\n\")')")
+        elif i % 7 == 0:
+            lines.append(f"dot.node(\"N{i}\", \"if (a[{i}] < a[i])\")")
+        else:
+            lines.append(f"dot.node('N{i}', 'x{i} = x{i - 1} + {i}')")
+    for i in range(node_count - 1):
+        lines.append(f"dot.edge('N{i}', 'N{i + 1}')")
+        if i % 5 == 0:
+            target = rng.randrange(node_count)
+            lines.append(f"dot.edge('N{i}', 'N{target}', label='x{i} >= {target} (false)')")
+    lines.append("dot.render('graph', format='png', view=False)")
+    return '\n'.join(lines)
+
+
+def measure(func, source, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(source)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    report = []
+    for node_count in args.nodes:
+        source = make_graph_code(node_count)
+        legacy_time, legacy = measure(legacy_parse, source, args.repeat)
+        ir_time, graph = measure(lambda code: parse_graph(code).to_graph_data(), source, args.repeat)
+        report.append({
+            "nodes": node_count,
+            "source_bytes": len(source),
+            "legacy_ms": round(legacy_time * 1000, 3),
+            "ir_ms": round(ir_time * 1000, 3),
+            "speedup": round(legacy_time / ir_time, 2) if ir_time else None,
+            "legacy_nodes": len(legacy["nodes"]),
+            "ir_nodes": len(graph["nodes"]),
+            "legacy_edges": len(legacy["edges"]),
+            "ir_edges": len(graph["edges"]),
+            "ir_edge_labels": sum(1 for edge in graph["edges"] if "label" in edge),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
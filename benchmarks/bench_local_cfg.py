@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+对比Python代码两种生成方式的耗时：
+- local：services.local_cfg 用ast构建控制流图（不调用大模型）
+- llm：CFG.unit_chain 的五次大模型调用（需要config.yaml中配置有效的API密钥，加 --llm 才会执行）
+
+用法: python benchmarks/bench_local_cfg.py [--repeat 20] [--llm --model gpt-4o-mini]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from services.local_cfg import build_python_cfg
+
+SAMPLES = {
+    "fibonacci": '''\
+def fibonacci(n):
+    if n <= 1:
+        return n
+    else:
+        return fibonacci(n-1) + fibonacci(n-2)
+
+def main():
+    num = 10
+    for i in range(num):
+        print(f"F({i}) = {fibonacci(i)}")
+
+if __name__ == "__main__":
+    main()
+''',
+    "nested_loops": '''\
+if __name__ == "__main__":
+    for i in range(10):
+        for j in range(10):
+            if i * 10 + j <= 29:
+                print(f"{i}{j}  ", end="")
+        print("\\n -------------------------------------- \\n")
+    for k in range(10):
+        print(k, end=" ")
+    print("输出完毕！")
+''',
+    "exceptions": '''\
+def parse_all(items):
+    results = []
+    for item in items:
+        if item is None:
+            continue
+        try:
+            value = int(item)
+        except ValueError:
+            print("bad", item)
+            continue
+        finally:
+            print("checked", item)
+        while value > 100:
+            value //= 2
+            if value == 64:
+                break
+        else:
+            results.append(value)
+    return results
+''',
+}
+
+
+def measure_local(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        graph = build_python_cfg(code)
+        graph.to_graph_data()
+        graph.to_dot()
+        best = min(best, time.perf_counter() - start)
+    return best, graph
+
+
+async def measure_llm(code, model_name, client_name):
+    from services.CFG_Generation import CFG
+    cfg = CFG('Python', client_name, model_name)
+    start = time.perf_counter()
+    await cfg.unit_chain(code)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--llm', action='store_true', help='同时测量大模型生成的耗时')
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--client', default='openai')
+    args = parser.parse_args()
+
+    report = []
+    for name, code in SAMPLES.items():
+        local_time, graph = measure_local(code, args.repeat)
+        item = {
+            "sample": name,
+            "local_ms": round(local_time * 1000, 3),
+            "nodes": len(graph.nodes),
+            "edges": len(graph.edges),
+        }
+        if args.llm:
+            llm_time = asyncio.run(measure_llm(code, args.model, args.client))
+            item["llm_ms"] = round(llm_time * 1000, 1)
+            item["speedup"] = round(llm_time / local_time)
+        report.append(item)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
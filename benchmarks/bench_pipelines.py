@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+对比两种大模型生成流程在固定样例上的耗时、令牌用量和流程图质量：
+- chain：分阶段生成（Python五次调用，Java的结构阶段在本地完成）
+- fast：融合提示词一次调用直接生成
+
+质量指标只依赖生成的图本身：能否解析、节点和边数、起止节点是否唯一、
+分支节点的出边是否都带条件标签、从起点不可达的节点数；Python样例另外和本地ast分析的结果比较分支节点数。
+需要config.yaml中配置有效的API密钥，不使用阶段缓存和结果缓存。
+
+加 --examples k 时每个提示词只保留k个最相似的示例，可以对比示例数对令牌用量和质量的影响。
+加 --cassette 时大模型调用经过录制/回放磁带：第一次运行录制，之后离线回放（--cassette-mode replay 保证不访问网络）。
+
+用法: python benchmarks/bench_pipelines.py [--model gpt-4o-mini] [--client openai] [--language Java] [--repeat 1] [--examples 3]
+                                         [--cassette benchmarks/pipelines.jsonl.gz] [--cassette-mode auto]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../backend')))
+
+from services.CFG_Generation import CFG
+from services.graph_ir import parse_graph, GraphSyntaxError
+from services.local_cfg import build_python_cfg
+from util.LLM_util import client_registry, use_cassette
+
+CORPUS = {
+    "Java": {
+        "while_loop": '''\
+public static void main(String[] args) {
+    int x = 10;
+    while (x < 20) {
+        System.out.print("value of x : " + x);
+        x++;
+    }
+}
+''',
+        "heapsort": '''\
+public static void heapsort(int[] a) {
+    for (int i = 0; i < a.length; i++) {
+        for (int j = i * 3 + 1; j < i * 3 + 4; j++) {
+            if (j < a.length) {
+                if (a[j] < a[i]) {
+                    switchPos(a, i, j);
+                    heapsort(a);
+                }
+            }
+        }
+    }
+}
+''',
+        "switch_grade": '''\
+public static void main(String[] args) {
+    int score = 85;
+    char grade;
+    switch (score / 10) {
+        case 10:
+        case 9: grade = 'A'; break;
+        case 8: grade = 'B'; break;
+        default: grade = 'C';
+    }
+    if (grade == 'A' || grade == 'B') {
+        System.out.println("good");
+    } else {
+        System.out.println("keep going");
+    }
+}
+''',
+    },
+    "Python": {
+        "if_elif": '''\
+if __name__ == "__main__":
+    x = 30
+    if x == 10:
+        print("Value of X is 10")
+    elif x == 20:
+        print("Value of X is 20")
+    else:
+        print("这是 else 语句")
+''',
+        "nested_loops": '''\
+if __name__ == "__main__":
+    for i in range(10):
+        for j in range(10):
+            if i * 10 + j <= 29:
+                print(f"{i}{j}  ", end="")
+        print("\\n")
+    print("输出完毕！")
+''',
+        "search": '''\
+def search(items, target):
+    low, high = 0, len(items) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        if items[mid] == target:
+            return mid
+        elif items[mid] < target:
+            low = mid + 1
+        else:
+            high = mid - 1
+    return -1
+''',
+    },
+}
+
+
+def branch_nodes(graph):
+    outgoing = {}
+    for edge in graph.edges:
+        outgoing.setdefault(edge.source, []).append(edge)
+    return {node_id: edges for node_id, edges in outgoing.items() if len(edges) > 1}
+
+
+def graph_quality(graph_code):
+    try:
+        graph = parse_graph(graph_code)
+    except GraphSyntaxError as e:
+        return {"parsed": False, "error": str(e)}, None
+    labels = [node.label for node in graph.nodes.values()]
+    starts = [node.id for node in graph.nodes.values() if node.label.startswith('Start')]
+    branches = branch_nodes(graph)
+    # 从起点出发的可达性
+    reachable = set()
+    pending = list(starts[:1])
+    while pending:
+        node_id = pending.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        pending.extend(edge.target for edge in graph.edges if edge.source == node_id)
+    return {
+        "parsed": True,
+        "nodes": len(graph.nodes),
+        "edges": len(graph.edges),
+        "single_start": len(starts) == 1,
+        "single_end": sum(label.startswith('End') for label in labels) == 1,
+        "branches": len(branches),
+        "labeled_branches": sum(all(edge.label for edge in edges) for edges in branches.values()),
+        "unreachable": len(graph.nodes) - len(reachable),
+    }, graph
+
+
+async def run_pipeline(pipeline, language, code, model, client, few_shot=None):
+    # 单个函数的样例，不切分；每次新建实例，用量只统计本次生成
+    cfg = CFG(language, client, model, pipeline=pipeline, chunk_functions=False, few_shot=few_shot)
+    start = time.perf_counter()
+    graph_code = await cfg.unit_chain(code)
+    elapsed = time.perf_counter() - start
+    quality, graph = graph_quality(graph_code)
+    item = {
+        "pipeline": pipeline,
+        "latency_s": round(elapsed, 2),
+        **cfg.llm.usage,
+        **quality,
+    }
+    if language == 'Python' and graph is not None:
+        reference = build_python_cfg(code)
+        item["reference_branches"] = len(branch_nodes(reference))
+    return item
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--client', default='openai')
+    parser.add_argument('--language', choices=sorted(CORPUS), help='只测试一种语言')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--examples', type=int, help='每个提示词保留的示例数（默认全部）')
+    parser.add_argument('--cassette', help='大模型调用的录制/回放磁带文件')
+    parser.add_argument('--cassette-mode', default='auto', choices=['record', 'replay', 'auto'])
+    parser.add_argument('--cassette-latency', help='回放时模拟的耗时：秒数或recorded（默认不等待）')
+    args = parser.parse_args()
+    if args.cassette:
+        use_cassette(args.cassette, args.cassette_mode, args.cassette_latency)
+
+    report = []
+    for language, samples in CORPUS.items():
+        if args.language and language != args.language:
+            continue
+        for name, code in samples.items():
+            for _ in range(args.repeat):
+                for pipeline in ('chain', 'fast'):
+                    item = await run_pipeline(pipeline, language, code, args.model, args.client, args.examples)
+                    report.append({"language": language, "sample": name, **item})
+                    print(json.dumps(report[-1], ensure_ascii=False), file=sys.stderr)
+
+    summary = {}
+    for pipeline in ('chain', 'fast'):
+        items = [item for item in report if item["pipeline"] == pipeline]
+        if not items:
+            continue
+        summary[pipeline] = {
+            "samples": len(items),
+            "mean_latency_s": round(sum(i["latency_s"] for i in items) / len(items), 2),
+            "calls": sum(i["calls"] for i in items),
+            "prompt_tokens": sum(i["prompt_tokens"] for i in items),
+            "completion_tokens": sum(i["completion_tokens"] for i in items),
+            "parsed": sum(i["parsed"] for i in items),
+            "unreachable_nodes": sum(i.get("unreachable", 0) for i in items),
+        }
+    print(json.dumps({"results": report, "summary": summary}, indent=2, ensure_ascii=False))
+    await client_registry.aclose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+离线的端到端压测：启动本地模拟大模型接口（mock_llm_server.py）和后端服务，
+以逐级增加的并发数请求 /api/cfg/generate，输出每级的延迟分位数（p50/p95/p99）、吞吐量和各阶段平均耗时。
+
+请求样本是prompt/*中各示例的源代码（每个请求末尾加一行不同的注释，避免被结果缓存或单飞合并），
+后端在临时目录中运行，默认关闭结果缓存和阶段缓存；各阶段耗时取自后端 /metrics 中的直方图在每级前后的差值。
+结果以JSON输出，可以保存为基线（--output），之后用 --baseline 比较：p95延迟或吞吐量变差超过 --tolerance 时以状态码1退出。
+
+用法: python benchmarks/bench_server.py [--levels 1,4,16] [--requests 40] [--mode llm] [--latency 0.2]
+                                      [--error-rate 0.0] [--output baseline.json] [--baseline baseline.json]
+                                      [--env MAX_CONCURRENT_GENERATIONS=32]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from mock_llm_server import prompt_snippets
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+
+# 后端的默认设置：每个请求都完整执行一次生成
+DEFAULT_ENV = {
+    "RESULT_CACHE_ENABLED": "false",
+    "STAGE_CACHE_ENABLED": "false",
+    "DEBUG": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+# 直方图的 _sum/_count 样本
+_SAMPLE = re.compile(r'^(\w+)_(sum|count)\{([^}]*)\} (\S+)$', re.MULTILINE)
+_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, q):
+    """线性插值的分位数，values已排序"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def histogram_totals(text, name, label):
+    """
+    :return: {标签值: [耗时总和, 次数]}，按label汇总其余标签
+    """
+    totals = defaultdict(lambda: [0.0, 0])
+    for metric, kind, labels, value in _SAMPLE.findall(text):
+        if metric != name:
+            continue
+        key = dict(_LABEL.findall(labels)).get(label, '')
+        totals[key][0 if kind == 'sum' else 1] += float(value)
+    return totals
+
+
+def stage_breakdown(before, after):
+    """两次抓取之间各阶段的调用次数和平均耗时"""
+    stages = {}
+    start = histogram_totals(before, 'cfg_stage_duration_seconds', 'stage')
+    for stage, (total, count) in sorted(histogram_totals(after, 'cfg_stage_duration_seconds', 'stage').items()):
+        total -= start[stage][0] if stage in start else 0.0
+        count -= start[stage][1] if stage in start else 0
+        if count > 0:
+            stages[stage] = {"count": int(count), "mean_ms": round(total / count * 1000, 1)}
+    llm_start = histogram_totals(before, 'cfg_llm_request_duration_seconds', 'outcome')
+    for outcome, (total, count) in histogram_totals(after, 'cfg_llm_request_duration_seconds', 'outcome').items():
+        total -= llm_start[outcome][0] if outcome in llm_start else 0.0
+        count -= llm_start[outcome][1] if outcome in llm_start else 0
+        if count > 0:
+            stages[f"llm.{outcome}"] = {"count": int(count), "mean_ms": round(total / count * 1000, 1)}
+    return stages
+
+
+def samples(languages):
+    """按语言交替排列的 [(语言, 代码)]"""
+    snippets = prompt_snippets()
+    pools = [[(language, code) for code in snippets.get(language, [])] for language in languages]
+    items = []
+    for index in range(max(len(pool) for pool in pools)):
+        items.extend(pool[index] for pool in pools if index < len(pool))
+    return items
+
+
+def unique_code(language, code, index):
+    comment = '#' if language == 'Python' else '//'
+    return f"{code}\n{comment} bench request {index}\n"
+
+
+def start_process(args, cwd, env, name):
+    log = open(os.path.join(cwd, f"{name}.log"), 'w')
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(client, url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程已退出（{process.returncode}）: {url}")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+async def run_level(client, base_url, items, concurrency, total, mode, counter):
+    """
+    固定并发数的闭环压测：concurrency个worker各自连续发送请求，直到完成total个
+    :param counter: 全局请求编号，保证每个请求的代码都不相同
+    """
+    latencies = []
+    errors = defaultdict(int)
+    pending = iter(range(total))
+
+    async def worker():
+        for _ in pending:
+            index = next(counter)
+            language, code = items[index % len(items)]
+            body = {"code": unique_code(language, code, index), "language": language, "mode": mode}
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/api/cfg/generate", json=body)
+                elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    errors[f"http_{response.status_code}"] += 1
+                    continue
+                if response.json().get("warning"):
+                    errors["render_warning"] += 1
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] += 1
+                continue
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": len(latencies),
+        "errors": dict(errors),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "max": round(latencies[-1] * 1000, 1) if latencies else None,
+        },
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    :return: 变差超过容差的项目说明
+    """
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        base = previous.get(level["concurrency"])
+        if base is None:
+            continue
+        name = f"并发{level['concurrency']}"
+        p95, base_p95 = level["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if p95 is not None and base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name} p95 {base_p95}ms -> {p95}ms")
+        if base["throughput_rps"] and level["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} 吞吐量 {base['throughput_rps']} -> {level['throughput_rps']} req/s")
+        if level["succeeded"] < base["succeeded"] * level["requests"] / max(base["requests"], 1):
+            regressions.append(f"{name} 成功数 {base['succeeded']}/{base['requests']} -> "
+                               f"{level['succeeded']}/{level['requests']}")
+    return regressions
+
+
+async def benchmark(args, workdir):
+    mock_port, app_port = free_port(), free_port()
+    mock_url, app_url = f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+
+    # 后端通过临时配置文件把openai的接口地址指向模拟服务，限流放宽到不影响压测
+    config_path = os.path.join(workdir, 'config.yaml')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "API Key": {"openai": "bench", "deepseek": "bench"},
+            "Base URL": {"openai": f"{mock_url}/v1", "deepseek": f"{mock_url}/v1"},
+            "Rate Limit": {provider: {"requests_per_minute": 1000000, "tokens_per_minute": 1000000000}
+                           for provider in ("openai", "deepseek")},
+        }, f)
+    env = {**os.environ, **DEFAULT_ENV, "CFG_CONFIG_PATH": config_path,
+           "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    mock = start_process([sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_llm_server.py'),
+                          '--port', str(mock_port), '--latency', str(args.latency), '--jitter', str(args.jitter),
+                          '--tokens-per-second', str(args.tokens_per_second), '--error-rate', str(args.error_rate),
+                          '--rate-limit-rate', str(args.rate_limit_rate), '--seed', '0'], workdir, env, 'mock')
+    app = start_process([sys.executable, '-m', 'uvicorn', 'main:app', '--app-dir', BACKEND,
+                         '--port', str(app_port), '--log-level', 'warning'], workdir, env, 'app')
+    try:
+        limits = httpx.Limits(max_connections=max(args.levels) + 8, max_keepalive_connections=max(args.levels) + 8)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=10.0), limits=limits) as client:
+            await wait_ready(client, f"{mock_url}/stats", mock)
+            await wait_ready(client, f"{app_url}/health", app)
+
+            items = samples(args.language or ['Java', 'Python'])
+            counter = iter(range(10 ** 9))
+            # 预热：导入模块、建立连接池、加载提示词
+            await run_level(client, app_url, items, min(4, len(items)), min(4, len(items)), args.mode, counter)
+
+            levels = []
+            for concurrency in args.levels:
+                before = (await client.get(f"{app_url}/metrics")).text
+                level = await run_level(client, app_url, items, concurrency, max(args.requests, concurrency),
+                                        args.mode, counter)
+                after = (await client.get(f"{app_url}/metrics")).text
+                level["stages"] = stage_breakdown(before, after)
+                levels.append(level)
+                print(json.dumps({key: level[key] for key in ("concurrency", "throughput_rps", "latency_ms", "errors")},
+                                 ensure_ascii=False), file=sys.stderr)
+            mock_stats = (await client.get(f"{mock_url}/stats")).json()
+    finally:
+        for process in (app, mock):
+            process.terminate()
+        for process in (app, mock):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "config": {
+            "mode": args.mode,
+            "languages": args.language or ['Java', 'Python'],
+            "requests_per_level": args.requests,
+            "mock": {"latency": args.latency, "jitter": args.jitter, "tokens_per_second": args.tokens_per_second,
+                     "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate},
+            "env": {key: env[key] for key in list(DEFAULT_ENV) + [item.partition('=')[0] for item in args.env]},
+        },
+        "levels": levels,
+        "mock_stats": mock_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='1,2,4,8,16', help='逐级的并发数，逗号分隔')
+    parser.add_argument('--requests', type=int, default=40, help='每级的请求数（不少于并发数）')
+    parser.add_argument('--mode', default='llm', choices=['llm', 'fast', 'auto', 'local'])
+    parser.add_argument('--language', action='append', choices=['Java', 'Python'], help='只使用某种语言的样本，可重复')
+    parser.add_argument('--latency', type=float, default=0.2, help='模拟接口每次调用的基础延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟接口返回500的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='模拟接口返回429的比例')
+    parser.add_argument('--env', action='append', default=[], help='传给后端的设置，如 MAX_CONCURRENT_GENERATIONS=32')
+    parser.add_argument('--output', help='结果写入的JSON文件（可作为基线）')
+    parser.add_argument('--baseline', help='与之比较的基线JSON文件')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的相对变差')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时目录（含后端和模拟接口的日志）')
+    args = parser.parse_args()
+    args.levels = [int(level) for level in args.levels.split(',') if level.strip()]
+
+    workdir = tempfile.mkdtemp(prefix='cfg-bench-')
+    try:
+        report = asyncio.run(benchmark(args, workdir))
+    finally:
+        if args.keep_workdir:
+            print(f"临时目录: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for item in regressions:
+            print(f"[REGRESSION] {item}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
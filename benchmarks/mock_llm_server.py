@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+本地的OpenAI兼容接口（POST /v1/chat/completions），用于不消耗API额度的端到端压测
+
+根据提示词判断是哪种语言的哪个阶段（和prompt/<语言>/<阶段>_prompt.txt逐行比较，各语言的说明相同，靠示例区分），
+从该提示词的示例中选出输入最相似的一个，返回它的@Output，因此各阶段的输出格式和真实模型一致，融合阶段的图可以正常解析。
+响应时间 = latency ± jitter + 输出令牌数 / tokens_per_second；可以按比例注入500错误和429限流。
+GET /stats 返回各阶段的调用次数和注入的错误数。
+
+用法: python benchmarks/mock_llm_server.py [--port 8910] [--latency 0.2] [--jitter 0.05] [--tokens-per-second 200]
+                                         [--error-rate 0.0] [--rate-limit-rate 0.0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from util.prompt_registry import PromptRegistry
+
+PROMPT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../prompt'))
+
+# 示例中用方括号包裹的一段内容，右括号后紧跟下一段或区块结束
+_BRACKETED = re.compile(r'^([ \t]*)\[(.*?)\](?=[ \t]*\n[ \t]*[\[}])', re.MULTILINE | re.DOTALL)
+
+
+def bracketed_blocks(text):
+    """
+    取出示例中方括号包裹的各段内容，续行按左括号所在列去掉缩进
+    :return: [内容]
+    """
+    blocks = []
+    for match in _BRACKETED.finditer(text):
+        width = len(match.group(1))
+        lines = match.group(2).split('\n')
+        lines = [lines[0]] + [line[width:] if line[:width].isspace() else line.lstrip() for line in lines[1:]]
+        blocks.append('\n'.join(lines))
+    return blocks
+
+
+def example_pairs(template):
+    """
+    :return: [(示例输入的第一段即源代码, 示例输出)]
+    """
+    pairs = []
+    for example in template.examples:
+        inputs, _, output = example.text.partition('@Output{')
+        code_blocks, output_blocks = bracketed_blocks(inputs), bracketed_blocks(output)
+        if code_blocks and output_blocks:
+            pairs.append((code_blocks[0], output_blocks[0]))
+    return pairs
+
+
+def load_templates(prompt_dir=PROMPT_DIR):
+    """
+    :return: [((语言, 阶段), 模板)]
+    """
+    registry = PromptRegistry(prompt_dir).load()
+    return [((language, name), registry.get(language, name))
+            for language, names in registry.stats()["languages"].items() for name in names]
+
+
+def prompt_snippets(prompt_dir=PROMPT_DIR):
+    """
+    各语言提示词示例中的源代码（去重），作为压测的请求样本
+    :return: {语言: [代码]}
+    """
+    snippets = {}
+    for (language, _), template in load_templates(prompt_dir):
+        for code, _ in example_pairs(template):
+            items = snippets.setdefault(language, [])
+            if code not in items:
+                items.append(code)
+    return snippets
+
+
+def _lines(text):
+    return {line.strip() for line in text.split('\n') if line.strip()}
+
+
+class CannedResponder:
+    """按提示词对应的阶段，回放该阶段提示词中输入最相似的示例的输出"""
+
+    def __init__(self, prompt_dir=PROMPT_DIR):
+        self.templates = [(key, template, example_pairs(template),
+                           _lines(template.text.split('@Work', 1)[0]), _lines(template.text))
+                          for key, template in load_templates(prompt_dir)]
+
+    def match(self, prompt):
+        """
+        :return: ((语言, 阶段), 模板, 示例)
+        先按说明部分（@Work之前）的行区分阶段，各语言的说明相同，再按示例的行区分语言
+        （示例筛选会删去部分示例并改写"refer to the N examples"这一行，所以不能直接比较前缀）
+        """
+        lines = _lines(prompt)
+        key, template, pairs, _, _ = max(self.templates, key=lambda item: (len(item[3] & lines) / len(item[3]),
+                                                                         len(item[4] & lines)))
+        return key, template, pairs
+
+    def reply(self, prompt):
+        """
+        :return: (阶段键, 回复内容)
+        """
+        key, template, pairs = self.match(prompt)
+        if not pairs:
+            return key, '[]'
+        if len(pairs) < len(template.examples):
+            return key, '[' + pairs[0][1] + ']'
+        # 只用@Work中的输入选择示例
+        work = prompt.split('@Work', 1)[-1].split('@Examples', 1)[0]
+        index = template.select_examples(work, 1)[0]
+        return key, '[' + pairs[index][1] + ']'
+
+
+def create_app(responder, latency=0.2, jitter=0.05, tokens_per_second=200.0, error_rate=0.0, rate_limit_rate=0.0,
+               seed=None):
+    """
+    :param latency: 每次调用的基础延迟（秒）
+    :param jitter: 延迟的随机浮动范围（秒）
+    :param tokens_per_second: 输出速度，0表示不按输出长度增加延迟
+    :param error_rate: 返回500的比例
+    :param rate_limit_rate: 返回429（带Retry-After）的比例
+    """
+    app = FastAPI(title="Mock LLM")
+    rng = random.Random(seed)
+    stats = Counter()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = ''.join(message.get("content") or '' for message in body.get("messages", []))
+        roll = rng.random()
+        if roll < error_rate:
+            stats["injected_500"] += 1
+            await asyncio.sleep(latency)
+            return JSONResponse({"error": {"message": "injected server error", "type": "server_error"}}, status_code=500)
+        if roll < error_rate + rate_limit_rate:
+            stats["injected_429"] += 1
+            return JSONResponse({"error": {"message": "injected rate limit", "type": "rate_limit_error"}},
+                                status_code=429, headers={"retry-after": "0.5"})
+
+        (language, stage), content = responder.reply(prompt)
+        stats[f"{language}.{stage}"] += 1
+        stats["calls"] += 1
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+        if tokens_per_second > 0:
+            delay += completion_tokens / tokens_per_second
+        await asyncio.sleep(delay)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8910)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(CannedResponder(), args.latency, args.jitter, args.tokens_per_second,
+                     args.error_rate, args.rate_limit_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ import { api } from './request'
 import type { 
   CFGGenerationRequest, 
   CFGGenerationResponse, 
+  CFGStreamEvent,
   SupportedLanguage,
   ApiResponse 
 } from '@/types'
@@ -11,6 +12,50 @@ export const cfgApi = {
   generateCFG: (data: CFGGenerationRequest) => {
     return api.post<CFGGenerationResponse>('/cfg/generate', data)
   },
+
+  // 流式生成控制流图（Server-Sent Events），每个阶段完成时回调一次，返回最终结果
+  generateCFGStream: async (
+    data: CFGGenerationRequest,
+    onEvent: (event: CFGStreamEvent) => void,
+    signal?: AbortSignal
+  ): Promise<CFGGenerationResponse> => {
+    const response = await fetch('/api/cfg/generate/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+      body: JSON.stringify(data),
+      signal
+    })
+    if (!response.ok || !response.body) {
+      const detail = await response.json().catch(() => null)
+      throw new Error(detail?.detail || `请求失败 (${response.status})`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      // 事件之间以空行分隔，最后一段可能不完整，留到下次
+      const chunks = buffer.split('\n\n')
+      buffer = chunks.pop() || ''
+      for (const chunk of chunks) {
+        let name = 'message'
+        const lines: string[] = []
+        for (const line of chunk.split('\n')) {
+          if (line.startsWith('event:')) name = line.slice(6).trim()
+          else if (line.startsWith('data:')) lines.push(line.slice(5).trimStart())
+        }
+        if (!lines.length) continue  // 心跳
+        const event = { event: name, data: JSON.parse(lines.join('\n')) } as CFGStreamEvent
+        onEvent(event)
+        if (event.event === 'done') return event.data
+        if (event.event === 'error') return { ...event.data, success: false }
+      }
+    }
+    throw new Error('连接在生成完成前断开')
+  },
   
   // 获取支持的编程语言
   getSupportedLanguages: () => {
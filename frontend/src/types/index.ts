@@ -31,6 +31,7 @@ export interface CFGGenerationRequest {
   client_name: ClientType
   temperature: number
   api_key?: string
+  mode?: 'llm' | 'local' | 'auto' | 'fast'
 }
 
 export interface CFGGenerationResponse {
@@ -39,8 +40,22 @@ export interface CFGGenerationResponse {
   graph_data?: GraphData
   graph_code?: string
   image_url?: string
+  graph_id?: string
   processing_time?: number
-}
+  cached?: boolean
+  coalesced?: boolean
+  mode?: 'llm' | 'local' | 'fast'
+  partial?: boolean
+  failed_units?: string[]
+}
+
+// 流式生成接口推送的事件
+export type CFGStreamEvent =
+  | { event: 'stage'; data: { stage: string; output: string; unit?: string; graph_data?: GraphData } }
+  | { event: 'graph'; data: { graph_data: GraphData; graph_code: string } }
+  | { event: 'image'; data: { image_url: string; graph_id: string } }
+  | { event: 'done'; data: CFGGenerationResponse }
+  | { event: 'error'; data: { success: false; message: string } }
 
 export interface GraphData {
   nodes: GraphNode[]
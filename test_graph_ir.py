@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import textwrap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from services.graph_ir import GraphIR, parse_graph
+
+PART_CODE = '''dot.node('A', 'Start')
+with dot.subgraph(name='cluster_loop') as c:
+    c.attr(label='loop')
+    c.node('B', 'while i < n')
+    c.node('C', 'i += 1')
+dot.node('D', 'End')
+dot.edge('A', 'B')
+dot.edge('B', 'C')
+dot.edge('C', 'B')
+dot.edge('B', 'D')
+'''
+
+
+def test_combine_nests_part_clusters():
+    """合并各函数的图时，各部分自己的子图簇嵌套在函数子图簇中，而不是输出为空的子图"""
+    graph = GraphIR.combine([("f", parse_graph(PART_CODE)), ("g", parse_graph(PART_CODE))])
+    dot = graph.to_dot()
+    lines = dot.splitlines()
+
+    for index, name in ((1, "f"), (2, "g")):
+        outer = lines.index(f'\tsubgraph "cluster_{name}" {{')
+        inner = lines.index(f'\t\tsubgraph "cluster_loop_{index}" {{')
+        assert outer < inner
+        # 函数子图簇直接包含不在循环子图簇中的节点
+        assert f'\t\t"F{index}_A" [label="Start"]' in lines[outer:inner]
+        # 循环子图簇包含自己的节点，没有变成空的子图
+        assert lines[inner + 1] == '\t\t\tlabel="loop"'
+        assert lines[inner + 2] == f'\t\t\t"F{index}_B" [label="while i < n"]'
+        assert lines[inner + 3] == f'\t\t\t"F{index}_C" [label="i += 1"]'
+        assert lines[inner + 4] == '\t\t}'
+    # 每个节点只输出一次
+    for node_id in graph.nodes:
+        assert sum(line.strip().startswith(f'"{node_id}" [') for line in lines) == 1
+
+
+def test_nested_clusters_round_trip():
+    """嵌套的子图簇经过graphviz代码和缓存形式后保持不变"""
+    graph = GraphIR.combine([("f", parse_graph(PART_CODE)), ("g", parse_graph(PART_CODE))])
+    reparsed = parse_graph(graph.to_python())
+    assert reparsed.to_dot() == graph.to_dot()
+    assert GraphIR.from_dict(graph.to_dict()).to_dot() == graph.to_dot()
+
+
+PLAIN_CODE = '''dot.node('A', 'Start')
+dot.node("B", "it's")
+dot.node('C')
+dot.node('A', 'a = "x"')
+dot.edge('A', 'B')
+dot.edge("B", "C", label="yes")
+dot.edge('C', 'D' , label = 'no')
+dot.node('E', 'x\\\\ny')
+dot.node('F',
+         'print("F")')
+dot.node(')
+'''
+
+
+def test_plain_lines_match_general_parsing():
+    """单行简单调用的快速路径和通用解析（缩进的语句不走快速路径）结果一致"""
+    plain = parse_graph(PLAIN_CODE)
+    general = parse_graph("if True:\n" + textwrap.indent(PLAIN_CODE, "    "))
+    assert plain.to_dict() == general.to_dict()
+    assert list(plain.nodes) == ["A", "B", "C", "E", "F", "D"]
+    assert plain.nodes["A"].label == 'a = "x"'
+    assert plain.nodes["E"].label == "x\\ny"
+    assert [(e.source, e.target, e.label) for e in plain.edges] == [("A", "B", None), ("B", "C", "yes"), ("C", "D", "no")]
+
+
+if __name__ == "__main__":
+    test_combine_nests_part_clusters()
+    test_nested_clusters_round_trip()
+    test_plain_lines_match_general_parsing()
+    print("✅ 测试通过")
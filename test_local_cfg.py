@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from services.local_cfg import build_python_cfg
+
+DECORATED_CODE = '''def outer():
+    @staticmethod
+    def single(x):
+        return x
+
+    @functools.lru_cache(maxsize=None)
+    @wraps(outer)
+    def double(
+        a,
+        b,
+    ):
+        return a + b
+
+    @dataclass
+    class Point:
+        x: int
+    return single
+'''
+
+FINALLY_CODE = '''def first_positive(items):
+    for item in items:
+        try:
+            if item is None:
+                continue
+            if item < 0:
+                break
+            if item == 0:
+                raise ValueError(item)
+            return item
+        finally:
+            print("checked")
+    return -1
+'''
+
+NESTED_FINALLY_CODE = '''def load(path):
+    try:
+        try:
+            return read(path)
+        finally:
+            close()
+    finally:
+        log(path)
+'''
+
+UNREACHABLE_FINALLY_CODE = '''def serve():
+    try:
+        while True:
+            handle()
+    finally:
+        shutdown()
+'''
+
+
+def node_id(graph, label):
+    matches = [node.id for node in graph.nodes.values() if node.label == label]
+    assert len(matches) == 1, (label, matches)
+    return matches[0]
+
+
+def successors(graph, label):
+    source = node_id(graph, label)
+    return {graph.nodes[edge.target].label for edge in graph.edges if edge.source == source}
+
+
+def assert_all_reachable(graph):
+    """从开始节点出发能到达所有节点"""
+    reached = {node.id for node in graph.nodes.values() if node.label.startswith("Start of ")}
+    pending = list(reached)
+    while pending:
+        current = pending.pop()
+        for edge in graph.edges:
+            if edge.source == current and edge.target not in reached:
+                reached.add(edge.target)
+                pending.append(edge.target)
+    assert reached == set(graph.nodes), [graph.nodes[i].label for i in set(graph.nodes) - reached]
+
+
+def test_decorated_nested_definitions():
+    """带装饰器的嵌套函数和类取def/class所在的行"""
+    graph = build_python_cfg(DECORATED_CODE)
+    labels = [node.label for node in graph.nodes.values()]
+    assert labels == ["Start of outer", "def single(x):", "def double(", "class Point:", "return single",
+                      "End of outer"]
+
+
+def test_jumps_run_finally():
+    """try中的return/raise/break/continue先经过finally，finally之后再跳到原来的目标"""
+    graph = build_python_cfg(FINALLY_CODE)
+    assert_all_reachable(graph)
+    for label in ("continue", "break", "raise ValueError(item)", "return item"):
+        assert successors(graph, label) == {"finally:"}
+    assert successors(graph, 'print("checked")') == {"for item in items:", "return -1", "End of first_positive"}
+
+
+def test_nested_finally():
+    """跳出多层try时依次经过各层finally"""
+    graph = build_python_cfg(NESTED_FINALLY_CODE)
+    assert_all_reachable(graph)
+    assert successors(graph, "return read(path)") == {"finally:"}
+    assert successors(graph, "close()") == {"finally:"}
+    assert successors(graph, "log(path)") == {"End of load"}
+    assert len([node for node in graph.nodes.values() if node.label == "finally:"]) == 2
+
+
+def test_unreachable_finally_is_omitted():
+    """try中的代码不会结束时不生成finally"""
+    graph = build_python_cfg(UNREACHABLE_FINALLY_CODE)
+    labels = {node.label for node in graph.nodes.values()}
+    assert "finally:" not in labels and "shutdown()" not in labels
+
+
+if __name__ == "__main__":
+    test_decorated_nested_definitions()
+    test_jumps_run_finally()
+    test_nested_finally()
+    test_unreachable_finally_is_omitted()
+    print("✅ 测试通过")
@@ -1,59 +1,321 @@
+import asyncio
+import hashlib
+import os
+import sys
+import threading
 import time
-from openai import OpenAI
+
+import httpx
+import openai
 import yaml
-import os
+from openai import AsyncOpenAI
+
+# 直接运行本文件时也能导入util包
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from util.rate_limit import provider_guards, LLMError, CircuitOpenError
+from util.metrics import llm_request_duration, llm_tokens
+from util.tracing import tracer, get_logger
+from util.cassette import Cassette, cassette_key, REPLAY
+
+logger = get_logger("llm")
+
+# 各服务商默认的接口地址（None表示使用SDK默认地址）
+DEFAULT_BASE_URLS = {
+    "openai": None,
+    "deepseek": "https://api.deepseek.com",
+}
+
+# 共享HTTP连接池的大小
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def load_config(reload=False):
+    """
+    读取项目根目录下的config.yaml（环境变量CFG_CONFIG_PATH可以指定其他文件），进程内只解析一次
+    :param reload: 是否强制重新读取
+    :return: 配置字典
+    """
+    global _config
+    if _config is not None and not reload:
+        return _config
+    with _config_lock:
+        if _config is None or reload:
+            # 获取当前文件的绝对路径，再拼接config.yaml的路径
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            config_path = os.environ.get("CFG_CONFIG_PATH") or os.path.normpath(os.path.join(current_dir, "../config.yaml"))
+            with open(config_path, 'r', encoding='utf-8') as f:
+                _config = yaml.safe_load(f) or {}
+    return _config
+
+
+class ClientRegistry:
+    """
+    进程级的AsyncOpenAI客户端注册表
+    按 (服务商, 接口地址, API密钥哈希) 复用客户端，所有客户端共享同一个长连接HTTP连接池
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._http_client = None
+        self._loop = None
+
+    def get_client(self, provider, api_key, base_url=None):
+        loop = asyncio.get_running_loop()
+        # httpx连接池绑定在创建它的事件循环上，事件循环变化时（如多次asyncio.run）重新创建
+        if self._loop is not loop:
+            self._clients = {}
+            self._http_client = None
+            self._loop = loop
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+
+        key = (provider, base_url or '', hashlib.sha256((api_key or '').encode('utf-8')).hexdigest())
+        client = self._clients.get(key)
+        if client is None:
+            # 重试由call_LLM统一处理（限流、退避、熔断），关闭SDK自带的重试
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client, max_retries=0)
+            self._clients[key] = client
+        return client
+
+    async def aclose(self):
+        """关闭共享连接池（应用关闭时调用）"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._clients = {}
+        self._http_client = None
+        self._loop = None
+
+    def stats(self):
+        return {
+            "clients": len(self._clients),
+            "providers": sorted({key[0] for key in self._clients}),
+        }
+
+
+# 全局客户端注册表
+client_registry = ClientRegistry()
+
+# 录制/回放磁带，None时所有调用都直接请求大模型
+_cassette = None
+
+
+def use_cassette(path, mode="auto", latency=None):
+    """
+    进程内所有大模型调用改为经过磁带录制/回放，path为None时关闭
+    :param mode: record（调用并录制）/ replay（只回放，未录制的提示词失败）/ auto（有录制时回放，否则调用并录制）
+    :param latency: 回放时模拟的耗时：None不等待，数字为固定秒数，"recorded"按录制时的实际耗时
+    :return: 磁带(Cassette)或None
+    """
+    global _cassette
+    _cassette = Cassette(path, mode, latency) if path else None
+    return _cassette
+
+
+def current_cassette():
+    return _cassette
+
 
 class LLM_util:
     def __init__(self, model_name, client_name='openai', api_key=None):
-        # 获取当前文件的绝对路径，再拼接config.yaml的路径
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        config_path = os.path.join(current_dir, "../config.yaml")
-        # 规范化路径（处理..等相对路径符号）
-        config_path = os.path.normpath(config_path)
-
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        
+        config = load_config()
+        self.model_name = model_name
+        self.client_name = client_name
+        self.temperature = 0
+        # 本实例累计的调用次数和令牌用量（用于对比不同生成流程的开销）
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+        # 根据模型名称选择合适的服务商，默认使用openai
+        if client_name == "deepseek" and model_name == "deepseek-chat":
+            self.provider = "deepseek"
+        else:
+            self.provider = "openai"
+
         # 如果提供了api_key，使用提供的，否则从配置文件读取
-        openai_api_key = api_key if api_key and client_name == 'openai' else config["API Key"]["openai"]
-        deepseek_api_key = api_key if api_key and client_name == 'deepseek' else config["API Key"]["deepseek"]
+        if api_key and client_name == self.provider:
+            self.api_key = api_key
+        else:
+            self.api_key = config["API Key"][self.provider]
+        self.base_url = (config.get("Base URL") or {}).get(self.provider, DEFAULT_BASE_URLS.get(self.provider))
+        self.guard = provider_guards.get(self.provider, (config.get("Rate Limit") or {}).get(self.provider))
 
-        self.model_name = model_name
-        # 默认使用openai的模型
-        self.client = OpenAI(api_key=openai_api_key)
+    @property
+    def client(self):
+        return client_registry.get_client(self.provider, self.api_key, self.base_url)
 
-        if client_name == "openai":
-            self.client = OpenAI(api_key=openai_api_key)
-        elif client_name == "deepseek":
-            self.client_deepseek = OpenAI(api_key=deepseek_api_key)
+    async def call_LLM(self, prompt):
+        """
+        调用大模型，按服务商限流；可重试的错误（429、5xx、超时、连接错误）指数退避重试，
+        重试次数和总时长都有上限，服务商连续失败时熔断、直接失败
+        :raise LLMError: 重试耗尽、超过时限、熔断或不可重试的错误
+        """
+        start = time.monotonic()
+        outcome = "error"
+        with tracer.span("llm.call", provider=self.provider, model=self.model_name, prompt_chars=len(prompt)) as span:
+            try:
+                cassette = _cassette
+                if cassette is not None:
+                    key = cassette_key(self.model_name, self.temperature, prompt)
+                    entry = cassette.lookup(key)
+                    if entry is not None:
+                        # 回放：不经过限流和重试，只模拟配置的耗时
+                        span.set_attribute("cassette", "hit")
+                        await cassette.wait(entry)
+                        self.usage["calls"] += 1
+                        self.usage["prompt_tokens"] += entry["prompt_tokens"]
+                        self.usage["completion_tokens"] += entry["completion_tokens"]
+                        outcome = "replayed"
+                        return entry["content"]
+                    if cassette.mode == REPLAY:
+                        raise LLMError(f"回放模式下没有录制过这个提示词的结果（{cassette.path}）")
+                    span.set_attribute("cassette", "record")
+                    before = dict(self.usage)
+                content = await self._call_with_retry(prompt, span)
+                if cassette is not None:
+                    cassette.record(key, self.model_name, content,
+                                    self.usage["prompt_tokens"] - before["prompt_tokens"],
+                                    self.usage["completion_tokens"] - before["completion_tokens"],
+                                    time.monotonic() - start)
+                outcome = "success"
+                return content
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                llm_request_duration.observe(time.monotonic() - start, provider=self.provider, model=self.model_name,
+                                             outcome=outcome)
 
-    def call_LLM(self, prompt):
+    async def _call_with_retry(self, prompt, span):
         message = [
             {"role": "user", "content": prompt}
         ]
+        guard = self.guard
+        policy = guard.policy
+        deadline = time.monotonic() + policy["deadline"]
+        # 粗略估计本次消耗的令牌数（提示词约4字符一个令牌，输出按同样长度估计），收到响应后按实际用量修正
+        estimated_tokens = len(prompt) // 2 + 1
+        guard.counters["calls"] += 1
+        attempt = 0
+        throttle_ms = 0.0
         while True:
-            try:
-                # 根据模型名称选择合适的客户端
-                if hasattr(self, 'client_deepseek') and self.model_name == "deepseek-chat":
-                    client = self.client_deepseek
-                else:
-                    client = self.client
-                
-                response = client.chat.completions.create(
-                    model=self.model_name,
-                    messages=message,
-                    temperature=0
+            if not guard.breaker.allow():
+                guard.counters["rejected"] += 1
+                raise CircuitOpenError(
+                    f"{self.provider} 服务暂时不可用（熔断中，{guard.breaker.retry_after():.1f}秒后重试）"
                 )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(e)
-                time.sleep(1)
+            error = None
+            # 每次尝试一个子span，分别记录限流等待和请求耗时
+            with tracer.span("llm.attempt", attempt=attempt + 1) as attempt_span:
+                throttle_start = time.monotonic()
+                await guard.acquire(estimated_tokens, deadline)
+                attempt_throttle_ms = round((time.monotonic() - throttle_start) * 1000, 1)
+                throttle_ms += attempt_throttle_ms
+                attempt_span.set_attribute("throttle_ms", attempt_throttle_ms)
+                span.set_attributes(attempts=attempt + 1, throttle_ms=round(throttle_ms, 1))
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(
+                            model=self.model_name,
+                            messages=message,
+                            temperature=self.temperature
+                        ),
+                        timeout=max(1.0, deadline - time.monotonic())
+                    )
+                except Exception as e:
+                    error = e
+                    attempt_span.record_exception(e)
+                    attempt_span.set_attribute("status_code", getattr(e, "status_code", None))
+            if error is not None:
+                retryable, retry_after = self._classify(error)
+                logger.warning("调用大模型失败（第%d次）: %s", attempt + 1, error)
+                if not retryable:
+                    # 请求本身的问题（密钥无效、参数错误等）不代表服务商不健康
+                    guard.counters["failures"] += 1
+                    raise LLMError(f"调用大模型失败: {error}") from error
+                guard.breaker.record_failure()
+                if isinstance(error, openai.RateLimitError):
+                    guard.counters["rate_limited"] += 1
+                    guard.requests.penalize()
+                    guard.tokens.penalize()
+                delay = guard.backoff(attempt, retry_after)
+                if attempt >= policy["max_retries"] or time.monotonic() + delay >= deadline:
+                    guard.counters["failures"] += 1
+                    raise LLMError(f"调用大模型失败，已重试{attempt}次: {error}") from error
+                attempt += 1
+                guard.counters["retries"] += 1
+                span.add_event("retry", attempt=attempt, delay_s=round(delay, 3), error=type(error).__name__,
+                               status=getattr(error, "status_code", None))
+                await asyncio.sleep(delay)
+                continue
 
-if __name__ == '__main__':
-    # llm = LLM_util("deepseek-chat", "deepseek")
-    llm = LLM_util("gpt-3.5-turbo")
-    response = llm.call_LLM("hello, who are you?")
-    print(response)
+            guard.breaker.record_success()
+            guard.requests.reward()
+            guard.tokens.reward()
+            guard.counters["successes"] += 1
+            self.usage["calls"] += 1
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.total_tokens:
+                guard.tokens.adjust(usage.total_tokens - estimated_tokens)
+                prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+                completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+                self.usage["prompt_tokens"] += prompt_tokens
+                self.usage["completion_tokens"] += completion_tokens
+                llm_tokens.inc(prompt_tokens, provider=self.provider, model=self.model_name, type="prompt")
+                llm_tokens.inc(completion_tokens, provider=self.provider, model=self.model_name, type="completion")
+                span.set_attributes(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            return response.choices[0].message.content
+
+    @staticmethod
+    def _classify(error):
+        """
+        :return: (是否可以重试, 服务端要求的等待秒数或None)
+        """
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+            return True, None
+        if isinstance(error, openai.APIStatusError):
+            status = error.status_code
+            if status == 429 or status >= 500 or status == 408:
+                return True, _retry_after(error.response.headers)
+            return False, None
+        return False, None
 
 
+def _retry_after(headers):
+    """解析Retry-After（秒数或HTTP日期）以及OpenAI的retry-after-ms响应头"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+if __name__ == '__main__':
+    async def main():
+        # llm = LLM_util("deepseek-chat", "deepseek")
+        llm = LLM_util("gpt-3.5-turbo")
+        response = await llm.call_LLM("hello, who are you?")
+        print(response)
+        await client_registry.aclose()
 
+    asyncio.run(main())
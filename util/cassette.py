@@ -0,0 +1,91 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+# 录制/回放模式
+RECORD = "record"  # 每次都调用大模型，并把结果写入磁带
+REPLAY = "replay"  # 只从磁带返回，没有录制过的提示词直接失败
+AUTO = "auto"  # 有录制结果时回放，否则调用大模型并录制
+MODES = (RECORD, REPLAY, AUTO)
+
+
+def cassette_key(model_name, temperature, prompt):
+    """录制结果的键：模型、温度和完整提示词的哈希（磁带中不保存提示词原文）"""
+    data = json.dumps([model_name, temperature, prompt], ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class Cassette:
+    """
+    大模型调用的录制/回放磁带：提示词哈希 -> 输出、令牌用量和原始耗时
+    磁带是gzip压缩的JSON Lines文件，录制时逐条追加（每条一个gzip成员），读取时同一个键以最后一条为准
+    """
+
+    def __init__(self, path, mode=AUTO, latency=None):
+        """
+        :param mode: record / replay / auto
+        :param latency: 回放时模拟的耗时：None不等待，数字（或数字字符串）为固定秒数，"recorded"按录制时的实际耗时
+        """
+        if mode not in MODES:
+            raise ValueError(f"不支持的磁带模式: {mode}")
+        if isinstance(latency, str) and latency != "recorded":
+            try:
+                latency = float(latency)
+            except ValueError:
+                raise ValueError(f"不支持的回放耗时: {latency}") from None
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.counters = {"hits": 0, "misses": 0, "recorded": 0}
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """
+        :return: 录制的条目（content/prompt_tokens/completion_tokens/latency_s），record模式和未录制时为None
+        """
+        entry = self._entries.get(key) if self.mode != RECORD else None
+        self.counters["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    async def wait(self, entry):
+        """按配置模拟回放耗时"""
+        delay = entry.get("latency_s", 0.0) if self.latency == "recorded" else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+
+    def record(self, key, model_name, content, prompt_tokens, completion_tokens, latency_s):
+        entry = {
+            "key": key,
+            "model": model_name,
+            "content": content,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_s": round(latency_s, 3),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.counters["recorded"] += 1
+
+    def stats(self):
+        return {"path": self.path, "mode": self.mode, "entries": len(self._entries), **self.counters}
@@ -0,0 +1,239 @@
+import glob
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+# 提示词中的占位符，如 {input_code}
+PLACEHOLDER_PATTERN = re.compile(r'\{(input_[a-z_]+)\}')
+
+# 各阶段模板必须包含的占位符
+REQUIRED_PLACEHOLDERS = {
+    "unwrap": {"input_code"},
+    "structure": {"input_code"},
+    "nested": {"input_code", "input_structure"},
+    "subgraph": {"input_code", "input_nested"},
+    "fusion": {"input_code", "input_subgraph"},
+    "fast": {"input_code"},
+}
+
+
+# 示例区：@Examples{ 到文件最后一个 } 之间，每个示例以 @ExampleN{ 开头
+EXAMPLES_PATTERN = re.compile(r'^@Examples\{[ \t]*$', re.MULTILINE)
+EXAMPLE_HEADER_PATTERN = re.compile(r'^([ \t]*)@Example(\d+)\{[ \t]*$', re.MULTILINE)
+# 规则中 "refer to the five examples" 的示例数
+EXAMPLE_COUNT_PATTERN = re.compile(r'(refer to the )(\w+)( examples?)')
+NUMBER_WORDS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten"]
+
+# 相似度使用的控制结构关键字（Python、Java、C）
+CONTROL_KEYWORDS = ("if", "elif", "else", "for", "while", "do", "switch", "case", "default", "match",
+                    "try", "catch", "except", "finally", "break", "continue", "return", "with")
+WORD_PATTERN = re.compile(r'[A-Za-z_]\w*')
+
+
+def code_features(text):
+    """
+    代码的相似度特征：控制结构关键字的计数（结构）和出现过的标识符集合（词法）
+    """
+    words = WORD_PATTERN.findall(text)
+    keywords = Counter(word for word in words if word in CONTROL_KEYWORDS)
+    return keywords, set(words)
+
+
+def similarity(features, other):
+    """结构相似度（关键字计数的余弦）占0.7，词法相似度（标识符集合的Jaccard）占0.3"""
+    (keywords, words), (other_keywords, other_words) = features, other
+    dot = sum(count * other_keywords[word] for word, count in keywords.items())
+    norm = math.sqrt(sum(v * v for v in keywords.values())) * math.sqrt(sum(v * v for v in other_keywords.values()))
+    structural = dot / norm if norm else 0.0
+    union = words | other_words
+    lexical = len(words & other_words) / len(union) if union else 0.0
+    return 0.7 * structural + 0.3 * lexical
+
+
+class PromptExample:
+    def __init__(self, number, text, indent):
+        self.number = number
+        self.text = text
+        self.indent = indent
+        # 只用示例的输入部分计算相似度
+        input_text = text.split('@Output{', 1)[0]
+        self.features = code_features(input_text)
+
+
+class PromptError(ValueError):
+    """提示词模板缺失或格式错误"""
+
+
+class PromptTemplate:
+    def __init__(self, language, name, path, text, mtime_ns):
+        self.language = language
+        self.name = name
+        self.path = path
+        self.text = text
+        self.mtime_ns = mtime_ns
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+        # 预先按占位符切分，渲染时只需一次拼接：偶数位是原文，奇数位是占位符名称
+        self._parts = PLACEHOLDER_PATTERN.split(text)
+        self.placeholders = set(self._parts[1::2])
+        self._parse_examples()
+
+        missing = REQUIRED_PLACEHOLDERS.get(name, set()) - self.placeholders
+        if missing:
+            raise PromptError(f"提示词模板 {path} 缺少占位符: {', '.join(sorted(missing))}")
+
+    def _parse_examples(self):
+        """把 @Examples 区拆成示例库，渲染时可以只保留和输入最相似的几个"""
+        self.examples = []
+        self._selection_parts = {}
+        match = EXAMPLES_PATTERN.search(self.text)
+        if match is None:
+            return
+        end = self.text.rfind('}')
+        region = self.text[match.end():end]
+        headers = list(EXAMPLE_HEADER_PATTERN.finditer(region))
+        if not headers:
+            return
+        self._examples_head = self.text[:match.end()] + region[:headers[0].start()]
+        self._examples_tail = self.text[end:]
+        for header, following in zip(headers, headers[1:] + [None]):
+            text = region[header.start():following.start() if following is not None else len(region)]
+            self.examples.append(PromptExample(int(header.group(2)), text, header.group(1)))
+
+    def select_examples(self, query, count):
+        """
+        按和query的相似度选出count个示例
+        :return: 示例下标，按原顺序排列
+        """
+        features = code_features(query)
+        ranked = sorted(range(len(self.examples)),
+                        key=lambda i: (-similarity(features, self.examples[i].features), i))
+        return tuple(sorted(ranked[:count]))
+
+    def _parts_for(self, selection):
+        parts = self._selection_parts.get(selection)
+        if parts is None:
+            examples = []
+            for number, index in enumerate(selection, 1):
+                example = self.examples[index]
+                examples.append(example.text.replace(f'@Example{example.number}{{', f'@Example{number}{{', 1))
+            text = self._examples_head + ''.join(examples) + self._examples_tail
+            word = NUMBER_WORDS[len(selection)] if len(selection) < len(NUMBER_WORDS) else str(len(selection))
+            text = EXAMPLE_COUNT_PATTERN.sub(lambda m: m.group(1) + word + (' example' if len(selection) == 1 else ' examples'), text, 1)
+            parts = self._selection_parts[selection] = PLACEHOLDER_PATTERN.split(text)
+        return parts
+
+    def render(self, example_count=None, **values):
+        """
+        单遍替换占位符，替换进去的代码中即使含有 {input_xxx} 也不会被再次替换
+        :param example_count: 只保留和输入（各占位符的内容）最相似的几个示例，None或不少于示例总数时保留全部
+        :param values: 占位符名称到内容的映射
+        """
+        if example_count is not None and 0 < example_count < len(self.examples):
+            selection = self.select_examples('\n'.join(values.values()), example_count)
+            parts = self._parts_for(selection)[:]
+        else:
+            parts = self._parts[:]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            parts[i] = values[name] if name in values else '{' + name + '}'
+        return ''.join(parts)
+
+
+class PromptRegistry:
+    """
+    进程级的提示词模板注册表
+    启动时一次性读取并校验 prompt/<Language>/*_prompt.txt，之后按间隔检查文件变化并热加载
+    """
+
+    def __init__(self, prompt_dir, reload_interval=2.0):
+        self.prompt_dir = prompt_dir
+        self.reload_interval = reload_interval
+        self._templates = {}
+        self._loaded = False
+        self._last_check = 0.0
+        self._reloads = 0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """返回 {(语言, 阶段): (路径, mtime)}"""
+        files = {}
+        for path in glob.glob(os.path.join(self.prompt_dir, '*', '*_prompt.txt')):
+            language = os.path.basename(os.path.dirname(path))
+            name = os.path.basename(path)[:-len('_prompt.txt')]
+            files[(language, name)] = (path, os.stat(path).st_mtime_ns)
+        return files
+
+    def load(self):
+        """读取并校验全部模板，任一模板不合法时抛出PromptError"""
+        templates = {}
+        for key, (path, mtime_ns) in self._scan().items():
+            with open(path, 'r', encoding='utf-8') as f:
+                templates[key] = PromptTemplate(key[0], key[1], path, f.read(), mtime_ns)
+        with self._lock:
+            self._templates = templates
+            self._loaded = True
+            self._last_check = time.monotonic()
+        return self
+
+    def _maybe_reload(self):
+        """热加载：只重新读取新增或修改过的模板，修改后不合法的模板保留旧版本"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._last_check < self.reload_interval:
+                return
+            self._last_check = now
+            templates = dict(self._templates)
+            files = self._scan()
+            changed = False
+            for key in set(templates) - set(files):
+                del templates[key]
+                changed = True
+            for key, (path, mtime_ns) in files.items():
+                current = templates.get(key)
+                if current is not None and current.mtime_ns == mtime_ns:
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        templates[key] = PromptTemplate(key[0], key[1], path, f.read(), mtime_ns)
+                    changed = True
+                except (OSError, PromptError) as e:
+                    logging.getLogger("cfg.prompts").warning("提示词热加载失败，继续使用旧版本: %s", e)
+            if changed:
+                self._templates = templates
+                self._reloads += 1
+
+    def get(self, language, name):
+        if not self._loaded:
+            self.load()
+        else:
+            self._maybe_reload()
+        template = self._templates.get((language, name))
+        if template is None:
+            raise PromptError(f"未找到提示词模板: {language}/{name}_prompt.txt")
+        return template
+
+    def version(self, language):
+        """某种语言全部模板的组合版本，任一模板变化都会改变"""
+        if not self._loaded:
+            self.load()
+        else:
+            self._maybe_reload()
+        versions = sorted(f"{t.name}:{t.version}" for (lang, _), t in self._templates.items() if lang == language)
+        return hashlib.sha256('|'.join(versions).encode('utf-8')).hexdigest()[:16] if versions else ""
+
+    def stats(self):
+        languages = {}
+        for (language, name), template in sorted(self._templates.items()):
+            languages.setdefault(language, {})[name] = template.version
+        return {"languages": languages, "reloads": self._reloads}
+
+
+# 全局提示词注册表（项目根目录下的prompt目录）
+prompt_registry = PromptRegistry(os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../prompt')))
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import threading
+import time
+
+# 各服务商的默认限额（可在config.yaml的Rate Limit中覆盖）
+DEFAULT_LIMITS = {
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+    "deepseek": {"requests_per_minute": 300, "tokens_per_minute": 300000},
+}
+# 默认的重试、熔断参数
+DEFAULT_POLICY = {
+    "max_retries": 5,  # 单次调用最多重试次数
+    "base_delay": 1.0,  # 指数退避的初始等待（秒）
+    "max_delay": 30.0,  # 单次等待上限（秒）
+    "deadline": 300.0,  # 单次调用（含重试和排队）的总时限（秒）
+    "failure_threshold": 5,  # 连续失败多少次后熔断
+    "recovery_timeout": 30.0,  # 熔断后多久放行一次试探请求（秒）
+}
+
+
+class LLMError(RuntimeError):
+    """大模型调用失败（重试耗尽、超过时限或不可重试的错误）"""
+
+
+class CircuitOpenError(LLMError):
+    """服务商处于熔断状态，直接失败"""
+
+
+class TokenBucket:
+    """
+    令牌桶限流（按分钟速率），预约式实现：先扣减再等待，不需要锁
+    收到429时速率减半，之后每次成功逐步恢复到配置值（AIMD）
+    """
+
+    def __init__(self, per_minute, min_ratio=0.1):
+        self.limit = float(per_minute) / 60.0
+        self.rate = self.limit
+        self.capacity = float(per_minute)
+        self.min_rate = self.limit * min_ratio
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, max_wait=None):
+        """
+        预约amount个令牌，返回需要等待的秒数；等待时间超过max_wait时不预约，返回None
+        """
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, (amount - self.tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return None
+        self.tokens -= amount
+        return wait
+
+    def adjust(self, amount):
+        """按实际用量修正之前的预约（amount为正表示多用了）"""
+        self.tokens -= amount
+
+    def penalize(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        if self.rate < self.limit:
+            self.rate = min(self.limit, self.rate + self.limit * 0.05)
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，期间直接失败；recovery_timeout后放行一个试探请求，成功则关闭
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+
+    def allow(self):
+        """返回是否允许发出请求"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.recovery_timeout:
+            # 每个recovery_timeout只放行一个试探请求（试探请求被取消时下个周期再放行）
+            self.state = self.HALF_OPEN
+            self.opened_at = now
+            return True
+        return False
+
+    def retry_after(self):
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class ProviderGuard:
+    """
+    单个服务商的调用保护：请求数/令牌数两个令牌桶 + 熔断器 + 重试策略，以及相应的统计
+    """
+
+    def __init__(self, provider, requests_per_minute, tokens_per_minute, **policy):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.policy = {**DEFAULT_POLICY, **policy}
+        self.breaker = CircuitBreaker(self.policy["failure_threshold"], self.policy["recovery_timeout"])
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "rate_limited": 0, "rejected": 0, "throttle_wait_seconds": 0.0,
+        }
+
+    async def acquire(self, estimated_tokens, deadline):
+        """等待两个令牌桶都有余量；在deadline之前等不到时抛出LLMError"""
+        remaining = deadline - time.monotonic()
+        wait_requests = self.requests.reserve(1, remaining)
+        if wait_requests is None:
+            raise LLMError(f"{self.provider} 请求数限流，无法在时限内发出请求")
+        wait_tokens = self.tokens.reserve(estimated_tokens, remaining)
+        if wait_tokens is None:
+            self.requests.adjust(-1)
+            raise LLMError(f"{self.provider} 令牌数限流，无法在时限内发出请求")
+        wait = max(wait_requests, wait_tokens)
+        if wait > 0:
+            self.counters["throttle_wait_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    def backoff(self, attempt, retry_after=None):
+        """第attempt次重试前的等待：指数退避加全抖动，服务端给出Retry-After时以它为下限"""
+        delay = random.uniform(0, min(self.policy["max_delay"], self.policy["base_delay"] * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.policy["max_delay"]))
+        return delay
+
+    def stats(self):
+        return {
+            **self.counters,
+            "throttle_wait_seconds": round(self.counters["throttle_wait_seconds"], 3),
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "request_rate_per_minute": round(self.requests.rate * 60, 1),
+            "token_rate_per_minute": round(self.tokens.rate * 60, 1),
+        }
+
+
+class GuardRegistry:
+    """进程级的服务商保护注册表，限额取自config.yaml的Rate Limit（缺省使用DEFAULT_LIMITS）"""
+
+    def __init__(self):
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider, config=None):
+        guard = self._guards.get(provider)
+        if guard is None:
+            with self._lock:
+                guard = self._guards.get(provider)
+                if guard is None:
+                    settings = {**DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS["openai"]), **(config or {})}
+                    guard = self._guards[provider] = ProviderGuard(provider, **settings)
+        return guard
+
+    def stats(self):
+        return {provider: guard.stats() for provider, guard in sorted(self._guards.items())}
+
+
+# 全局服务商保护注册表
+provider_guards = GuardRegistry()
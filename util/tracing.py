@@ -0,0 +1,328 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import httpx
+
+# 当前协程（任务）所在的span；asyncio创建任务时复制上下文，子任务中的span自动成为子span
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一段带起止时间和属性的操作；trace_id和request_id从父span继承，同一次请求的span和日志据此关联
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "request_id", "attributes", "events",
+                 "status", "status_message", "start_ns", "end_ns")
+
+    def __init__(self, name, parent=None, request_id=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.request_id = request_id or (parent.request_id if parent is not None else self.trace_id[:16])
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = "ok"
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def record_exception(self, error):
+        self.status = "error"
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.add_event("exception", type=type(error).__name__, message=str(error))
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "status_message": self.status_message,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class _BackgroundExporter:
+    """
+    在后台线程中批量导出span，请求协程只把span放入队列，不做任何IO；队列满时丢弃
+    子类实现 _send(一批span)
+    """
+    thread_name = "span-exporter"
+
+    def __init__(self, batch_size=256, max_queue=10000, timeout=5.0):
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._queue = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                if span is None:
+                    self._send(batch)
+                    return
+                batch.append(span)
+            self._send(batch)
+
+    def _send(self, batch):
+        raise NotImplementedError
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=self.timeout)
+
+
+class JSONLinesExporter(_BackgroundExporter):
+    """每个span一行JSON追加到本地文件，在后台线程中批量写入"""
+    thread_name = "jsonl-exporter"
+
+    def __init__(self, path, batch_size=256, max_queue=10000):
+        self.path = path
+        super().__init__(batch_size, max_queue)
+
+    def _send(self, batch):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n' for span in batch))
+        except OSError as e:
+            logging.getLogger("cfg.tracing").warning("写入trace失败，丢弃%d个span: %s", len(batch), e)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OTLPExporter(_BackgroundExporter):
+    """
+    以OTLP/HTTP JSON格式（POST {endpoint}/v1/traces）发送到兼容的采集器（OpenTelemetry Collector、Jaeger、Tempo等）
+    发送在后台线程中进行，不阻塞请求；采集器不可用或队列满时丢弃并记录警告
+    """
+
+    thread_name = "otlp-exporter"
+
+    def __init__(self, endpoint, service_name, batch_size=256, max_queue=10000, timeout=5.0):
+        self.url = endpoint.rstrip('/') + '/v1/traces'
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=timeout)
+        super().__init__(batch_size, max_queue, timeout)
+
+    def _encode(self, spans):
+        items = []
+        for span in spans:
+            item = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": _otlp_attributes({**span.attributes, "request.id": span.request_id}),
+                "events": [{"timeUnixNano": str(e["time_ns"]), "name": e["name"],
+                            "attributes": _otlp_attributes(e["attributes"])} for e in span.events],
+                "status": {"code": 2, "message": span.status_message or ""} if span.status == "error" else {"code": 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            items.append(item)
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": self.service_name}, "spans": items}],
+        }]}
+
+    def _send(self, batch):
+        try:
+            self._client.post(self.url, json=self._encode(batch)).raise_for_status()
+        except httpx.HTTPError as e:
+            logging.getLogger("cfg.tracing").warning("发送trace失败，丢弃%d个span: %s", len(batch), e)
+
+    def shutdown(self):
+        super().shutdown()
+        self._client.close()
+
+
+class Tracer:
+    """
+    进程级的tracer：with tracer.span("名称", 属性=值) 记录一段操作，结束时交给已配置的导出器
+    没有配置导出器时只维护上下文（日志仍然带有request_id、trace_id），开销很小
+    """
+
+    def __init__(self):
+        self.exporters = []
+
+    def configure(self, exporter=None, jsonl_path=None, otlp_endpoint=None, service_name="cfg-assistant"):
+        """
+        :param exporter: None / "jsonl" / "otlp"，多个用逗号分隔
+        """
+        self.shutdown()
+        kinds = [kind.strip() for kind in (exporter or '').split(',') if kind.strip()]
+        for kind in kinds:
+            if kind == "jsonl":
+                self.exporters.append(JSONLinesExporter(jsonl_path))
+            elif kind == "otlp":
+                self.exporters.append(OTLPExporter(otlp_endpoint, service_name))
+            else:
+                raise ValueError(f"不支持的trace导出方式: {kind}")
+
+    @contextmanager
+    def span(self, name, request_id=None, **attributes):
+        """
+        :param request_id: 只对根span有效，默认取trace_id的前16位
+        """
+        parent = _current_span.get()
+        span = Span(name, parent, request_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if isinstance(e, (GeneratorExit, KeyboardInterrupt)):
+                raise
+            if isinstance(e, asyncio.CancelledError):
+                span.status = "cancelled"
+            else:
+                span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            for exporter in self.exporters:
+                try:
+                    exporter.export(span)
+                except Exception as e:
+                    logging.getLogger("cfg.tracing").warning("导出span失败: %s", e)
+
+    @staticmethod
+    def current_span():
+        return _current_span.get()
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            exporter.shutdown()
+        self.exporters = []
+
+
+# 全局tracer
+tracer = Tracer()
+
+
+class _ContextFilter(logging.Filter):
+    """给日志记录加上当前span的request_id、trace_id、span_id"""
+
+    def filter(self, record):
+        span = _current_span.get()
+        record.request_id = span.request_id if span is not None else None
+        record.trace_id = span.trace_id if span is not None else None
+        record.span_id = span.span_id if span is not None else None
+        return True
+
+
+# logging.LogRecord自带的属性，其余属性视为通过extra传入的结构化字段
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "trace_id", "span_id"}
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志一行JSON：时间、级别、logger、消息、关联ID和extra字段"""
+
+    def format(self, record):
+        item = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("request_id", "trace_id", "span_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                item[key] = value
+        item.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            item["exception"] = self.formatException(record.exc_info)
+        return json.dumps(item, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        request_id = getattr(record, "request_id", None)
+        prefix = f"[{record.levelname}] {record.name}" + (f" request_id={request_id}" if request_id else "")
+        extra = ' '.join(f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED)
+        text = f"{prefix} {record.getMessage()}" + (f" {extra}" if extra else "")
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+def configure_logging(level="INFO", fmt="text"):
+    """
+    配置cfg.*的日志：输出到标准错误，json格式每行一条，text格式便于本地阅读
+    :param level: DEBUG / INFO / WARNING / ERROR
+    """
+    logger = logging.getLogger("cfg")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler.addFilter(_ContextFilter())
+    handler.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def get_logger(name):
+    """各模块的logger，名称统一在cfg下，由configure_logging统一配置"""
+    return logging.getLogger(f"cfg.{name}")